@@ -1,75 +1,34 @@
 #----------------------------------------------------------------------
 # Calculates daily accumulated precipitation from 6h data downloaded
 # from RDA.  Daily netCDF files are written to directory structure
+#
+# Uses the CFSR converter in CFSR_6htoDay with CFSR2 file names
 #----------------------------------------------------------------------
 
-import xarray as xr
-import datetime as dt
-import pandas as pd
-import glob
-import os
+from CFSR_6htoDay import cfsr_6htoDay
 
-import utilities.utilities as util
-
-varNameIn = 'A_PCP_L1_Accum_1'
-varNameOut = 'TOTPREC'
-
-def _toDatetime(dt64):
-    return pd.Timestamp(dt64.values).to_pydatetime()
-
-def makeFilePathOut(time, varNameOut, diro):
-    dateTime = _toDatetime(time)
-    filo = 'CFSR2.cdas1.pgrbh.{:s}.{:s}.nc4'.format( varNameOut,
-                                                    dateTime.strftime('%Y%m%d') )
-    filePath = os.path.join(diro, dateTime.strftime('%Y'), dateTime.strftime('%m'), filo)
-    return filePath
-
-def write_to_netCDF(ds, diro='.', verbose=False):
-
-    time = ds['time']
-    
-    filePath = makeFilePathOut(time, varNameOut, diro)
-    if not os.path.exists( os.path.dirname(filePath) ):
-        if verbose: print ( 'Making {:s}'.format(os.path.dirname(filePath)) )
-        os.makedirs( os.path.dirname(filePath) )
-
-    if verbose: print ( 'Writing data to {:s}'.format(filePath) )
-    ds.to_netcdf(filePath)
-    
-    return
-
-def process_one_file(f, diro='.', verbose=False):
-
-    ds = xr.open_dataset(f)
-    tp = util.sum6htoDay(ds[varNameIn])
-    tp.name = varNameOut
-    tp.attrs['units'] = 'mm'
-    tp.attrs['product_description'] = 'daily accumulation'
-    
-    for time in tp['time']:
-        write_to_netCDF(tp.sel(time=time), diro=diro, verbose=verbose)
-
-    return
-
-def cfsr2_6htoDay(diri='.', diro='.', verbose=False):
+def cfsr2_6htoDay(diri='.', diro='.', verbose=False, workers=1, overwrite=False):
     """
     Main routine
     """
-
-    fileList = glob.glob( os.path.join(diri,'cdas1.*.pgrbh.grb2.nc') )
-    #fileList = glob.glob( os.path.join(diri,'pgbh06.gdas.*.grb2.nc') )
-    
-    for f in fileList:
-
-        if verbose: print ('Processing {:s}'.format(f))
-        process_one_file(f, diro=diro, verbose=verbose)
-    
+    cfsr_6htoDay(diri=diri, diro=diro, verbose=verbose, product='CFSR2',
+                 fileGlob='cdas1.*.pgrbh.grb2.nc', workers=workers, overwrite=overwrite)
     return
 
 if __name__ == "__main__":
-    diri = '/disks/arctic5_raid/abarrett/CFSR2/archive/TOTPREC'
-    diro = '/disks/arctic5_raid/abarrett/CFSR2/TOTPREC'
-    cfsr2_6htoDay(diri=diri, diro=diro, verbose=True)
 
-    
-        
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Calculates daily precipitation from CFSR2 6h accumulations')
+    parser.add_argument('--diri', type=str, default='/disks/arctic5_raid/abarrett/CFSR2/archive/TOTPREC',
+                        help='Directory containing 6h files')
+    parser.add_argument('--diro', type=str, default='/disks/arctic5_raid/abarrett/CFSR2/TOTPREC',
+                        help='Directory to write daily files')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='Number of processes used to convert files in parallel')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='Convert days that already have output files')
+    args = parser.parse_args()
+
+    cfsr2_6htoDay(diri=args.diri, diro=args.diro, verbose=True, workers=args.workers,
+                  overwrite=args.overwrite)
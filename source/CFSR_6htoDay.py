@@ -1,10 +1,15 @@
 #----------------------------------------------------------------------
 # Calculates daily accumulated precipitation from 6h data downloaded
 # from RDA.  Daily netCDF files are written to directory structure
+#
+# Days are summed for a whole input file at once, and output days are
+# written in batches.  Days that have already been converted are
+# skipped, and input files can be processed in parallel.
 #----------------------------------------------------------------------
 
 import xarray as xr
 import datetime as dt
+import numpy as np
 import pandas as pd
 import glob
 import os
@@ -14,61 +19,127 @@ import utilities.utilities as util
 varNameIn = 'A_PCP_L1_Accum_1'
 varNameOut = 'TOTPREC'
 
+# Output file name formats for CFSR and CFSR2
+FILENAME_FORMAT = {'CFSR': 'CFSR.pgbh01.gdas.{:s}.{:s}.nc4',
+                   'CFSR2': 'CFSR2.cdas1.pgrbh.{:s}.{:s}.nc4'}
+
+# Number of days written in one call to save_mfdataset
+BATCH_SIZE = 31
+
 def _toDatetime(dt64):
-    return pd.Timestamp(dt64.values).to_pydatetime()
+    return pd.Timestamp(getattr(dt64, 'values', dt64)).to_pydatetime()
 
-def makeFilePathOut(time, varNameOut, diro):
+def makeFilePathOut(time, varNameOut, diro, product='CFSR'):
     dateTime = _toDatetime(time)
-    filo = 'CFSR.pgbh01.gdas.{:s}.{:s}.nc4'.format( varNameOut,
-                                                    dateTime.strftime('%Y%m%d') )
+    filo = FILENAME_FORMAT[product].format( varNameOut,
+                                            dateTime.strftime('%Y%m%d') )
     filePath = os.path.join(diro, dateTime.strftime('%Y'), dateTime.strftime('%m'), filo)
     return filePath
 
-def write_to_netCDF(ds, diro='.', verbose=False):
+def write_to_netCDF(ds, diro='.', verbose=False, product='CFSR'):
 
     time = ds['time']
-    
-    filePath = makeFilePathOut(time, varNameOut, diro)
+
+    filePath = makeFilePathOut(time, varNameOut, diro, product=product)
     if not os.path.exists( os.path.dirname(filePath) ):
         if verbose: print ( 'Making {:s}'.format(os.path.dirname(filePath)) )
         os.makedirs( os.path.dirname(filePath) )
 
     if verbose: print ( 'Writing data to {:s}'.format(filePath) )
     ds.to_netcdf(filePath)
-    
+
     return
 
-def process_one_file(f, diro='.', verbose=False):
+def write_batch(days, filePaths, verbose=False):
+    """
+    Writes a batch of daily DataArrays to their files in one call to save_mfdataset.
+    Files are written to temporary paths and renamed, so a partly written day is
+    never mistaken for a converted day.
+    """
+    for filePath in filePaths:
+        os.makedirs( os.path.dirname(filePath), exist_ok=True )
+    tmpPaths = ['{}.{:d}.tmp'.format(filePath, os.getpid()) for filePath in filePaths]
+
+    if verbose: print ( 'Writing {:d} days to {:s} ...'.format(len(filePaths), filePaths[0]) )
+    xr.save_mfdataset([day.to_dataset() for day in days], tmpPaths)
+    for tmpPath, filePath in zip(tmpPaths, filePaths):
+        os.replace(tmpPath, filePath)
+    return
+
+def process_one_file(f, diro='.', verbose=False, product='CFSR', overwrite=False):
+    """
+    Converts one file of 6h accumulations to daily files
 
-    ds = xr.open_dataset(f)
-    tp = util.sum6htoDay(ds[varNameIn])
+    overwrite - if False, days with an existing output file are skipped
+
+    Returns number of days written
+    """
+    with xr.open_dataset(f) as ds:
+        # Check for days that have not been converted before reading data
+        step = np.timedelta64(6, 'h')
+        days = np.unique((ds['time'].values - step).astype('datetime64[D]')) + step
+        if not overwrite and all(os.path.exists(makeFilePathOut(d, varNameOut, diro, product=product))
+                                 for d in days):
+            return 0
+        tp = util.sum6htoDay(ds[varNameIn])
     tp.name = varNameOut
     tp.attrs['units'] = 'mm'
     tp.attrs['product_description'] = 'daily accumulation'
-    
-    for time in tp['time']:
-        write_to_netCDF(tp.sel(time=time), diro=diro, verbose=verbose)
 
-    return
+    filePaths = [makeFilePathOut(time, varNameOut, diro, product=product) for time in tp['time']]
+    todo = [i for i, filePath in enumerate(filePaths) if overwrite or not os.path.exists(filePath)]
+
+    for start in range(0, len(todo), BATCH_SIZE):
+        batch = todo[start:start+BATCH_SIZE]
+        write_batch([tp.isel(time=i) for i in batch], [filePaths[i] for i in batch], verbose=verbose)
+
+    return len(todo)
 
-def cfsr_6htoDay(diri='.', diro='.', verbose=False):
+def cfsr_6htoDay(diri='.', diro='.', verbose=False, product='CFSR', fileGlob='pgbh06.gdas.*.grb2.nc',
+                 workers=1, overwrite=False):
     """
     Main routine
-    """
-
-    fileList = glob.glob( os.path.join(diri,'pgbh06.gdas.*.grb2.nc') )
 
-    for f in fileList:
+    product - CFSR or CFSR2, sets output file name
+    fileGlob - glob for 6h input files in diri
+    workers - number of processes used to convert files in parallel
+    overwrite - if False, days that have already been converted are skipped
+    """
 
-        if verbose: print ('Processing {:s}'.format(f))
-        process_one_file(f, diro=diro, verbose=verbose)
+    fileList = sorted( glob.glob( os.path.join(diri, fileGlob) ) )
+
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {f: executor.submit(process_one_file, f, diro=diro, verbose=verbose,
+                                          product=product, overwrite=overwrite) for f in fileList}
+            for f, future in futures.items():
+                ndays = future.result()
+                if verbose: print ('Processed {:s}: {:d} days written'.format(f, ndays))
+    else:
+        for f in fileList:
+            if verbose: print ('Processing {:s}'.format(f))
+            process_one_file(f, diro=diro, verbose=verbose, product=product, overwrite=overwrite)
 
     return
 
 if __name__ == "__main__":
-    diri = '/disks/arctic5_raid/abarrett/CFSR/archive/TOTPREC'
-    diro = '/disks/arctic5_raid/abarrett/CFSR/TOTPREC'
-    cfsr_6htoDay(diri=diri, diro=diro, verbose=True)
 
-    
-        
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Calculates daily precipitation from CFSR 6h accumulations')
+    parser.add_argument('--diri', type=str, default='/disks/arctic5_raid/abarrett/CFSR/archive/TOTPREC',
+                        help='Directory containing 6h files')
+    parser.add_argument('--diro', type=str, default='/disks/arctic5_raid/abarrett/CFSR/TOTPREC',
+                        help='Directory to write daily files')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='Number of processes used to convert files in parallel')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='Convert days that already have output files')
+    args = parser.parse_args()
+
+    cfsr_6htoDay(diri=args.diri, diro=args.diro, verbose=True, workers=args.workers,
+                 overwrite=args.overwrite)
+
+
+
@@ -0,0 +1,347 @@
+#----------------------------------------------------------------------
+# Benchmarks for the precipitation statistics pipeline.
+#
+# Synthetic Nh50km (360x360) daily precipitation, monthly PRECIP_STATS
+# files and NPSNOW-format text files are generated in a temporary
+# directory, so no reanalysis or station data are needed.  Each stage
+# is timed at 1-month, 1-year and (optionally) 40-year scales, and
+# throughput and peak memory are reported.  Results can be saved as a
+# baseline and later runs compared against it, e.g. before and after
+# upgrading xarray or pandas.
+#
+# Usage:
+#    python benchmark_precip_pipeline.py --save benchmark_baseline.json
+#    python benchmark_precip_pipeline.py --baseline benchmark_baseline.json
+#----------------------------------------------------------------------
+import matplotlib
+matplotlib.use('agg')
+
+import numpy as np
+import xarray as xr
+import pandas as pd
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import precipitation.utilities as util
+import precipitation.process_precip_stats as pps
+from precipitation.constants import filepath as REANALYSIS_PATH
+from readers.reanalysis import read_netcdfs
+from readers.npsnow import read_precip, read_position
+from trajectory import Trajectory
+from get_daily_trajectory_reanalysis import extract_trajectory_precip
+
+NX, NY = 360, 360
+REANALYSIS = 'MERRA2'
+GRID = 'Nh50km'
+FIRST_DATE = '1979-08-01'  # First accumulation period is Aug 1979 to Apr 1980
+
+# Number of months in each scale
+SCALES = {'month': 1, 'year': 12, '40year': 480}
+
+# Ratio of time to baseline time flagged as a regression
+TOLERANCE = 1.25
+
+
+def synthetic_month(date, seed=0):
+    """Returns a DataArray of synthetic daily precipitation for a month on the Nh50km grid.
+    Cells in one corner are NaN to mimic off-grid cells."""
+    rng = np.random.default_rng(seed)
+    time_coord = pd.date_range(date, periods=util.daysinmonth(np.datetime64(date, 'ns')), freq='D')
+    x = rng.gamma(0.3, 3., size=(time_coord.size, NX, NY)).astype('float32')
+    x[:, :20, :20] = np.nan
+    da = xr.DataArray(x, dims=['time', 'x', 'y'], coords={'time': time_coord},
+                      attrs={'units': 'mm'})
+    return da
+
+
+def synthetic_latlon():
+    """Returns latitude and longitude fields for the Nh50km grid"""
+    r = np.hypot(*np.meshgrid(np.arange(NX) - 179.5, np.arange(NY) - 179.5, indexing='ij'))
+    latitude = 90. - r * 0.45
+    longitude = np.degrees(np.arctan2(*np.meshgrid(np.arange(NY) - 179.5, np.arange(NX) - 179.5)))
+    latitude[:20, :20] = -999.
+    return latitude, longitude
+
+
+def write_precip_stats_files(dirpath, nmonth):
+    """Writes nmonth synthetic PRECIP_STATS files starting at FIRST_DATE.  Files are
+    written to the paths used by process_precip_stats.filePath, so the path for
+    REANALYSIS must point into dirpath, see synthetic_path.
+
+    Returns list of file paths
+    """
+    latitude, longitude = synthetic_latlon()
+    rng = np.random.default_rng(1)
+    fileList = []
+    for date in pd.date_range(FIRST_DATE, periods=nmonth, freq='MS'):
+        fields = {name: (('x', 'y'), rng.random((NX, NY)).astype('float32'))
+                  for name in ['wetday_mean', 'wetday_frequency', 'wetday_total', 'wetday_max', 'prectot']}
+        ds = xr.Dataset(fields, coords={'latitude': (('x', 'y'), latitude),
+                                        'longitude': (('x', 'y'), longitude)})
+        path = pps.filePath(REANALYSIS, date, grid=GRID)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        ds.to_netcdf(path, encoding={name: {'zlib': True} for name in fields})
+        fileList.append(path)
+    return fileList
+
+
+def synthetic_path(dirpath):
+    """Returns path format for synthetic PRECIP_STATS files in dirpath"""
+    return os.path.join(dirpath, REANALYSIS, 'daily', '{}', '{:4d}', '{:02d}')
+
+
+def write_npsnow_files(dirpath, nday):
+    """Writes NPSNOW-format precipitation and position files for nday days
+
+    Returns: path to precipitation file, path to position file
+    """
+    rng = np.random.default_rng(2)
+    dates = pd.date_range('1955-05-01', periods=nday, freq='D')
+
+    precip_file = os.path.join(dirpath, 'np_05_55.pre')
+    amount = np.where(rng.random(nday) < 0.5, -9.9, np.round(rng.gamma(0.5, 2., nday), 1))
+    ptype = np.where(amount < 0., -9, rng.integers(0, 4, nday))
+    with open(precip_file, 'w') as f:
+        for d, a, t in zip(dates, amount, ptype):
+            f.write(f' 5 {d.month:2d} {d.day:2d} {d.year:4d} {a:5.1f} {t:2d}\n')
+
+    position_file = os.path.join(dirpath, 'position.05')
+    lat = 80. + np.cumsum(rng.normal(0., 0.05, nday)).clip(-9., 9.)
+    lon = (np.cumsum(rng.normal(0., 0.3, nday)) % 179.)
+    with open(position_file, 'w') as f:
+        for d, la, lo in zip(dates, lat, lon):
+            # Coordinates are stored as degrees*1000 + minutes*10
+            f.write('{:2d} {:2d} {:2d} 12 {:5d} {:6d}\n'.format(d.year % 100, d.month, d.day,
+                                                                 int(la) * 1000 + int((la % 1) * 600),
+                                                                 int(lo) * 1000 + int((lo % 1) * 600)))
+    return precip_file, position_file
+
+
+def measure(func, *args, **kwargs):
+    """
+    Runs func twice and returns wall time in seconds and peak traced memory in MB.
+    Time is measured in the first run and memory in the second, so tracing does not
+    slow the timed run.
+    """
+    t0 = time.perf_counter()
+    func(*args, **kwargs)
+    seconds = time.perf_counter() - t0
+
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return seconds, peak / 2**20
+
+
+def bench_wetday_stats(nmonth):
+    """Separate wetday_mean, wetdays, wetday_total, wetday_max and all_total calls"""
+    seconds, peak, ndays = 0., 0., 0
+    for i, date in enumerate(pd.date_range(FIRST_DATE, periods=nmonth, freq='MS')):
+        da = synthetic_month(date, seed=i)
+        def run():
+            util.wetday_mean(da)
+            util.wetdays(da)
+            util.wetday_total(da)
+            util.wetday_max(da)
+            util.all_total(da)
+        s, p = measure(run)
+        seconds, peak, ndays = seconds + s, max(peak, p), ndays + da.time.size
+    return seconds, peak, ndays, 'days'
+
+
+def bench_precip_stats(nmonth):
+    """Fused precip_stats"""
+    seconds, peak, ndays = 0., 0., 0
+    for i, date in enumerate(pd.date_range(FIRST_DATE, periods=nmonth, freq='MS')):
+        da = synthetic_month(date, seed=i)
+        s, p = measure(util.precip_stats, da)
+        seconds, peak, ndays = seconds + s, max(peak, p), ndays + da.time.size
+    return seconds, peak, ndays, 'days'
+
+
+def bench_read_netcdfs(fileList):
+    """Reads monthly PRECIP_STATS files"""
+    seconds, peak = measure(read_netcdfs, fileList, 'time')
+    return seconds, peak, len(fileList), 'files'
+
+
+def bench_process_one_period(nperiod):
+    """Accumulation period statistics"""
+    years = 1980 + np.arange(nperiod)
+    seconds, peak = measure(lambda: [pps.process_one_period(REANALYSIS, y, grid=GRID) for y in years])
+    return seconds, peak, nperiod, 'periods'
+
+
+def bench_interpolate_by_date(position_file):
+    """Daily interpolation of a drifting station trajectory with intermittent waypoints"""
+    pos = read_position(position_file, cache=False)
+    pos = pos.iloc[::3]  # Waypoints every three days
+    traj = Trajectory.from_arrays(pos.index, pos['lat'].values, pos['lon'].values)
+    days = pd.date_range(pos.index[0], pos.index[-1], freq='D')
+    seconds, peak = measure(traj.interpolate_by_date, days)
+    return seconds, peak, days.size, 'days'
+
+
+def bench_extract_trajectory_precip(nmonth):
+    """Extracts daily precipitation along a trajectory, a year of daily grids at a time"""
+    seconds, peak, npoint = 0., 0., 0
+    rng = np.random.default_rng(3)
+    for i, start in enumerate(pd.date_range(FIRST_DATE, periods=max(nmonth // 12, 1), freq='12MS')):
+        cube = xr.concat([synthetic_month(date, seed=i) for date in
+                          pd.date_range(start, periods=min(nmonth, 12), freq='MS')], 'time')
+        cube.name = 'TOTPREC'
+        cube.coords['x'] = np.arange(NX)
+        cube.coords['y'] = np.arange(NY)
+        trajectory = pd.DataFrame({'Latitude': 80. + rng.random(cube.time.size),
+                                   'Longitude': rng.random(cube.time.size) * 360.},
+                                  index=cube.time.to_index() + pd.Timedelta('12h'))
+        s, p = measure(extract_trajectory_precip, cube, trajectory)
+        seconds, peak, npoint = seconds + s, max(peak, p), npoint + len(trajectory)
+    return seconds, peak, npoint, 'points'
+
+
+def bench_read_npsnow(precip_file, position_file):
+    """Parses NPSNOW precipitation and position text files"""
+    def run():
+        read_precip(precip_file, cache=False)
+        read_position(position_file, cache=False)
+    seconds, peak = measure(run)
+    return seconds, peak, 2, 'files'
+
+
+def run_benchmarks(scales, verbose=False):
+    """
+    Runs all benchmarks for the given scales
+
+    Returns: dict {stage: {scale: {'seconds', 'peak_mb', 'units', 'unit', 'throughput'}}}
+             or {stage: {scale: {'error'}}} if a stage fails
+    """
+    results = {}
+    for scale in scales:
+        nmonth = SCALES[scale]
+        nperiod = max(nmonth // 12, 1)
+        nday = int(nmonth * 365.25 / 12)
+
+        tmpdir = tempfile.mkdtemp(prefix='bench_precip_')
+        # process_precip_stats reads file paths from the shared constants, so the
+        # path is pointed at the synthetic files for this scale and restored after
+        original_path = REANALYSIS_PATH[REANALYSIS]['path']
+        REANALYSIS_PATH[REANALYSIS]['path'] = synthetic_path(tmpdir)
+        try:
+            if verbose: print (f'% Generating synthetic data for {scale} scale in {tmpdir}')
+            fileList = write_precip_stats_files(tmpdir, max(nmonth, 12 * nperiod - 3))
+            precip_file, position_file = write_npsnow_files(tmpdir, nday)
+
+            stages = {
+                'wetday_stats': lambda: bench_wetday_stats(nmonth),
+                'precip_stats': lambda: bench_precip_stats(nmonth),
+                'read_netcdfs': lambda: bench_read_netcdfs(fileList[:nmonth]),
+                'process_one_period': lambda: bench_process_one_period(nperiod),
+                'interpolate_by_date': lambda: bench_interpolate_by_date(position_file),
+                'extract_trajectory_precip': lambda: bench_extract_trajectory_precip(nmonth),
+                'read_npsnow': lambda: bench_read_npsnow(precip_file, position_file),
+            }
+            for stage, bench in stages.items():
+                if verbose: print (f'   Running {stage} for {scale}')
+                try:
+                    seconds, peak, units, unit = bench()
+                except Exception as err:
+                    # A stage that fails, e.g. after a library upgrade, is reported
+                    # rather than stopping the benchmark
+                    results.setdefault(stage, {})[scale] = {'error': '{}: {}'.format(type(err).__name__, err)}
+                    continue
+                results.setdefault(stage, {})[scale] = {'seconds': seconds,
+                                                        'peak_mb': peak,
+                                                        'units': units,
+                                                        'unit': unit,
+                                                        'throughput': units / seconds}
+        finally:
+            REANALYSIS_PATH[REANALYSIS]['path'] = original_path
+            shutil.rmtree(tmpdir)
+
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Prints results and the ratio of time to baseline time
+
+    Returns: list of (stage, scale) where time exceeds tolerance times baseline time,
+             or the stage failed
+    """
+    regressions = []
+    print ('{:26s} {:7s} {:>10s} {:>16s} {:>10s} {:>8s}'.format('stage', 'scale', 'seconds',
+                                                                'throughput', 'peak MB', 'ratio'))
+    for stage, by_scale in results.items():
+        for scale, r in by_scale.items():
+            if 'error' in r:
+                regressions.append((stage, scale))
+                print ('{:26s} {:7s} FAILED {}'.format(stage, scale, r['error'][:200]))
+                continue
+            base = baseline.get('results', {}).get(stage, {}).get(scale)
+            ratio = r['seconds'] / base['seconds'] if base and 'seconds' in base else np.nan
+            flag = ''
+            if ratio > tolerance:
+                regressions.append((stage, scale))
+                flag = ' REGRESSION'
+            print ('{:26s} {:7s} {:10.3f} {:10.1f} {:5s} {:10.1f} {:8.2f}{}'.format(stage, scale, r['seconds'],
+                                                                               r['throughput'], r['unit']+'/s',
+                                                                               r['peak_mb'], ratio, flag))
+    return regressions
+
+
+def versions():
+    """Returns versions of the main dependencies"""
+    return {'numpy': np.__version__, 'xarray': xr.__version__, 'pandas': pd.__version__}
+
+
+def main(scales=None, baseline=None, save=None, tolerance=TOLERANCE, verbose=False):
+    """Runs benchmarks, compares with baseline and optionally saves results as a new baseline"""
+    if not scales: scales = ['month', 'year']
+
+    results = run_benchmarks(scales, verbose=verbose)
+
+    previous = {}
+    if baseline:
+        with open(baseline) as f:
+            previous = json.load(f)
+        if verbose: print (f'% Comparing with baseline {baseline} {previous.get("versions")}')
+    regressions = compare(results, previous, tolerance=tolerance)
+
+    if save:
+        with open(save, 'w') as f:
+            json.dump({'versions': versions(), 'results': results}, f, indent=1)
+        if verbose: print (f'% Results saved to {save}')
+
+    return regressions
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmarks the precipitation statistics pipeline with synthetic data')
+    parser.add_argument('--scales', '-s', type=str, nargs='+', default=None, choices=list(SCALES.keys()),
+                        help='Scales to run, default is month and year')
+    parser.add_argument('--baseline', '-b', type=str, default=None,
+                        help='JSON file of baseline results to compare against')
+    parser.add_argument('--save', type=str, default=None,
+                        help='Save results to JSON file for use as a baseline')
+    parser.add_argument('--tolerance', '-t', type=float, default=TOLERANCE,
+                        help='Ratio of time to baseline time flagged as a regression')
+    parser.add_argument('--verbose', '-v', action='store_true')
+
+    args = parser.parse_args()
+
+    regressions = main(scales=args.scales, baseline=args.baseline, save=args.save,
+                       tolerance=args.tolerance, verbose=args.verbose)
+    if regressions:
+        raise SystemExit(1)
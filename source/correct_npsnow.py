@@ -1,5 +1,6 @@
 import numpy as np
 import pandas as pd
+import os
 
 
 # Empirical parameter from B02 Table 1
@@ -55,7 +56,7 @@ def mu_coef(slp, tair, ea):
     tair - air temperature (deg. C)
     ea - partial pressure of water vapour hPa
     """
-    return 0.273*slp**2 / ( (273-tair)*(slp+0.4*ea) )
+    return 0.273*slp**2 / ( (273.15+tair)*(slp+0.4*ea) )
 
 
 def wind_speed(Uh, h_snow):
@@ -63,6 +64,10 @@ def wind_speed(Uh, h_snow):
     Calculates gauge orifice height wind speed using equation 4 from B02.  
     Following B02, assume m(A) = 1 in equation 4.
 
+    Uh - wind speed at anemometer height (m/s)
+    h_snow - snow depth (cm).  Snow deeper than the gauge is limited to h_gauge - z0,
+             so wind at a buried orifice is zero rather than NaN
+
     Assumes
     h_gauge = 2. m - height of orifice of Tretykov gauage from Colony et al 1998
     h_anono = 10. m - height of anonometer from Bogdanova et al 2002
@@ -71,6 +76,7 @@ def wind_speed(Uh, h_snow):
     h_gauge = 2.0
     h_anono = 10.
     z0 = 0.01
+    h_snow = np.minimum(h_snow*0.01, h_gauge - z0)  # cm to m
     
     return Uh * np.log( (h_gauge - h_snow)/z0 ) / np.log( (h_anono - h_snow)/z0 )
 
@@ -80,7 +86,7 @@ def aerodynamic_coefficient(df):
     ea = partial_pressure_wv(df['RH'], df['TAIR'])
     mu = mu_coef(df['SLP'], df['TAIR'], ea)
     Uh = wind_speed(df['WSPD'], df['SDEPTH'])
-    A0 = get_A0(df['PTYPE'])
+    A0 = get_A0(df['PTYPE'], df['TAIR'])
     return 1 + A0 * mu**2 * Uh**2
 
 
@@ -105,18 +111,26 @@ def adjust_standard_wetting_correction(df):
     Observers applied a wetting correction to measured precipitation
     See B02 and Colony for details"""
     df['Parch'] = df['PRECIP'] - standard_wetting_correction(df['PTYPE'])
-    df['Parch'] = df['Parch'].where(df['Parch'] >= 0., 0.)
+    df['Parch'] = df['Parch'].where((df['Parch'] >= 0.) | df['Parch'].isna(), 0.)
     return df
+
+
+# Relative humidity above which deltas are constant
+RH_SATURATED = 95.
+
+def _log_deficit(rh):
+    """Returns log(100 - rh), limited so that saturated values do not raise warnings"""
+    return np.log(np.maximum(100. - np.asarray(rh, dtype=float), 100. - RH_SATURATED))
+
     
 def liquid_delta(rh):
     """
     Wetting, evaporation, condensation and trace correction for
     liquid precipitation
+
+    rh - relative humidity, scalar or array
     """
-    if rh < 95.:
-        return 0.069*np.log(100-rh) + 0.009
-    else:
-        return 0.1
+    return np.where(np.asarray(rh) < RH_SATURATED, 0.069*_log_deficit(rh) + 0.009, 0.1)
 
 
 def solid_delta(rh):
@@ -124,12 +138,9 @@ def solid_delta(rh):
     Wetting, evaporation, condensation and trace correction for 
     solid precipitation
     
-    rh - relative humidity
+    rh - relative humidity, scalar or array
     """
-    if rh < 95.:
-        return 0.097*np.log(100 - rh) - 0.15
-    else:
-        return -0.2
+    return np.where(np.asarray(rh) < RH_SATURATED, 0.097*_log_deficit(rh) - 0.15, -0.2)
 
 
 def mixed_delta(rh):
@@ -137,33 +148,48 @@ def mixed_delta(rh):
     Wetting, evaporation, condensation and trace correction for 
     mixed precipitation
     
-    rh - relative humidity
+    rh - relative humidity, scalar or array
     """
-    if rh < 95.:
-        0.158 * np.log(100 - rh) - 0.449
-    else:
-        return -0.2
+    return np.where(np.asarray(rh) < RH_SATURATED, 0.158*_log_deficit(rh) - 0.449, -0.2)
 
 
-def bias_correction_func(ptype):
-    
-    function_dict = {1: snow_delta,
-                     2: mixed_delta,
-                     3: liquid_delta,}
-    return function_dict.get(ptype, dummy_dict)
+def bias_correction(rh, ptype):
+    """
+    Returns wetting, evaporation, condensation and trace correction (eq 6 - 8)
+    for series of relative humidity and precipitation type strings.  The correction
+    is zero if precipitation type is not snow, mixed or rain.
+    """
+    correction = np.select([ptype == 'snow', ptype == 'mixed', ptype == 'rain'],
+                           [solid_delta(rh), mixed_delta(rh), liquid_delta(rh)],
+                           default=0.)
+    return pd.Series(correction, index=ptype.index)
 
-def get_bias_correction_func(ptype):
-    return ptype.map(function_dict)
 
-def bias_correction(rh, ptype):
+# Wind speed (m/s) at gauge height above which precipitation measured with no
+# observed precipitation type is assumed to be blowing snow
+FALSE_PRECIP_WSPD = 6.
+
+def false_precipitation(df):
+    """
+    Returns True for false precipitation: blowing snow caught by the gauge when
+    no precipitation was observed.  Expects PTYPE strings and Parch.
+    """
+    Uh = wind_speed(df['WSPD'], df['SDEPTH'])
+    return (df['PTYPE'] == '') & (df['Parch'] > 0.) & (Uh >= FALSE_PRECIP_WSPD)
 
-    funcs = get_bias_correction_func(ptype)
-    
-    correction = [f(v) for f, v in zip(funcs.values, rh.values)]
-    result = pd.Series(correction, index=ptype.index)
-    return result
 
 def bogdanova(df):
+    """
+    Corrects NPSNOW precipitation following Bogdanova et al (2002).  All rows
+    are corrected in one vectorized pass, so df can hold data for one station or
+    many stations concatenated.
+
+    df - dataframe with columns PRECIP, PTYPE (codes), RH, TAIR, SLP, WSPD and SDEPTH
+
+    Returns
+    -------
+    df with PTYPE as strings and added columns Parch, K, DELTA, FALSE and PCORR
+    """
 
     # Convert numerical P-type to string
     df['PTYPE'] = get_ptype(df['PTYPE'])
@@ -173,17 +199,41 @@ def bogdanova(df):
     df = adjust_standard_wetting_correction(df)
     
     # Calculate value of aerodynamic coeficient (eq 2 - 5)
+    df['K'] = aerodynamic_coefficient(df)
 
     # Determine bias correction for wetting, evaporation, condensation, and
     # trace precipitation (eq 6 - 8)
+    df['DELTA'] = bias_correction(df['RH'], df['PTYPE'])
 
     # calculate false precipitation 
+    df['FALSE'] = false_precipitation(df)
+
+    # Corrected precipitation for days with precipitation
+    pcorr = np.where(df['Parch'] > 0., df['K'] * (df['Parch'] + df['DELTA']), 0.)
+    pcorr = np.where(df['FALSE'], 0., np.maximum(pcorr, 0.))
+    df['PCORR'] = pd.Series(pcorr, index=df.index).where(df['Parch'].notna())
     return df       
 
-def main():
-    filepath = '~/data/NPSNOW/my_combined_met/npmet_22_combined.csv'
-    df = pd.read_csv(filepath, index_col=0, header=0, parse_dates=True)
-    df_corr = bogdanova(df)
+
+def correct_stations(stations, filepath='~/data/NPSNOW/my_combined_met/npmet_{:02d}_combined.csv'):
+    """
+    Reads combined met files for a list of stations and corrects them in one call
+    to bogdanova
+
+    stations - list of station numbers
+    filepath - format string for combined met file paths
+
+    Returns dataframe with station column
+    """
+    from readers.npsnow import read_my_combined
+    df = pd.concat([read_my_combined(os.path.expanduser(filepath.format(station))).assign(station=station)
+                    for station in stations])
+    return bogdanova(df)
+
+
+def main(stations=None):
+    if stations is None: stations = [22]
+    df_corr = correct_stations(stations)
     print (df_corr)
     
     return -1
@@ -191,4 +241,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-    
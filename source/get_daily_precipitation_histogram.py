@@ -4,12 +4,14 @@ import glob
 import os
 import calendar
 import datetime as dt
+import functools
 
 import xarray as xr
 import numpy as np
 import pandas as pd
 
 import precipitation.utilities as utils
+from precipitation.histogram import bin_edges, monthly_histograms
 from precipitation.constants import reanalysis_dirpath, filepath, maskFile, vnamedict
 
 data_range = {
@@ -44,7 +46,7 @@ def load_mask(region):
 
 
 def main(reanalysis, date_begin='1979-01', date_end='2018-12', verbose=False, threshold=0.,
-         bin_max=100., bin_width=0.1, region='arctic_ocean'):
+         bin_max=100., bin_width=0.1, region='arctic_ocean', workers=1):
 
     if verbose: print (f'Extracting monthly histograms for {reanalysis} from {date_begin} to {date_end}')
     
@@ -64,20 +66,12 @@ def main(reanalysis, date_begin='1979-01', date_end='2018-12', verbose=False, th
         date_end = data_range[reanalysis][1]
     dates = pd.date_range(date_begin, date_end, freq='MS')
 
-    bins = np.arange(0., bin_max+bin_width, bin_width) 
-    hist = []
-    for d in dates:
-
-        if verbose: print (f'Getting statistics for {d.year:4d}-{d.month:02d}')
-        da = load_month(reanalysis, 'PRECIP', d.year, d.month)
-        
-        arr = da.where(mask).values.reshape(-1)
-        with np.errstate(all='ignore'):
-            h, b = np.histogram(arr[np.isfinite(arr) & np.greater(arr, threshold)], bins=bins)
-            hist.append(h)
-
+    bins = bin_edges(bin_max, bin_width)
+    if verbose: print (f'Getting statistics for {len(dates)} months')
+    hist = monthly_histograms(functools.partial(load_month, reanalysis, 'PRECIP'), dates, bins,
+                              threshold=threshold, group=xr.where(mask, 0, -1), workers=workers)
     
-    da = xr.DataArray(hist, coords=[dates, bins[:-1]], dims=['time', 'bin_edge'], name='pdf')
+    da = xr.DataArray(hist[:,0,:], coords=[dates, bins[:-1]], dims=['time', 'bin_edge'], name='pdf')
     
     fileout = f'{reanalysis.lower()}_{region}_precip_pdf.threshold_{threshold:5.3f}.nc4'
     if verbose: print (f'Writing statistics to {fileout}')
@@ -100,10 +94,12 @@ if __name__ == "__main__":
                         help='Threshold for precipitation (default=0.)')
     parser.add_argument('--region', type=str, default='central_arctic',
                         help='Region to calculate histogram for (default=central_arctic)')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='Number of processes used to read and bin months')
     parser.add_argument('--verbose', '-v', action='store_true')
     
     args = parser.parse_args()
     
     main(args.reanalysis, date_begin=args.date_begin, date_end=args.date_end,
-         threshold=args.threshold, region=args.region, verbose=args.verbose)
+         threshold=args.threshold, region=args.region, verbose=args.verbose, workers=args.workers)
     
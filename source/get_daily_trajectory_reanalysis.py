@@ -10,8 +10,7 @@ import pandas as pd
 import datetime as dt
 import os
 
-from test_ungrid import lat_lon_to_col_row
-from readers.reanalysis import read_daily_precip
+from readers.reanalysis import read_daily_precip, read_daily_cube, read_netcdfs, daily_filepath
 from readers.npsnow import read_position
 from get_trajectory_reanalysis_data import trajectory_to_indices
 
@@ -32,6 +31,8 @@ SCALE = {
     'JRA55': 1.
 }
 
+STATIONS = [22,24,25,26,27,28,29,30,31]
+
 REANALYSIS_FIRST_YEAR =  {
     'ERA5': '1979',
     'ERAI': '1979',
@@ -104,44 +105,100 @@ def extract_trajectory_precip(reanalysis_df, trajectory, verbose=False):
     return trajectory.join(points)
 
 
-def main(reanalysis, verbose=False):
+def read_days(reanalysis, days, grid='Nh50km'):
+    """Reads daily reanalysis precipitation for a list of days.  Each daily file is
+    opened once.
+
+    reanalysis - name of reanalysis
+    days - sorted pandas DatetimeIndex of days
+
+    Returns a DataArray of total precipitation scaled to mm, with off-grid cells set to NaN
     """
-    Extracts daily precipitation from cube of reanalysis data
+    ds = read_daily_cube(reanalysis, days[0], days[-1], grid=grid)
+    if ds is None:
+        ds = read_netcdfs([daily_filepath(reanalysis, d, grid=grid) for d in days], 'time')
+        ds['time'] = days
+    else:
+        ds = ds.sel(time=days)
+    da = ds[VARNAME.get(reanalysis, 'PRECTOT')].transpose('time', 'x', 'y')
+    da = da.where(ds.latitude > -999.) * SCALE[reanalysis]
+    return da
 
-    reanalysis - name of reanalaysis
-    first_date - first date of reanalysis YYYY-MM-DD
-    last_date  - last date to read YYYY-MM-DD
+
+def extract_stations_precip(reanalysis, trajectories, verbose=False):
     """
+    Extracts daily precipitation along several trajectories in one pass through the
+    reanalysis.  The days needed by all trajectories are found and each day is read once.
+    Points are gathered for all stations with one fancy-indexing operation per year.
 
-    stations = [22,24,25,26,27,28,29,30,31]
-    
-    for id in stations:
+    reanalysis - name of reanalysis
+    trajectories - dict of {station id: trajectory dataframe} with Latitude and Longitude 
+                   columns, indexed by date
 
-        if verbose: print ('Getting prectot for {:d}'.format(id))
-        
-        # Read trajectory
-        if verbose: print ('  Getting trajectory coordinates...')
-        trajectory = load_trajectory(id)
-        trajectory = trajectory.loc[REANALYSIS_FIRST_YEAR[reanalysis]:]
+    Returns: tidy dataframe with columns station, reanalysis, Latitude, Longitude and TOTPREC,
+             indexed by date.  TOTPREC is NaN for days with missing Latitude or Longitude
+    """
+    table = pd.concat(trajectories, names=['station', 'date']).reset_index()
+
+    _, ix, iy = trajectory_to_indices(table)
+    table['day'] = table['date'].dt.floor('D')
+
+    # Indices of missing positions are not valid, so these rows are not extracted
+    valid = (table['Latitude'].notna() & table['Longitude'].notna()).values
     
-        # Read reanalysis cube
-        if verbose: print ('  Reading reanalysis data...')
-        reanalysis_df = load_reanalysis(reanalysis,
-                                        trajectory.index[0].strftime('%Y-%m-%d'),
-                                        trajectory.index[-1].strftime('%Y-%m-%d'),
-        )
-
-        if verbose: print ('  Extracting points...')
-        precip = extract_trajectory_precip(reanalysis_df, trajectory)
-        # Set precipitation values (normally 10**-9) to zero
-        precip['TOTPREC'].where(precip['TOTPREC'] > 0., 0., inplace=True)
-            
-        reanalysis_df.close()
-        
-        # For Testing: plot time series
-        fileout = f'{reanalysis.lower()}.prectot.daily.np{id}.csv'
-        if verbose: print (f'  Writing TOTPREC for {reanalysis} for trajectory NP{id:02d} to {fileout}')
-        precip['TOTPREC'].to_csv(fileout)
+    # sel(..., method='nearest') in extract_trajectory_precip clips indices to the grid
+    ix = np.clip(ix.values, 0, 359)
+    iy = np.clip(iy.values, 0, 359)
+
+    totprec = np.full(len(table), np.nan)
+    for year, in_year in table[valid].groupby(table['day'][valid].dt.year).groups.items():
+        in_year = table.index.get_indexer(in_year)
+        days = pd.DatetimeIndex(np.unique(table['day'].values[in_year]))
+        if verbose: print (f'  Reading {days.size:d} days for {year:d}...')
+        grid = read_days(reanalysis, days).values
+        it = days.get_indexer(table['day'].values[in_year])
+        totprec[in_year] = grid[it, ix[in_year], iy[in_year]]
+
+    # Set small and missing precipitation values to zero, except where position is missing
+    table['TOTPREC'] = np.where(valid, np.where(totprec > 0., totprec, 0.), np.nan)
+    table['reanalysis'] = reanalysis
+
+    return table.set_index('date')[['station', 'reanalysis', 'Latitude', 'Longitude', 'TOTPREC']]
+
+
+def main(reanalyses, stations=None, fileout=None, verbose=False):
+    """
+    Extracts daily precipitation from cube of reanalysis data
+
+    reanalyses - list of names of reanalaysis
+    stations - list of NP station numbers, default is STATIONS
+    fileout - path to write tidy table of precipitation for all stations and reanalyses.
+              Per-station files are written for each reanalysis.
+    """
+    if not stations: stations = STATIONS
+
+    if verbose: print ('Getting trajectory coordinates...')
+    trajectories = {id: load_trajectory(id) for id in stations}
+
+    tables = []
+    for reanalysis in reanalyses:
+
+        if verbose: print (f'Getting prectot for {reanalysis}')
+        these = {id: trajectory.loc[REANALYSIS_FIRST_YEAR[reanalysis]:]
+                 for id, trajectory in trajectories.items()}
+        table = extract_stations_precip(reanalysis, these, verbose=verbose)
+        tables.append(table)
+
+        for id in stations:
+            precip = table.loc[table.station == id, 'TOTPREC']
+            precip.index.name = None
+            filestn = f'{reanalysis.lower()}.prectot.daily.np{id}.csv'
+            if verbose: print (f'  Writing TOTPREC for {reanalysis} for trajectory NP{id:02d} to {filestn}')
+            precip.to_csv(filestn, header=True)
+
+    if fileout:
+        if verbose: print (f'Writing TOTPREC for all stations and reanalyses to {fileout}')
+        pd.concat(tables).to_csv(fileout)
 
         
 if __name__ == "__main__":
@@ -149,10 +206,13 @@ if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description = 'Extracts daily reanalysis precipitation for NP trajectories')
-    parser.add_argument('reanalysis', type=str, help='Name or reanalysis')
+    parser.add_argument('reanalysis', type=str, nargs='+', help='Name or reanalysis')
+    parser.add_argument('--stations', '-s', type=int, nargs='+', default=None,
+                        help='NP station numbers')
+    parser.add_argument('--fileout', '-o', type=str, default=None,
+                        help='File to write table for all stations and reanalyses')
     parser.add_argument('--verbose', '-v', action='store_true')
 
     args = parser.parse_args()
     
-    main(args.reanalysis, verbose=args.verbose)
-    
+    main(args.reanalysis, stations=args.stations, fileout=args.fileout, verbose=args.verbose)
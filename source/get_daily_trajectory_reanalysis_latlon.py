@@ -10,7 +10,6 @@ import pandas as pd
 import datetime as dt
 import os
 
-from test_ungrid import lat_lon_to_col_row
 from readers.reanalysis import read_daily_precip
 from readers.npsnow import read_position
 from get_trajectory_reanalysis_data import trajectory_to_indices
@@ -5,6 +5,8 @@ import pandas as pd
 import matplotlib.pyplot as plt
 
 from generate_reanalysis_trajectory_monthly_total import load_daily_reanalysis
+from precipitation.periods import PERIODS
+from precipitation.histogram import bin_edges, histogram
 
 def load_data(reanalysis):
     stations = [22, 24, 25, 26, 28, 29, 30, 31]
@@ -17,12 +19,10 @@ def get_histogram(reanalysis, bin_max=100., bin_width=0.1, threshold=0.,
 
     if verbose: print(f'Loading data for {reanalysis}')
     df = load_data(reanalysis)
-    if period == 'accumulation':
-        df = df[df.index.month.isin([8, 9, 10, 11, 12, 1, 2, 3, 4])]
-    arr = df.values
-
-    bins = np.arange(0., bin_max+bin_width, bin_width)
-    h, b = np.histogram(arr[np.greater(arr, threshold)], bins=bins)
+    if period in PERIODS:
+        df = df[df.index.month.isin(PERIODS[period])]
+    bins = bin_edges(bin_max, bin_width)
+    h = histogram(df.values, bins, threshold=threshold)[0]
 
     da = xr.DataArray(h, coords=[bins[:-1]], dims=['bin_edge'], name='pdf')
 
@@ -47,7 +47,7 @@ if __name__ == "__main__":
     parser.add_argument('--bin_width', type=float, default=0.1,
                         help='Width of bin (default=0.1)')
     parser.add_argument('--period', type=str, default='accumulation',
-                        help='Width of bin (default=accumulation)')
+                        help='Period of year: annual, accumulation, water_year, DJF, MAM, JJA or SON (default=accumulation)')
     parser.add_argument('--verbose', '-v', action='store_true')
     
     args = parser.parse_args()
@@ -11,7 +11,7 @@ import pandas as pd
 import datetime as dt
 import os
 
-from test_ungrid import lat_lon_to_col_row
+from utilities.ease_grid import cell_index
 from readers.reanalysis import read_precip_stats
 from readers.npsnow import read_yang_updated
 
@@ -28,10 +28,7 @@ def trajectory_to_indices(df):
     
     lat = df[lat_name].values
     lon = df[lon_name].values
-    col, row = lat_lon_to_col_row(lat, lon)
-    #col, row = column_row_from_lat_long(lat, lon, gpd_name='Nh50km')
-    col = np.floor(col).astype(int)
-    row = np.floor(row).astype(int)
+    col, row = cell_index(lat, lon, grid='Nh50km')
     ix = xr.DataArray(row, dims=['time'])
     iy = xr.DataArray(col, dims=['time'])
     if 'Date' in df.columns:
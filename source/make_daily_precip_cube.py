@@ -0,0 +1,50 @@
+#----------------------------------------------------------------------
+# Packs daily reanalysis precipitation files into a single chunked,
+# compressed cube.  Once a cube exists, readers.reanalysis.read_daily_precip
+# reads from it instead of opening one file per day.
+#----------------------------------------------------------------------
+
+from readers.reanalysis import make_daily_cube
+
+REANALYSIS_FIRST_DATE = {
+    'ERA5': '1979-01-01',
+    'ERAI': '1979-01-01',
+    'MERRA': '1980-01-01',
+    'MERRA2': '1980-01-01',
+    'CFSR': '1979-01-01',
+    'JRA55': '1979-01-01',
+}
+
+
+def main(reanalysis, first_date=None, last_date=None, grid='Nh50km', verbose=False):
+    """
+    Packs daily precipitation for a reanalysis into a cube
+
+    reanalysis - name of reanalysis
+    first_date - first date to pack YYYY-MM-DD
+    last_date - last date to pack YYYY-MM-DD
+    """
+    if not first_date: first_date = REANALYSIS_FIRST_DATE[reanalysis]
+
+    if verbose: print (f'Packing {reanalysis} daily precipitation from {first_date} to {last_date}')
+    path = make_daily_cube(reanalysis, first_date, last_date, grid=grid, verbose=verbose)
+    if verbose: print (f'Cube written to {path}')
+
+
+if __name__ == "__main__":
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Packs daily reanalysis precipitation files into a chunked cube')
+    parser.add_argument('reanalysis', type=str, help='Name of reanalysis')
+    parser.add_argument('last_date', type=str, help='Last date to pack YYYY-MM-DD')
+    parser.add_argument('--first_date', '-fd', type=str, default=None,
+                        help='First date to pack YYYY-MM-DD, default is start of reanalysis')
+    parser.add_argument('--grid', '-g', type=str, default='Nh50km',
+                        help='Name of grid')
+    parser.add_argument('--verbose', '-v', action='store_true')
+
+    args = parser.parse_args()
+
+    main(args.reanalysis, first_date=args.first_date, last_date=args.last_date,
+         grid=args.grid, verbose=args.verbose)
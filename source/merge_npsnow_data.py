@@ -13,6 +13,7 @@ import matplotlib.dates as mdates
 
 import readers.npsnow as npsnow
 import trajectory
+from utilities.correction import wind_at_gauge
 from constants import DATADIR as NPSNOW_PATH
 
 def get_station_list():
@@ -64,7 +65,7 @@ def merge_one_station(sid, set_noprecip=True):
     df = df.drop('statid', axis=1)  # Drop duplicate column
 
     # Calculate wind speed at gauge height
-    df['Ug'] = df.apply(wind_at_gauge, axis=1)
+    df['Ug'] = wind_at_gauge(df['WSPD'], df['SDEPTH'])
 
     return df
 
@@ -108,14 +109,6 @@ def get_snowdepth(sid):
     return snowDay[snowDay.station == int(sid)].snowdepth
 
 
-def wind_at_gauge(x):
-    """Reduces 10 m wind speed to wind at gauge height orifice"""
-    H = 10.  # height of anenometer
-    hg = 2.  # height of gauge orifice
-    z0 = 0.01  # Roughness parameter of snow surface
-    return x.WSPD * np.log10((hg- x.SDEPTH*0.01)/z0) / np.log10(H/z0)
-
-
 def myFmtr(v, pos=None):
     d = mdates.num2date(v)
     if d.month == 1:
@@ -63,6 +63,12 @@ arctic_mask_region = {
     'HUDSON_BAY':      4,
          }
 
+# Groups of regions in Walt Meier's Arctic region mask
+arctic_mask_region_group = {
+    'CENTRAL_ARCTIC_OCEAN': [15, 13, 12, 10, 11],  # Central Arctic, Beaufort, Chukchi, Laptev, East Siberian
+    'ARCTIC_OCEAN': [15, 13, 12, 8, 9, 10, 11],  # Central Arctic Ocean plus Barents and Kara
+}
+
 reanalysis_dirpath = {
     'CFSR': '/disks/arctic5_raid/abarrett/CFSR/TOTPREC',
     'ERAI': '/disks/arctic5_raid/abarrett/ERA_Interim/daily/PRECTOT',
@@ -116,18 +116,11 @@ def arctic_regional_precip_stats(reanalysis, verbose=False, period='month'):
     if verbose: print ('   Getting mask...')
     mask = util.read_region_mask()
 
-    by_region = []
-    for key in arctic_mask_region.keys():
-        if verbose: print ('   Getting regional stats for '+key+'...')
-        by_region.append( util.region_stats(ds, mask, key).to_dataframe() )
+    if verbose: print ('   Getting regional stats...')
+    df = util.region_stats_table(ds, mask, regions=arctic_mask_region)
 
     ds.close()
     
-    #by_region = [_get_region_stats(ds, mask, key).to_dataframe() for key in region.keys()]
-
-    if verbose: print ('   Concatenating dataframes...')
-    df = pd.concat( by_region, axis=1, keys=(arctic_mask_region.keys()) )
-    
     return df 
 
 def get_arctic_regional_stats(reanalysis, period='month', verbose=False):
@@ -4,12 +4,14 @@ import glob
 import os
 import calendar
 import datetime as dt
+import functools
 
 import xarray as xr
 import numpy as np
 import pandas as pd
 
 import utilities as utils
+from histogram import bin_edges, histogram, monthly_histograms, region_index
 from constants import reanalysis_dirpath, filepath, maskFile, vnamedict, arctic_mask_region
 
 data_range = {
@@ -34,14 +36,11 @@ def load_month(reanalysis, variable, year, month, grid='Nh50km'):
 
 def to_pdf(da, threshold=0., bins=None):
     """Returns histogram and bin_edges as tuple for finite values above a threshold"""
-    arr = da.values.reshape(-1)
-    with np.errstate(all='ignore'):
-        h, b = np.histogram(arr[np.isfinite(arr) & np.greater(arr, threshold)], bins=bins)
-    return h, b
+    return histogram(da.values, bins, threshold=threshold)[0], bins
     
     
 def main(reanalysis, date_begin='1979-01', date_end='2018-12', verbose=False, threshold=0.,
-         bin_max=100., bin_width=0.1):
+         bin_max=100., bin_width=0.1, workers=1):
 
     if verbose: print (f'Extracting monthly histograms for {reanalysis} from {date_begin} to {date_end}')
     
@@ -57,21 +56,14 @@ def main(reanalysis, date_begin='1979-01', date_end='2018-12', verbose=False, th
         date_end = data_range[reanalysis][1]
     dates = pd.date_range(date_begin, date_end, freq='MS')
 
-    bins = np.arange(0., bin_max+bin_width, bin_width)
-    data_arrays = []
-    for d in dates:
+    # All regions are binned from one read of each month
+    bins = bin_edges(bin_max, bin_width)
+    group = xr.DataArray(region_index(mask, arctic_mask_region), dims=mask.dims)
+    if verbose: print (f'Getting statistics for {len(dates)} months')
+    data_arrays = monthly_histograms(functools.partial(load_month, reanalysis, 'PRECIP'), dates, bins,
+                                     threshold=threshold, group=group, ngroup=len(arctic_mask_region),
+                                     workers=workers)
 
-        if verbose: print (f'Getting statistics for {d.year:4d}-{d.month:02d}')
-        da = load_month(reanalysis, 'PRECIP', d.year, d.month)
-
-        hist = []
-        for region in arctic_mask_region.keys():
-            h, _ = to_pdf(da.where(mask == arctic_mask_region[region]), threshold=threshold, bins=bins)
-            hist.append(h)
-            
-        data_arrays.append(hist)
-
-    #print (data_arrays)
     da = xr.DataArray(data_arrays, coords=[dates, list(arctic_mask_region.keys()), bins[:-1]],
                       dims=['time', 'region', 'bin_edge'], name='pdf')
     
@@ -94,10 +86,12 @@ if __name__ == "__main__":
                         help='Month to end processing')
     parser.add_argument('--threshold', type=float, default=0.,
                         help='Threshold for precipitation (default=0.)')
+    parser.add_argument('--workers', '-w', type=int, default=1,
+                        help='Number of processes used to read and bin months')
     parser.add_argument('--verbose', '-v', action='store_true')
     
     args = parser.parse_args()
     
     main(args.reanalysis, date_begin=args.date_begin, date_end=args.date_end,
-         threshold=args.threshold, verbose=args.verbose)
+         threshold=args.threshold, verbose=args.verbose, workers=args.workers)
     
@@ -137,25 +137,30 @@ def subset_urlList(urlList, start_date=None, end_date=None):
     
 def hour2dayTot(daHr):
     '''
-    Calculates total precipitation and carries attributes
+    Calculates total precipitation and carries attributes.  Days without
+    all 24 hours are returned as NaN.
     
     daHr - DataArray containing hourly data
     
     Returns: DataArray with daily total
     '''
-    
+    import numpy as np
+    import xarray as xr
+    from utilities import accumulate_to_daily
+
+    begin_date = daHr.time.attrs.get('begin_date')
+
     # Check if hourly values are rate or a total
-    if (daHr.attrs['units'] == 'kg m-2 s-1') | (daHr.attrs['units'] == 'kg/m2/s'):
-        daDay = daHr.sum(dim='time')*3600.
-    else:
-        daDay = daHr.sum(dim='time')
-        
-    daDay.attrs = daHr.attrs
-    if (daHr.attrs['units'] == 'kg m-2 s-1') | (daHr.attrs['units'] == 'kg/m2/s'):
-        daDay.attrs['units'] = 'mm'
+    rate = (daHr.attrs['units'] == 'kg m-2 s-1') | (daHr.attrs['units'] == 'kg/m2/s')
 
-    if 'begin_date' in daHr.time.attrs:
-        daDay.attrs['time'] = str(daHr.time.attrs['begin_date'])
+    # Hourly MERRA values are stamped at the center of each hour
+    if not np.issubdtype(daHr['time'].dtype, np.datetime64):
+        daHr = xr.decode_cf(daHr.to_dataset())[daHr.name]
+    daDay = accumulate_to_daily(daHr, input_freq_hours=1, time_stamp='center',
+                                rate=rate).isel(time=0, drop=True)
+
+    if begin_date is not None:
+        daDay.attrs['time'] = str(begin_date)
     
     return daDay
 
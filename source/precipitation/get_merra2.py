@@ -38,21 +38,7 @@ def hour2day(daHr):
     
     Returns: DataArray with daily total
     '''
-    
-    # Check if hourly values are rate or a total
-    if daHr.attrs['units'] == 'kg m-2 s-1':
-        daDay = daHr.sum(dim='time')*3600.
-    else:
-        daDay = daHr.sum(dim='time')
-        
-    daDay.attrs = daHr.attrs
-    if daHr.attrs['units'] == 'kg m-2 s-1':
-        daDay.attrs['units'] = 'mm'
-
-    if 'begin_date' in daHr.time.attrs:
-        daDay.attrs['time'] = str(daHr.time.attrs['begin_date'])
-    
-    return daDay
+    return m2util.hour2day(daHr)
 
 def make_output_path(url, varName, root_diro=MERRA2_DIR):
     '''Generates a path for the output netCDF4 file'''
@@ -69,74 +55,127 @@ def make_output_path(url, varName, root_diro=MERRA2_DIR):
     return os.path.join(root_diro, varName, date.strftime('%Y'),
                         date.strftime('%m'), '.'.join(tmp))
 
-def write_to_netcdf4(var, filo, compress=True):
+def write_to_netcdf4(var, filo, compress=True, complevel=9):
     '''Writes xarray DataArray to netCDF4 file
 
     If output path does not exist, the path is created.
-    Files are automatically overwritten
+    Files are automatically overwritten.  The file is written to a temporary
+    path and renamed, so an interrupted write does not leave a partial file.
 
     var - xarray DataArray
     filo - string for output file path
+    compress - if True, compress variables
+    complevel - zlib compression level (1-9)
+
+    Returns True if file is written
     '''
 
     import os
 
     # Make directory, ignored if directory already exists
-    if not os.path.isdir( os.path.dirname(filo) ):
-        os.makedirs( os.path.dirname(filo) )
+    os.makedirs( os.path.dirname(filo), exist_ok=True )
 
-    encoding = {varNm: {'zlib': compress, 'complevel': 9} for varNm in var.data_vars}
+    encoding = {varNm: {'zlib': compress, 'complevel': complevel} for varNm in var.data_vars}
     
+    tmpfile = '{}.{:d}.tmp'.format(filo, os.getpid())
     try:
-        var.to_netcdf(filo, encoding=encoding)
-    except:
-        print ('%write_to_netcdf4: Cannot create {:}'.format(filo))
+        var.to_netcdf(tmpfile, encoding=encoding)
+        os.replace(tmpfile, filo)
+    except Exception as err:
+        print ('%write_to_netcdf4: Cannot create {:}: {}'.format(filo, err))
+        if os.path.exists(tmpfile): os.remove(tmpfile)
+        return False
         
-    return
+    return True
+
+def download_one(url, varList, outdir='.', raw=False, complevel=9, retries=3, login=True,
+                 verbose=False):
+    '''Extracts variables from one granule and writes them to files
+
+    Returns url
+    '''
+    session = m2util.pooled_session(url, login=login)
+    
+    # Get openDAP dataset
+    if verbose: print ('   Getting {}'.format(url))
+    dataset = m2util.retry(m2util.get_dataset, url, session, retries=retries, verbose=verbose)
+
+    for varName in varList:
+
+        if verbose: print ( '   Extracting daily {} from dataset...'.format(varName) )
+        varHr = m2util.retry(m2util.pydap2xarray, dataset, varName, retries=retries, verbose=verbose)
+
+        if (not raw):
+            varDy = m2util.hour2day(varHr)
+            dsDy = varDy.to_dataset()
+        else:
+            dsDy = varHr.to_dataset()
+                      
+        dsDy.attrs['created_by'] = 'Andrew P. Barrett <apbarret@nsidc.org'
+        dsDy.attrs['created'] = dt.datetime.now().strftime('%Y%m%d')
+        if url: dsDy.attrs['source'] = url
+    
+        filo = make_output_path(url, varName, root_diro=outdir)
+        if verbose: print ( '   Writing {} to {}'.format(varName,filo) )
+        if not write_to_netcdf4(dsDy, filo, complevel=complevel):
+            raise IOError('Cannot create {}'.format(filo))
+
+    return url
 
 def main(listFile, varList, start_date=None, end_date=None, verbose=False, overwrite=False,
-         outdir='.', raw=False):
+         outdir='.', raw=False, workers=4, retries=3, complevel=9, ledger=None, login=True):
     '''For a given MERRA2 dataset, extract variables (supplied as list) and write to
        to files using defined directory structure
+
+    Granules are downloaded concurrently by workers threads, each reusing one
+    session.  Completed urls are recorded in a ledger, so an interrupted run
+    resumes where it stopped.
     
     Args
     root dataset url
     list of variables
+    workers - number of granules downloaded concurrently
+    retries - number of retries for each request, with exponential backoff
+    complevel - zlib compression level for output files
+    ledger - path to ledger file.  Default is get_merra2.ledger in outdir
+    overwrite - if True, granules in the ledger are downloaded again
+    login - if False, do not authenticate, e.g. for a local test server
+
+    Returns dictionary of failed urls and errors
     '''
+    import os
+    from concurrent.futures import ThreadPoolExecutor, as_completed
     
     # generate a url or list of urls OR date range
     urlList = m2util.get_urlList(listFile)
     urlList = m2util.subset_urlList(urlList, start_date, end_date)
 
-    # Loop through urls
-    for url in urlList:
-        
-        # Get openDAP dataset
-        if verbose: print ('   Getting {}'.format(url))
-        session = m2util.start_session(url)
-        dataset = m2util.get_dataset(url, session)
-        
-        for varName in varList:
-
-            if verbose: print ( '   Extracting daily {} from dataset...'.format(varName) )
-            #varHr = dataset_var_to_DataArray(dataset, varName)
-            varHr = m2util.pydap2xarray(dataset, varName)
-
-            if (not raw):
-                varDy = m2util.hour2day(varHr)
-                dsDy = varDy.to_dataset()
-            else:
-                dsDy = varHr.to_dataset()
-                      
-            dsDy.attrs['created_by'] = 'Andrew P. Barrett <apbarret@nsidc.org'
-            dsDy.attrs['created'] = dt.datetime.now().strftime('%Y%m%d')
-            if url: dsDy.attrs['source'] = url
-    
-            filo = make_output_path(url, varName, root_diro=outdir)
-            if verbose: print ( '   Writing {} to {}'.format(varName,filo) )
-            write_to_netcdf4(dsDy, filo)
+    if not ledger:
+        ledger = os.path.join(outdir, 'get_merra2.ledger')
+    os.makedirs(os.path.dirname(os.path.abspath(ledger)), exist_ok=True)
+    done = set() if overwrite else m2util.read_ledger(ledger)
+    todo = [url for url in urlList if url not in done]
+    if verbose: print ('{:d} of {:d} granules to download'.format(len(todo), len(urlList)))
 
-        session.close()
+    failed = {}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(download_one, url, varList, outdir=outdir, raw=raw,
+                                       complevel=complevel, retries=retries, login=login,
+                                       verbose=verbose): url for url in todo}
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    future.result()
+                except Exception as err:
+                    print ('%get_merra2: Failed to get {}: {}'.format(url, err))
+                    failed[url] = err
+                else:
+                    m2util.append_ledger(ledger, url)
+    finally:
+        m2util.close_sessions()
+
+    return failed
         
 if __name__ == '__main__':
 
@@ -154,9 +193,25 @@ if __name__ == '__main__':
                         help='Date of last file to download')
     parser.add_argument('--verbose', '-v', action='store_true')
     parser.add_argument('--raw', '-r', action='store_true')
-    parser.add_argument('--overwrite', action='store_false')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='Download granules already recorded in the ledger')
+    parser.add_argument('--workers', '-w', type=int, default=4,
+                        help='Number of granules to download concurrently')
+    parser.add_argument('--retries', type=int, default=3,
+                        help='Number of retries for each request')
+    parser.add_argument('--complevel', type=int, default=9,
+                        help='zlib compression level for output files')
+    parser.add_argument('--ledger', type=str, default=None,
+                        help='File recording completed granules')
+    parser.add_argument('--no_login', action='store_true',
+                        help='Do not authenticate, e.g. for a local test server')
 
     args = parser.parse_args()
 
-    main(args.listFile, args.varList, start_date=args.start_date, end_date=args.end_date,
-         outdir=args.outdir, verbose=args.verbose, overwrite=args.overwrite, raw=args.raw)
+    failed = main(args.listFile, args.varList, start_date=args.start_date, end_date=args.end_date,
+                  outdir=args.outdir, verbose=args.verbose, overwrite=args.overwrite, raw=args.raw,
+                  workers=args.workers, retries=args.retries, complevel=args.complevel,
+                  ledger=args.ledger, login=not args.no_login)
+    if failed:
+        import sys
+        sys.exit(1)
@@ -0,0 +1,115 @@
+#----------------------------------------------------------------------
+# Histograms of daily precipitation.
+#
+# Values are assigned to bins once with searchsorted and counted with
+# np.bincount.  Counts for several groups, e.g. regions or months, are
+# made in the same call by offsetting bin indices by group.  Partial
+# histograms from different workers are merged by adding counts.
+#----------------------------------------------------------------------
+import numpy as np
+
+
+def bin_edges(bin_max=100., bin_width=0.1):
+    """Returns bin edges from 0 to bin_max"""
+    return np.arange(0., bin_max+bin_width, bin_width)
+
+
+def bin_index(x, bins):
+    """
+    Returns bin indices for values, using the same bins as np.histogram: bins
+    are closed on the left, except the last bin which includes its right edge.
+    Values outside the bins are -1.
+    """
+    x = np.asarray(x)
+    with np.errstate(invalid='ignore'):
+        index = np.searchsorted(bins, x, side='right') - 1
+        index[x == bins[-1]] = len(bins) - 2
+        index[(x < bins[0]) | (x > bins[-1]) | ~np.isfinite(x)] = -1
+    return index
+
+
+def histogram(x, bins, threshold=0., group=None, ngroup=1):
+    """
+    Counts finite values above a threshold in bins for one or more groups
+
+    x - array of values, e.g. a month or several months of daily grids
+    bins - bin edges
+    threshold - only values greater than threshold are counted
+    group - integer array broadcastable to x with the group number of each value,
+            e.g. region or month.  Values with group -1 are not counted.  If None,
+            all values are in group 0
+    ngroup - number of groups
+
+    Returns
+    -------
+    counts - array with shape (ngroup, nbins)
+    """
+    nbins = len(bins) - 1
+    x = np.asarray(x)
+    index = bin_index(x, bins)
+    with np.errstate(invalid='ignore'):
+        keep = (index >= 0) & (x > threshold)
+    if group is not None:
+        group = np.broadcast_to(group, x.shape)
+        keep &= group >= 0
+        index = index + group*nbins
+    counts = np.bincount(index[keep], minlength=ngroup*nbins)
+    return counts.reshape(ngroup, nbins)
+
+
+def merge(histograms):
+    """Merges partial histograms, e.g. from parallel workers, by adding counts"""
+    return np.sum(list(histograms), axis=0)
+
+
+def region_index(mask, regions):
+    """
+    Returns the group number of each cell for a mask of region codes
+
+    mask - array of region codes
+    regions - dictionary of region names and codes, or lists of codes for groups of
+              regions.  Cells not in a region are -1
+
+    Returns integer array with the shape of mask
+    """
+    mask = np.asarray(mask)
+    index = np.full(mask.shape, -1, dtype=int)
+    for i, code in enumerate(regions.values()):
+        index[np.isin(mask, code)] = i
+    return index
+
+
+def _month_counts(load, date, bins, threshold, group, ngroup):
+    """Loads a month with load(year, month) and returns counts for each group"""
+    da = load(date.year, date.month)
+    if group is not None:
+        group = group.broadcast_like(da).fillna(-1).astype(int).transpose(*da.dims).values
+    return histogram(da.values, bins, threshold=threshold, group=group, ngroup=ngroup)
+
+
+def monthly_histograms(load, dates, bins, threshold=0., group=None, ngroup=1, workers=1):
+    """
+    Returns histograms for each month and group.  Months are read and counted in
+    parallel if workers > 1.
+
+    load - function taking year and month and returning a DataArray of daily values.
+           Must be defined at module level if workers > 1
+    dates - dates of months
+    bins - bin edges
+    threshold - only values greater than threshold are counted
+    group - DataArray of group numbers that can be broadcast against the monthly data
+    ngroup - number of groups
+
+    Returns
+    -------
+    counts - array with shape (ntime, ngroup, nbins)
+    """
+    args = (bins, threshold, group, ngroup)
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_month_counts, load, d, *args) for d in dates]
+            counts = [future.result() for future in futures]
+    else:
+        counts = [_month_counts(load, d, *args) for d in dates]
+    return np.stack(counts)
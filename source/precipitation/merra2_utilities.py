@@ -5,6 +5,9 @@
 
 import datetime as dt
 import numpy as np
+import os
+import threading
+import time
 
 from pydap.client import open_url                                  
 from pydap.cas.urs import setup_session                            
@@ -16,12 +19,103 @@ def start_session(url):
     session = setup_session(user, pswd, check_url=url)
     return session
 
+# One session is kept for each download thread and reused for every granule
+_local = threading.local()
+_sessions = []
+_lock = threading.Lock()
+
+def pooled_session(url, login=True):
+    """
+    Returns the session for the calling thread, starting one the first time
+    it is needed.
+
+    login - if True, authenticate with Earthdata Login credentials from .netrc.
+            Otherwise an unauthenticated requests session is used, e.g. for a
+            local test server
+    """
+    session = getattr(_local, 'session', None)
+    if session is None:
+        if login:
+            session = start_session(url)
+        else:
+            import requests
+            session = requests.Session()
+        _local.session = session
+        with _lock:
+            _sessions.append(session)
+    return session
+
+def close_sessions():
+    """Closes all pooled sessions"""
+    with _lock:
+        for session in _sessions:
+            session.close()
+        _sessions.clear()
+    _local.__dict__.clear()
+
 def get_dataset(url, session):
 
     dataset = open_url(url, session=session)
     
     return dataset
 
+# HTTP status codes that are retried, in addition to 5xx server errors
+RETRY_STATUS = {408, 429}
+
+def is_transient(err):
+    """
+    Returns True for errors that may succeed if retried: connection errors, timeouts,
+    and HTTP 5xx, 408 and 429 responses, including a session's own retries of these
+    running out (RetryError).  Other errors, e.g. 404 or 401 responses, are permanent.
+    """
+    import requests
+
+    if isinstance(err, (ConnectionError, TimeoutError,
+                        requests.exceptions.ConnectionError,
+                        requests.exceptions.Timeout,
+                        requests.exceptions.ChunkedEncodingError,
+                        requests.exceptions.RetryError)):
+        return True
+    # requests errors carry a response, pydap (webob) and urllib errors a code
+    response = getattr(err, 'response', None)
+    status = getattr(response, 'status_code', getattr(err, 'code', None))
+    if isinstance(status, int):
+        return (status >= 500) or (status in RETRY_STATUS)
+    return False
+
+def retry(func, *args, retries=3, backoff=2., verbose=False, **kwargs):
+    """
+    Calls func, retrying with exponential backoff if it raises a transient error (see
+    is_transient).  Other errors are raised immediately.
+
+    retries - number of retries after the first attempt
+    backoff - wait backoff**attempt seconds before each retry
+    """
+    for attempt in range(retries+1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as err:
+            if (attempt == retries) or not is_transient(err):
+                raise
+            wait = backoff**attempt
+            if verbose: print ('   {}: retrying in {:.0f} s'.format(err, wait))
+            time.sleep(wait)
+
+def read_ledger(ledger):
+    """Returns the set of urls recorded as complete in a ledger file"""
+    if not os.path.exists(ledger):
+        return set()
+    with open(ledger) as f:
+        return set(l.strip() for l in f if l.strip())
+
+def append_ledger(ledger, url):
+    """Records url as complete in a ledger file"""
+    with _lock:
+        with open(ledger, 'a') as f:
+            f.write(url + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
 def pydap2xarray(dataset, varname, url=None,
                  level=[1000., 925., 850., 700., 500., 300.]):
     
@@ -48,6 +142,7 @@ def pydap2xarray(dataset, varname, url=None,
         da = xr.DataArray(var[:], coords=[time[:],lat[:],lon[:]],
                           dims=['time','lat','lon'],
                           attrs=var.attributes, name=varname)
+    da['time'].attrs = time.attributes
     da['lat'].attrs = OrderedDict([('long_name', 'latitude'), ('units', 'degrees_north')])
     da['lon'].attrs = OrderedDict([('long_name', 'longitude'), ('units', 'degrees_east')])
     
@@ -111,24 +206,26 @@ def subset_urlList(urlList, begin, end):
     
 def hour2day(daHr):
     '''
-    Calculates total precipitation and carries attributes
+    Calculates total precipitation and carries attributes.  Values are
+    summed with utilities.accumulate_to_daily, so days without all 24
+    hours are returned as NaN.
     
     daHr - DataArray containing hourly data
     
     Returns: DataArray with daily total
     '''
-    
-    # Check if hourly values are rate or a total
-    if daHr.attrs['units'] == 'kg m-2 s-1':
-        daDay = daHr.sum(dim='time')*3600.
-    else:
-        daDay = daHr.sum(dim='time')
-        
-    daDay.attrs = daHr.attrs
-    if daHr.attrs['units'] == 'kg m-2 s-1':
-        daDay.attrs['units'] = 'mm'
-
-    if 'begin_date' in daHr.time.attrs:
-        daDay.attrs['time'] = str(daHr.time.attrs['begin_date'])
+    import xarray as xr
+    from utilities import accumulate_to_daily
+
+    begin_date = daHr.time.attrs.get('begin_date')
+
+    # Hourly MERRA2 values are stamped at the center of each hour
+    if not np.issubdtype(daHr['time'].dtype, np.datetime64):
+        daHr = xr.decode_cf(daHr.to_dataset())[daHr.name]
+    daDay = accumulate_to_daily(daHr, input_freq_hours=1, time_stamp='center',
+                                rate=daHr.attrs['units'] == 'kg m-2 s-1').isel(time=0, drop=True)
+
+    if begin_date is not None:
+        daDay.attrs['time'] = str(begin_date)
     
     return daDay
@@ -14,16 +14,28 @@
 import requests
 import datetime as dt
 import xml.etree.ElementTree as ET
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
+import hashlib
+import json
 import os
 import re
 import netrc
+import threading
 
 AUTH_HOST = 'https://urs.earthdata.nasa.gov'
 
+# Catalog XML is cached here, with the ETag and Last-Modified headers used to revalidate it
+CACHE_DIR = os.environ.get('NASA_CRAWLER_CACHE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'nasa_crawler'))
+
+NS = {'thredds': 'http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0',
+      'xlink': 'http://www.w3.org/1999/xlink'}
+
 
 # overriding requests.Session.rebuild_auth to mantain headers when redirected
 class SessionWithHeaderRedirection(requests.Session):
+
+    AUTH_HOST = urlparse(AUTH_HOST).hostname
  
     def __init__(self, username, password):
         super(SessionWithHeaderRedirection, self).__init__()
@@ -59,50 +71,124 @@ def get_product_url(reanalysis, time, variable, year=None):
     
     return result
 
-def crawl(catalog, session):
+def _cache_paths(url):
+    """Returns paths to cached content and headers for a catalog url"""
+    key = hashlib.sha1(url.encode()).hexdigest()
+    return os.path.join(CACHE_DIR, key+'.xml'), os.path.join(CACHE_DIR, key+'.json')
+
+def _write_atomic(path, content, mode='wb'):
+    # Catalogs are fetched by several threads, so the thread id is part of the name
+    tmpfile = '{}.{:d}.{:d}.tmp'.format(path, os.getpid(), threading.get_ident())
+    with open(tmpfile, mode) as f:
+        f.write(content)
+    os.replace(tmpfile, path)
 
-    ns = {'thredds': 'http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0',
-          'xlink': 'http://www.w3.org/1999/xlink'}
+def fetch_catalog(catalog, session, cache=True, revalidate=True):
+    """
+    Gets catalog XML.  If cache is True, catalogs are cached in CACHE_DIR and
+    revalidated with conditional requests using ETag and Last-Modified headers,
+    so unchanged catalogs are not downloaded again.
 
-    try:
-        # Get xml
-        response = session.get(catalog, stream=True)
-        response.raise_for_status()
+    revalidate - if False, cached catalogs are used without a request to the server
 
-        xml = ET.fromstring(response.content)
+    Returns catalog content as bytes
+    """
+    xmlpath, hdrpath = _cache_paths(catalog)
+    cached = cache and os.path.exists(xmlpath) and os.path.exists(hdrpath)
+    if cached and not revalidate:
+        with open(xmlpath, 'rb') as f:
+            return f.read()
 
-        for subdir in xml.iterfind('.//{%s}catalogRef' % ns['thredds']):
-            link = subdir.get('{%s}href' % ns['xlink'])
-            for dataset in crawl(urljoin(catalog, link), session):
-                yield dataset
+    headers = {}
+    if cached:
+        with open(hdrpath) as f:
+            validators = json.load(f)
+        if validators.get('etag'): headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'): headers['If-Modified-Since'] = validators['last_modified']
 
-        for dataset in xml.iterfind('.//{%s}access' % ns['thredds']):
-            if dataset.attrib['serviceName'] == 'dap': yield dataset.attrib['urlPath']
+    response = session.get(catalog, headers=headers)
+    if cached and response.status_code == 304:
+        with open(xmlpath, 'rb') as f:
+            return f.read()
+    response.raise_for_status()
 
-    except requests.exceptions.HTTPError as e:
-        # handle any errors here
-        print(e)
+    if cache:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        _write_atomic(xmlpath, response.content)
+        _write_atomic(hdrpath, json.dumps({'url': catalog,
+                                           'etag': response.headers.get('ETag'),
+                                           'last_modified': response.headers.get('Last-Modified')}),
+                      mode='w')
+    return response.content
 
+def parse_catalog(catalog, content):
+    """
+    Returns urls of child catalogs and urlPaths of datasets served by OPeNDAP
+    in a THREDDS catalog
+    """
+    xml = ET.fromstring(content)
+    children = [urljoin(catalog, subdir.get('{%s}href' % NS['xlink']))
+                for subdir in xml.iterfind('.//{%s}catalogRef' % NS['thredds'])]
+    datasets = [dataset.attrib['urlPath'] for dataset in xml.iterfind('.//{%s}access' % NS['thredds'])
+                if dataset.attrib['serviceName'] == 'dap']
+    return children, datasets
 
-def nasa_crawler(catalog, filo=None, to_stdout=False):
+def crawl(catalog, session, workers=8, cache=True, revalidate=True):
+    """
+    Crawls a THREDDS catalog and the catalogs it references, fetching up to
+    workers catalogs concurrently.  Dataset urlPaths are yielded as they are
+    found, so the order depends on which catalogs are returned first.  Each
+    catalog is fetched once, even if it is referenced by several catalogs.
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    def _get(url):
+        return parse_catalog(url, fetch_catalog(url, session, cache=cache, revalidate=revalidate))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(_get, catalog): catalog}
+        seen = {catalog}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                url = pending.pop(future)
+                try:
+                    children, datasets = future.result()
+                except requests.exceptions.HTTPError as e:
+                    # handle any errors here
+                    print(e)
+                    continue
+                for child in children:
+                    if child in seen: continue
+                    seen.add(child)
+                    pending[executor.submit(_get, child)] = child
+                for dataset in datasets:
+                    yield dataset
+
+
+def nasa_crawler(catalog, filo=None, to_stdout=False, workers=8, cache=True, revalidate=True,
+                 login=True):
         #reanalysis, variable, time_resolution='hourly', year=None, month=None, filo=None, to_stdout=False):
     """
     Explores NASA catalogs for a given data product and returns a list of files.
 
     ****** Currently takes xml catalog url as argument *****
 
-    The search can be limited to year and month.
+    Catalogs are fetched concurrently and cached on disk, and dataset urls are
+    written as they are found.
 
     Arguments
     ---------
-    reanalysis - Name of NASA reanalysis (e.g. MERRA or MERRA2)
-    product -    Shortname for data product: e.g. MAT1NXFLX
-    time_resolution - daily or monthly (default daily)
-    year -       Year to search (default is None - search all years)
-    month -      Month to search (default is None - search all months for a given year).
-                 Is ignored is year is not set.
+    catalog -    url of THREDDS XML catalog
     filo -       File to write list to - if no filo set then filename is
-                 <reanalysis>_<product>_filelist.txt
+                 <product>_filelist.txt, where product is the catalog directory
+    to_stdout -  print list instead of writing to file
+    workers -    number of catalogs fetched concurrently
+    cache -      cache catalogs in CACHE_DIR
+    revalidate - check cached catalogs with the server.  If False, cached catalogs
+                 are used as they are
+    login -      authenticate with Earthdata Login credentials in .netrc.  Set to
+                 False for servers that do not need authentication
 
     Returns
     -------
@@ -110,30 +196,37 @@ def nasa_crawler(catalog, filo=None, to_stdout=False):
     """
     
     # create session with the user credentials that will be used to authenticate access to the data    
-    info = netrc.netrc()
-    username, account, password = info.authenticators(urlparse(AUTH_HOST).hostname)
-    session = SessionWithHeaderRedirection(username, password)
+    if login:
+        info = netrc.netrc()
+        username, account, password = info.authenticators(urlparse(AUTH_HOST).hostname)
+        session = SessionWithHeaderRedirection(username, password)
+    else:
+        session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
 
     # Get the url of the file we wish to retrieve
     #catalog = get_product_url(reanalysis, time_resolution, variable, year=year)
 
     # Get all datasets underneath the catalog url
-    dataset_list = crawl(catalog, session)
+    dataset_list = crawl(catalog, session, workers=workers, cache=cache, revalidate=revalidate)
 
     # Add servername to dataset
-    server = re.search('(https.+)(?=/MERRA)',catalog).groups()[0]
-    fileList = [server+dataset for dataset in dataset_list]
+    server = re.search('(https?.+)(?=/MERRA)',catalog).groups()[0]
 
     # Write to file
     if to_stdout:
-        for dataset in fileList:
-            print (dataset)
+        for dataset in dataset_list:
+            print (server+dataset, flush=True)
     else:
-        if not filo: filo = os.path.join('.','{:s}_{:s}_filelist.txt'.format(reanalysis,variable))
-        f = open(filo, 'w')
-        for dataset in fileList:
-            f.write(dataset+'\n')
-        f.close()
+        if not filo:
+            product = os.path.basename(os.path.dirname(urlparse(catalog).path))
+            filo = os.path.join('.','{:s}_filelist.txt'.format(product))
+        with open(filo, 'w') as f:
+            for dataset in dataset_list:
+                f.write(server+dataset+'\n')
+                f.flush()
 
     session.close()
     
@@ -157,10 +250,19 @@ if __name__ == "__main__":
 #    parser.add_argument('--time_resolution', '-tr', type=str, action='store', default='hourly',
 #                        help='Time resolution for data (hourly, daily, monthly)')
     parser.add_argument('--to_stdout', '-so', action='store_true')
+    parser.add_argument('--workers', '-w', type=int, default=8,
+                        help='Number of catalogs fetched concurrently')
+    parser.add_argument('--no_cache', action='store_true',
+                        help='Do not cache catalogs')
+    parser.add_argument('--no_revalidate', action='store_true',
+                        help='Use cached catalogs without checking the server')
+    parser.add_argument('--no_login', action='store_true',
+                        help='Do not authenticate, e.g. for a local test server')
     
     args = parser.parse_args()
 
 #    nasa_crawler(args.reanalysis, args.variable, year=args.year, month=args.month,
 #                 time_resolution=args.time_resolution, filo=args.fileout, to_stdout=args.to_stdout)
 
-    nasa_crawler(args.catalog, filo=args.fileout, to_stdout=args.to_stdout)
+    nasa_crawler(args.catalog, filo=args.fileout, to_stdout=args.to_stdout, workers=args.workers,
+                 cache=not args.no_cache, revalidate=not args.no_revalidate, login=not args.no_login)
@@ -0,0 +1,101 @@
+#----------------------------------------------------------------------
+# Aggregates monthly PRECIP_STATS to seasons, years and other periods.
+#
+# A period is a list of months.  If the list wraps past December, e.g.
+# August to April, months from the start of the list are assigned to
+# the following year, so periods are labelled with the year of their
+# last month.
+#----------------------------------------------------------------------
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+# Months in each named period
+PERIODS = {
+    'annual': [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12],
+    'accumulation': [8, 9, 10, 11, 12, 1, 2, 3, 4],
+    'water_year': [10, 11, 12, 1, 2, 3, 4, 5, 6, 7, 8, 9],
+    'DJF': [12, 1, 2],
+    'MAM': [3, 4, 5],
+    'JJA': [6, 7, 8],
+    'SON': [9, 10, 11],
+}
+
+
+def period_months(period):
+    """
+    Returns list of months for a period
+
+    period - name of period in PERIODS or list of months
+    """
+    if isinstance(period, str):
+        try:
+            return PERIODS[period]
+        except KeyError:
+            raise ValueError(f'Unknown period {period}: expected one of {list(PERIODS.keys())} or a list of months')
+    return list(period)
+
+
+def period_label(time, period):
+    """
+    Returns the year each time belongs to for a period, and a mask for times
+    in the period
+
+    time - DatetimeIndex or array of datetime64
+    period - name of period in PERIODS or list of months
+    """
+    months = period_months(period)
+    time = pd.DatetimeIndex(time)
+    wraps = months[0] > months[-1]
+    label = time.year + (wraps & (time.month >= months[0]))
+    return np.asarray(label), np.asarray(time.month.isin(months))
+
+
+def period_stats(ds, period='accumulation'):
+    """
+    Calculates precipitation statistics for every period in a Dataset of monthly
+    PRECIP_STATS in one grouped reduction.  Periods without all months are NaN.
+
+    ds - Dataset with prectot, wetday_total and wetday_frequency, and a time coordinate
+    period - name of period in PERIODS or list of months
+
+    Returns
+    -------
+    Dataset with precTot, wetdayTot, nwetdays, fwetdays and wetdayAve, and time
+    coordinate of January 1st of the year of the last month of each period
+    """
+    import calendar
+
+    label, inperiod = period_label(ds['time'].values, period)
+    ds = ds.isel(time=np.flatnonzero(inperiod))
+    label = label[inperiod]
+    time = pd.DatetimeIndex(ds['time'].values)
+
+    nmonth = len(period_months(period))
+    year = xr.DataArray(label, coords=[ds['time']], dims=['time'], name='period')
+    ndays = xr.DataArray([calendar.monthrange(d.year, d.month)[1] for d in time],
+                         coords=[ds['time']], dims=['time'])
+
+    # Sum totals
+    totals = ds[['prectot', 'wetday_total']].groupby(year).sum(dim='time', min_count=nmonth, keep_attrs=True)
+    precTot = totals['prectot']
+    wetdayTot = totals['wetday_total']
+
+    # Calculate wetday count and wetday frequency
+    nwetdays = (ds['wetday_frequency']*ndays).groupby(year).sum(dim='time', min_count=nmonth, keep_attrs=True)
+    fwetdays = nwetdays / ndays.groupby(year).sum(dim='time')
+
+    # Calculate mean precip on wetdays
+    wetdayAve = wetdayTot.where(wetdayTot > 0.) / nwetdays
+
+    newDs = xr.Dataset({'precTot': precTot,
+                        'wetdayTot': wetdayTot,
+                        'nwetdays': nwetdays,
+                        'fwetdays': fwetdays,
+                        'wetdayAve': wetdayAve})
+    newDs = newDs.rename({'period': 'time'})
+    newDs.coords['time'] = [dt.datetime(y,1,1) for y in newDs['time'].values]
+
+    return newDs
@@ -23,13 +23,8 @@ def precip_stats_by_region_to_time_series(reanalysis, verbose=False):
     ds = util.load_annual_accumulation(reanalysis)
     mask = util.read_region_mask()
 
-    region_mean = []
-    for region_name in arctic_mask_region.keys():
-        if verbose: print (f'   Getting regional stats for {region_name}...')
-        region_mean.append(util.region_stats(ds, mask, region_name).to_dataframe())
-
-    if verbose: print ('   Concatentating dataframes...')
-    dfSeries = pd.concat(region_mean, axis=1, keys=arctic_mask_region.keys()) 
+    if verbose: print ('   Getting regional stats...')
+    dfSeries = util.region_stats_table(ds, mask, regions=arctic_mask_region)
 
     print (dfSeries.head())
     
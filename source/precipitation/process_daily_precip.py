@@ -39,25 +39,124 @@ def get_precip_statistics(fileGlob, reanalysis, threshold=1.):
         print ( '% get_precip_statistics: Unable to open {}'.format(fileGlob) )
         raise
         
-    wd_mean = util.wetday_mean(ds[varName], threshold=threshold)
-    wd_freq = util.wetdays(ds[varName], threshold=threshold)
-    wd_total = util.wetday_total(ds[varName], threshold=threshold)
-    wd_max   = util.wetday_max(ds[varName], threshold=threshold)
-    prectot = util.all_total(ds[varName])
-
-    dsOut = xr.Dataset({'wetday_mean': wd_mean,
-                        'wetday_frequency': wd_freq,
-                        'wetday_total': wd_total,
-                        'wetday_max': wd_max,
-                        'prectot': prectot})
+    dsOut, _ = util.precip_stats(ds[varName], threshold=threshold)
     if 'latitude' in ds: dsOut['latitude'] = ds['latitude']
     if 'longitude' in ds: dsOut['longitude'] = ds['longitude']
     
     return dsOut
 
+PRECIP_STATS_ENCODING = {'wetday_mean': {'zlib': True, '_FillValue': -999.},
+                         'wetday_frequency': {'zlib': True, '_FillValue': -999.},
+                         'wetday_total': {'zlib': True, '_FillValue': -999.},
+                         'wetday_max': {'zlib': True, '_FillValue': -999.},
+                         'prectot': {'zlib': True, '_FillValue': -999.},}
+
+def write_precip_statistics(ds, filo):
+    """
+    Writes a PRECIP_STATS dataset to netCDF.  The file is written to a temporary
+    file in the output directory and then renamed, so an interrupted or failed
+    write never leaves a partial output file.
+    """
+    import os
+
+    tmpfile = '{}.{:d}.tmp'.format(filo, os.getpid())
+    try:
+        ds.to_netcdf(tmpfile, encoding=PRECIP_STATS_ENCODING)
+        os.replace(tmpfile, filo)
+    except Exception:
+        if os.path.exists(tmpfile): os.remove(tmpfile)
+        raise
+    return
+
+def process_one_month(f, reanalysis, variable, threshold=1., verbose=False):
+    """
+    Generates and writes statistics for a single month
+
+    f - file glob for daily files in the month
+
+    Returns
+    -------
+    f, error message or None if the month was processed
+    """
+    if verbose:
+        print ( '    Generating statistics for {}'.format(util.date_from_filename(f).strftime('%Y%m')) )
+
+    try:
+        ds = get_precip_statistics(f, reanalysis, threshold=threshold)
+        filo = util.make_outfile(f, reanalysis, variable)
+        if verbose:
+            print ( '    Writing statistics to {}'.format(filo) )
+        write_precip_statistics(ds, filo)
+    except Exception as err:
+        return f, '{}: {}'.format(type(err).__name__, err)
+
+    return f, None
+
+def input_signature(f, threshold=1.):
+    """
+    Returns a record of the daily input files for a month and the wetday threshold.
+    Used to decide whether a month needs to be recomputed.
+
+    f - file glob for daily files in the month
+    """
+    import glob
+    import os
+
+    inputs = []
+    for path in sorted(glob.glob(f)):
+        st = os.stat(path)
+        inputs.append([path, st.st_mtime, st.st_size])
+    return {'inputs': inputs, 'threshold': threshold}
+
+def default_manifest_path(fileList, reanalysis, variable):
+    """
+    Returns path to the manifest file in the variable directory of the first month
+    e.g. .../PRECTOT/MERRA2.PRECIP.manifest.json
+    """
+    import os
+    if not fileList:
+        raise ValueError('default_manifest_path: fileList is empty')
+    vardir = os.path.dirname(os.path.dirname(os.path.dirname(fileList[0])))
+    return os.path.join(vardir, '{}.{}.manifest.json'.format(reanalysis, variable))
+
+def read_manifest(path):
+    """Reads a manifest of processed months.  Returns an empty manifest if none exists"""
+    import json
+    import os
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def write_manifest(manifest, path):
+    """Writes the manifest of processed months, replacing the old file in one step"""
+    import json
+    import os
+
+    tmpfile = '{}.{:d}.tmp'.format(path, os.getpid())
+    with open(tmpfile, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmpfile, path)
+    return
+
 def process_daily_precip(reanalysis, variable, start_date=None, end_date=None,
-                         threshold=1., verbose=False, grid=None):
-    '''Processes monthly precipitation statistics for a daterange'''
+                         threshold=1., verbose=False, grid=None, workers=1,
+                         incremental=False, manifest=None):
+    '''
+    Processes monthly precipitation statistics for a daterange
+
+    workers - number of processes used to process months in parallel
+    incremental - only process months where the output file is missing, or the daily
+                  input files or threshold have changed since the output was written.
+                  Input file mtimes and sizes, and the threshold, are recorded for each
+                  output file in a manifest.
+    manifest - path to manifest file.  Default is {reanalysis}.{variable}.manifest.json
+               in the variable directory.
+
+    Returns
+    -------
+    dict of failed months {fileGlob: error message}
+    '''
 
     if not start_date: start_date='19790101'
     if not end_date: end_date=dt.datetime.today().strftime('%Y%m%d')
@@ -66,27 +165,48 @@ def process_daily_precip(reanalysis, variable, start_date=None, end_date=None,
         print ( '% Processing {} from {} for {} to {}'.format(variable, reanalysis, start_date, end_date) )
 
     fileList = util.make_fileList(reanalysis, variable, (start_date, end_date), grid=grid)
-
-    for f in fileList:
-
+    if not fileList:
+        print ('% process_daily_precip: no daily files found for {} to {}'.format(start_date, end_date))
+        return {}
+
+    if incremental:
+        import os
+        if not manifest: manifest = default_manifest_path(fileList, reanalysis, variable)
+        records = read_manifest(manifest)
+        signature = {f: input_signature(f, threshold=threshold) for f in fileList}
+        outfile = {f: util.make_outfile(f, reanalysis, variable) for f in fileList}
+        fileList = [f for f in fileList
+                    if not os.path.exists(outfile[f]) or records.get(outfile[f]) != signature[f]]
         if verbose:
-            print ( '    Generating statistics for {}'.format(util.date_from_filename(f).strftime('%Y%m')) )
-
-        try:
-            ds = get_precip_statistics(f, reanalysis, threshold=threshold)
-        except IOError:
-            print ('get_precip_statistics: could not read {:s}'.format(f))
-        else:
-            filo = util.make_outfile(f, reanalysis, variable)
-            if verbose:
-                print ( '    Writing statistics to {}'.format(filo) )
-                ds.to_netcdf(filo, encoding={'wetday_mean': {'zlib': True, '_FillValue': -999.},
-                                             'wetday_frequency': {'zlib': True, '_FillValue': -999.},
-                                             'wetday_total': {'zlib': True, '_FillValue': -999.},
-                                             'wetday_max': {'zlib': True, '_FillValue': -999.},
-                                             'prectot': {'zlib': True, '_FillValue': -999.},})
-                
-    return
+            print ( '% {:d} months need processing'.format(len(fileList)) )
+
+    def record(f, err):
+        # The manifest is updated as each month finishes, so months already written
+        # are not processed again if the run is interrupted
+        if incremental and not err:
+            records[outfile[f]] = signature[f]
+            write_manifest(records, manifest)
+
+    results = []
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(process_one_month, f, reanalysis, variable,
+                                       threshold=threshold, verbose=verbose) for f in fileList]
+            for future in as_completed(futures):
+                results.append(future.result())
+                record(*results[-1])
+    else:
+        for f in fileList:
+            results.append(process_one_month(f, reanalysis, variable, threshold=threshold, verbose=verbose))
+            record(*results[-1])
+
+    failed = {f: err for f, err in results if err}
+
+    for f, err in failed.items():
+        print ('% process_daily_precip: failed to process {:s}: {:s}'.format(f, err))
+        
+    return failed
 
 if __name__ == "__main__":
 
@@ -105,12 +225,22 @@ if __name__ == "__main__":
                         help='Threshold for wetday')
     parser.add_argument('-v', '--verbose', action='store_true')
     parser.add_argument('--grid', '-g', type=str, action='store', default=None)
+    parser.add_argument('--workers', '-w', type=int, action='store', default=1,
+                        help='Number of processes used to process months in parallel')
+    parser.add_argument('--incremental', '-i', action='store_true',
+                        help='Only process months that are missing or whose inputs have changed')
+    parser.add_argument('--manifest', '-m', type=str, action='store', default=None,
+                        help='Path to manifest used by --incremental')
     
     args = parser.parse_args()
     
-    process_daily_precip(args.reanalysis, args.variable,
-                         start_date=args.start_date, end_date=args.end_date,
-                         threshold=args.threshold, verbose=args.verbose, grid=args.grid)
+    failed = process_daily_precip(args.reanalysis, args.variable,
+                                  start_date=args.start_date, end_date=args.end_date,
+                                  threshold=args.threshold, verbose=args.verbose, grid=args.grid,
+                                  workers=args.workers, incremental=args.incremental,
+                                  manifest=args.manifest)
+    if failed:
+        raise SystemExit(1)
     
 
     
@@ -6,9 +6,12 @@
 
 import os
 import glob
+import numpy as np
 import xarray as xr
 import pandas as pd
 
+from utilities import accumulate_to_daily, RATE_UNITS
+
 vartable = {'PRECTOT': 'TPRAT_GDS4_SFC_ave3h',
             'PRECSNO': 'SRWEQ_GDS4_SFC_ave3h',
             'T2M': 'TMP_GDS4_HTGL'}
@@ -19,6 +22,11 @@ rawfile = {'PRECTOT': 'fcst_phy2m.061_tprat.reg_tl319',
            'PRECSNO': 'fcst_phy2m.064_srweq.reg_tl319',
            'T2M': 'anl_surf.011_tmp.reg_tl319'}
 
+# 3h average rates in the NCL-converted RDA files are in mm/day.  Fields with
+# missing or unrecognised units are assumed to be mm/day, which is what the
+# daily mean of 3h rates used before gave daily totals in mm for.
+JRA55_RATE_UNITS = 'mm/day'
+
 #diri = '/disks/arctic5_raid/abarrett/JRA55'
 diri = '/projects/arctic_scientist_data/Reanalysis/JRA55/daily'
 
@@ -56,6 +64,35 @@ def write_to_netcdf(da, fileout):
 
     return 0
     
+def stack_forecast_time(da):
+    """
+    Stacks initial time and forecast time of 3h average fields into a single
+    time dimension stamped at the end of each 3h period
+    """
+    da = da.transpose('initial_time0_hours', 'forecast_time1', ...)
+    ft = da['forecast_time1'].values
+    if not np.issubdtype(ft.dtype, np.timedelta64):
+        ft = (ft*3600).astype('timedelta64[s]')
+    time = (da['initial_time0_hours'].values[:,np.newaxis] + ft[np.newaxis,:]).ravel()
+
+    dims = ('time',) + da.dims[2:]
+    coords = {name: da.coords[name] for name in da.dims[2:] if name in da.coords}
+    coords['time'] = time
+    return xr.DataArray(da.values.reshape((-1,) + da.shape[2:]), dims=dims, coords=coords,
+                        name=da.name, attrs=da.attrs)
+
+def check_rate_units(da):
+    """
+    Returns da with units attribute that accumulate_to_daily recognises.  If the
+    units are missing or unknown, JRA55_RATE_UNITS are assumed.
+    """
+    units = da.attrs.get('units')
+    if units not in RATE_UNITS:
+        print ('% process_jra55_raw: units {} of {} not recognised, assuming {}'.format(units, da.name,
+                                                                                       JRA55_RATE_UNITS))
+        da = da.assign_attrs(units=JRA55_RATE_UNITS)
+    return da
+
 def process_one_file(fili, varName, verbose=False):
     
     ds = xr.open_dataset(fili)
@@ -64,10 +101,12 @@ def process_one_file(fili, varName, verbose=False):
     if varName == 'T2M':
         daysum = da.resample(initial_time0_hours='D').mean(
                dim='initial_time0_hours')
+        daysum.attrs = da.attrs
     else:
-        daysum = da.resample(initial_time0_hours='D').mean(
-               dim=['initial_time0_hours','forecast_time1'])
-    daysum.attrs = da.attrs
+        # Daily totals from 3h average rates
+        daysum = accumulate_to_daily(stack_forecast_time(check_rate_units(da)), input_freq_hours=3,
+                                     time_stamp='end', rate=True)
+        daysum = daysum.rename({'time': 'initial_time0_hours'})
     daysum = daysum.rename(varName)
     
     for time in daysum.coords['initial_time0_hours']:
@@ -3,6 +3,8 @@
 import xarray as xr
 import numpy as np
 
+from precipitation.periods import period_label, period_stats
+
 def fname(reanalysis):
     '''
     Generates a file glob for PRECIP_STATS
@@ -148,20 +150,76 @@ def process_one_period(reanalysis, year, grid=None, verbose=False):
 
     return newDs
 
-def make_outfile(reanalysis, grid=None):
+def make_cube_fileList(reanalysis, start_year, end_year, grid=None, period='accumulation'):
+    '''
+    Generates a list of files containing monthly statistics for all periods ending in
+    start_year to end_year.  Each month is listed once.
+
+    period - name of period in periods.PERIODS or list of months
+
+    Returns list of files and dates
+    '''
+    import pandas as pd
+    import datetime as dt
+
+    date = pd.date_range(dt.datetime(start_year-1,1,1), dt.datetime(end_year,12,31), freq='M')
+    label, inperiod = period_label(date, period)
+    date = date[inperiod & (label >= start_year) & (label <= end_year)]
+
+    return [filePath(reanalysis, d, grid=grid) for d in date], date
+
+def read_monthly_cube(reanalysis, start_year, end_year, grid=None, period='accumulation', verbose=False):
+    '''
+    Reads monthly statistics for all periods from start_year to end_year into a
+    single Dataset, reading each file once.  Missing files are skipped.
+    '''
+    import os
+
+    fileList, date = make_cube_fileList(reanalysis, start_year, end_year, grid=grid, period=period)
+    exists = np.array([os.path.exists(f) for f in fileList])
+    if not exists.all():
+        print ('%read_monthly_cube: {:d} files do not exist'.format((~exists).sum()))
+
+    if verbose: print ('     Reading {:d} monthly files'.format(exists.sum()))
+    return read_files_in_list([f for f, e in zip(fileList, exists) if e], date[exists], reanalysis)
+
+def accumulation_period_stats(ds):
+    '''
+    Calculates statistics for every accumulation period in a Dataset of monthly
+    statistics.  See periods.period_stats
+    '''
+    return period_stats(ds, 'accumulation')
+
+def period_name(period):
+    '''Returns name of period used in file names'''
+    if isinstance(period, str):
+        return period
+    return 'months_' + '_'.join(str(m) for m in period)
+
+def make_outfile(reanalysis, grid=None, period='accumulation'):
     from constants import filepath, vnamedict
     import os
     if reanalysis == 'ERA-Interim':
         diro = '/'.join(filepath[reanalysis]['path'].split('/')[:-1]).format(vnamedict[reanalysis]['PRECIP']['name'])
-        filo = filepath[reanalysis]['ffmt'].format('PRECIP_STATS','x').replace('x.day','accumulation.annual')
+        filo = filepath[reanalysis]['ffmt'].format('PRECIP_STATS','x').replace('x.day','{}.annual'.format(period_name(period)))
     else:
         diro = '/'.join(filepath[reanalysis]['path'].split('/')[:-2]).format(vnamedict[reanalysis]['PRECIP']['name'])
-        filo = filepath[reanalysis]['ffmt'].format('PRECIP_STATS','x').replace('x??','accumulation.annual')
+        filo = filepath[reanalysis]['ffmt'].format('PRECIP_STATS','x').replace('x??','{}.annual'.format(period_name(period)))
     if grid:
         filo = filo.replace('.nc','.{:s}.nc'.format(grid))
     return os.path.join(diro,filo)
 
-def process_precip_stats(reanalysis, start_year=1981, end_year=2017, grid=None, verbose=False):
+def process_precip_stats(reanalysis, start_year=1981, end_year=2017, grid=None, verbose=False,
+                         cube=False, period='accumulation'):
+    '''
+    Calculates period statistics for periods ending in start_year to end_year
+
+    cube - if True, monthly files are read once into a single Dataset and all periods
+           are calculated together.  Otherwise, each period is read and calculated
+           separately.
+    period - name of period in periods.PERIODS or list of months.  Periods other
+             than accumulation are always calculated from a single Dataset
+    '''
     import datetime as dt
 
     if start_year < 1981:
@@ -169,10 +227,15 @@ def process_precip_stats(reanalysis, start_year=1981, end_year=2017, grid=None,
     
     if verbose: print ('%  Processing {} PRECIP_STATS for {:d} to {:d}'.format(reanalysis, start_year, end_year))
     year = np.arange(start_year,end_year+1)
-    ds = xr.concat([process_one_period(reanalysis, y, grid=grid, verbose=verbose) for y in year], 'time')
-    ds.coords['time'] = [dt.datetime(y,1,1) for y in year]
+    if cube or (period != 'accumulation'):
+        ds = period_stats(read_monthly_cube(reanalysis, start_year, end_year, grid=grid,
+                                            period=period, verbose=verbose), period)
+        ds = ds.reindex(time=[dt.datetime(y,1,1) for y in year])
+    else:
+        ds = xr.concat([process_one_period(reanalysis, y, grid=grid, verbose=verbose) for y in year], 'time')
+        ds.coords['time'] = [dt.datetime(y,1,1) for y in year]
     
-    filo = make_outfile(reanalysis, grid=grid)
+    filo = make_outfile(reanalysis, grid=grid, period=period)
     if verbose: print ('%  writing {} PRECIP_STATS to {}'.format(reanalysis, filo))
     ds.to_netcdf(filo,
                  encoding={'precTot': {'zlib': True, 'complevel': 9},
@@ -199,8 +262,17 @@ if __name__ == "__main__":
     parser.add_argument('--grid', metavar='grid', type=str, default=None,
                         help='Name of grid - None is native grid')
     parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('--cube', action='store_true',
+                        help='Read monthly files once and calculate all periods together')
+    parser.add_argument('--period', type=str, default='accumulation',
+                        help='Name of period (annual, accumulation, water_year, DJF, MAM, JJA, SON) ' + \
+                        'or comma separated list of months, e.g. 11,12,1')
     args = parser.parse_args()
 
-    process_precip_stats(args.reanalysis, start_year=args.start_year, end_year=args.end_year, grid=args.grid, verbose=args.verbose)
+    period = args.period
+    if ',' in period: period = [int(m) for m in period.split(',')]
+
+    process_precip_stats(args.reanalysis, start_year=args.start_year, end_year=args.end_year, grid=args.grid, verbose=args.verbose,
+                         cube=args.cube, period=period)
     
 
@@ -9,8 +9,9 @@ import os
 
 import datetime as dt
 import calendar
+import functools
 
-from precipitation.constants import filepath, vnamedict, arctic_mask_region
+from precipitation.constants import filepath, vnamedict, arctic_mask_region, arctic_mask_region_group
 from precipitation.constants import accumulation_period_filepath, annual_total_filepath
 
 def _glob_precip_stats_dirpath(reanalysis):
@@ -190,7 +191,7 @@ def wetday_mean(da, threshold=1.):
     mask = da.count(dim='time') == nday  # Mask cells with less than nday
 
     result = apply_threshold(da, threshold=threshold).mean(dim='time', keep_attrs=True)
-    result = xr.where(mask & xr.ufuncs.isnan(result), 0., result)
+    result = xr.where(mask & result.isnull(), 0., result)
     
     return result.where(mask)
 
@@ -259,6 +260,145 @@ def all_total(da):
     nday = daysinmonth(da.time.values[0])
     return da.sum(dim='time', min_count=nday, keep_attrs=True)
 
+def precip_stats(da, threshold=1.):
+    '''
+    Returns wetday_mean, wetday_frequency, wetday_total, wetday_max and prectot
+    for a month of daily precipitation, computed in a single pass over the data.
+
+    Results are the same as calling wetday_mean, wetdays, wetday_total, wetday_max
+    and all_total separately, but the daily values are only read into memory once and
+    the days-in-month and completeness mask are only calculated once.
+
+    da - data array containing precipitation with a time dimension
+    threshold - threshold to distinguish wet days (default 1 mm/day)
+
+    Returns
+    -------
+    stats - xarray Dataset with the five statistics
+    mask - boolean DataArray, True for cells with a value for every day in the month
+    '''
+    nday = daysinmonth(da.time.values[0])
+
+    x = np.moveaxis(np.asarray(da.values), da.get_axis_num('time'), 0)
+    template = da.isel(time=0, drop=True)
+
+    with np.errstate(all='ignore'):
+        isvalid = ~np.isnan(x)
+        count = isvalid.sum(axis=0)
+        mask = count == nday
+
+        # apply_threshold keeps x >= threshold, wetdays counts x > threshold
+        iswet = x >= threshold
+        nwet = (x > threshold).sum(axis=0)
+
+        wd_total = np.where(iswet, x, 0.).sum(axis=0, dtype=x.dtype)
+        nwet_ge = iswet.sum(axis=0)
+        wd_mean = np.where(nwet_ge > 0, wd_total / np.maximum(nwet_ge, 1), 0.).astype(x.dtype)
+        wd_max = np.where(isvalid, x, -np.inf).max(axis=0)
+        prectot = np.where(isvalid, x, 0.).sum(axis=0, dtype=x.dtype)
+        fwet = nwet.astype(float) / float(nday)
+
+    def _to_dataarray(values, valid, attrs):
+        result = template.copy(data=np.where(valid, values, np.nan).astype(values.dtype))
+        result.attrs = attrs
+        return result
+
+    fwet_attrs = dict(da.attrs)
+    fwet_attrs['units'] = 'none'
+
+    stats = xr.Dataset({'wetday_mean': _to_dataarray(wd_mean, mask, dict(da.attrs)),
+                        'wetday_frequency': _to_dataarray(fwet, mask, fwet_attrs),
+                        'wetday_total': _to_dataarray(wd_total, mask, dict(da.attrs)),
+                        'wetday_max': _to_dataarray(wd_max, mask, dict(da.attrs)),
+                        'prectot': _to_dataarray(prectot, count >= nday, dict(da.attrs))})
+
+    return stats, template.copy(data=mask)
+
+# Rate units and the factor that converts them to mm per second.  Values in
+# any other units are assumed to be accumulations over the input time step.
+RATE_UNITS = {'kg m-2 s-1': 1.,
+              'kg/m2/s': 1.,
+              'mm/s': 1.,
+              'mm/h': 1./3600.,
+              'mm/day': 1./86400.,
+              'mm day-1': 1./86400.}
+
+def accumulate_to_daily(da, input_freq_hours=6, offset=0, time_stamp='end', rate=None):
+    """
+    Calculates daily accumulations from sub-daily reanalysis data in a single
+    vectorized reduction.  Days are accumulated from offset hours on one day to
+    offset hours on the next, and are labelled with the start of the day.  Days
+    without a value for every time step are set to NaN.  Missing values at
+    existing time steps are treated as zero.
+
+    Arguments
+    ---------
+    da - xarray DataArray with a time dimension
+    input_freq_hours - time step of the input data in hours, e.g. 1 (MERRA, MERRA2),
+                       3 (JRA55) or 6 (CFSR).  Must divide 24.
+    offset - hour at which days start
+    time_stamp - position of the time stamp in the period it represents: end (e.g. the
+                 06:00 value is for 00:00 to 06:00), start or center
+    rate - True if values are rates, False if accumulations.  If None, rates are
+           identified from the units attribute using RATE_UNITS
+
+    Returns
+    -------
+    DataArray of daily accumulations.  Rates are converted to mm.
+    """
+    if 24 % input_freq_hours:
+        raise ValueError('input_freq_hours must divide 24, got {}'.format(input_freq_hours))
+    nexpect = 24 // input_freq_hours
+    step = np.timedelta64(int(input_freq_hours*3600), 's')
+    day = np.timedelta64(1, 'D')
+    shift = np.timedelta64(int(offset*3600), 's')
+
+    units = da.attrs.get('units')
+    if rate is None:
+        rate = units in RATE_UNITS
+    if rate and units not in RATE_UNITS:
+        raise ValueError('Unknown rate units {}: expected one of {}'.format(units, list(RATE_UNITS.keys())))
+    scale = RATE_UNITS.get(units, 1.) * input_freq_hours * 3600. if rate else 1.
+
+    # Start of the period each value represents
+    time = da['time'].values
+    start = {'end': time - step, 'start': time, 'center': time - step/2}[time_stamp]
+    label = (start - shift).astype('datetime64[D]') + shift
+    first = label.min()
+    iday = ((label - first) // day).astype(int)
+    islot = ((start - label) // step).astype(int)
+    nday = iday.max() + 1
+
+    x = np.moveaxis(np.asarray(da.values), da.get_axis_num('time'), 0)
+    x = np.where(np.isnan(x), 0, x)
+    if np.array_equal(iday*nexpect + islot, np.arange(nday*nexpect)):
+        # Complete, ordered days can be reshaped without copying
+        block = x.reshape((nday, nexpect) + x.shape[1:])
+        complete = np.ones(nday, dtype=bool)
+    else:
+        block = np.zeros((nday, nexpect) + x.shape[1:], dtype=x.dtype)
+        present = np.zeros((nday, nexpect), dtype=bool)
+        block[iday, islot] = x
+        present[iday, islot] = True
+        complete = present.all(axis=1)
+
+    total = block.sum(axis=1)
+    if scale != 1.:
+        total = total * np.asarray(scale, dtype=total.dtype)
+    if not complete.all():
+        total = total.astype(np.result_type(total.dtype, np.float32))
+        total[~complete] = np.nan
+
+    attrs = dict(da.attrs)
+    if rate:
+        attrs['units'] = 'mm'
+
+    dims = ('time',) + tuple(d for d in da.dims if d != 'time')
+    coords = {name: c for name, c in da.coords.items() if 'time' not in c.dims}
+    coords['time'] = (first + np.arange(nday) * day).astype('datetime64[ns]')
+    result = xr.DataArray(total, dims=dims, coords=coords, name=da.name, attrs=attrs)
+    return result.transpose(*da.dims)
+
 def daysinmonth(dt64):
     """Returns numbers of days in a month for a given datetime object
 
@@ -298,32 +438,166 @@ def make_test_dataArray():
     return da
 
 
-def read_region_mask(grid='Nh50km'):
+REGION_MASK_PATH = {
+    'Nh50km': ('/oldhome/apbarret/data/seaice_indices/'
+               'Arctic_region_mask_Meier_AnnGlaciol2007_Nh50km.dat'),
+    }
+
+# Region masks are stored here as int8 .npy files, which are memory-mapped
+REGION_MASK_CACHE_DIR = os.environ.get('REGION_MASK_CACHE_DIR',
+                                       os.path.join(os.path.expanduser('~'), '.cache', 'region_mask'))
+
+
+@functools.lru_cache(maxsize=None)
+def _region_mask_array(grid='Nh50km'):
     """
-    Reads the Nh50km Arctic region mask and puts it into a xarray DataArray compatable with
-    the precip_stats Dataset
+    Returns the region mask as a read-only int8 array.  The first time a mask is
+    needed, the float64 mask is converted to an int8 file in REGION_MASK_CACHE_DIR.
+    The file is memory-mapped, and only loaded once per process.
     """
-
-    mask_path = ('/oldhome/apbarret/data/seaice_indices/'
-                 'Arctic_region_mask_Meier_AnnGlaciol2007_Nh50km.dat')
     nrow = 360
     ncol = 360
     
-    result = xr.DataArray(np.fromfile(mask_path, dtype=float).reshape(nrow,ncol),
-                          dims=['x','y'])
+    cache_path = os.path.join(REGION_MASK_CACHE_DIR,
+                              os.path.splitext(os.path.basename(REGION_MASK_PATH[grid]))[0] + '.int8.npy')
+    if not os.path.exists(cache_path):
+        mask = np.fromfile(REGION_MASK_PATH[grid], dtype=float).reshape(nrow,ncol)
+        os.makedirs(REGION_MASK_CACHE_DIR, exist_ok=True)
+        tmpfile = '{}.{:d}.tmp.npy'.format(cache_path[:-4], os.getpid())
+        np.save(tmpfile, mask.astype(np.int8))
+        os.replace(tmpfile, cache_path)
+    return np.load(cache_path, mmap_mode='r')
+
+
+def read_region_mask(grid='Nh50km'):
+    """
+    Reads the Nh50km Arctic region mask and puts it into a xarray DataArray compatable with
+    the precip_stats Dataset.  Region codes are int8.
+    """
+    return xr.DataArray(_region_mask_array(grid), dims=['x','y'])
+
+
+def region_codes(region):
+    """Returns list of codes for a region name in arctic_mask_region or arctic_mask_region_group"""
+    if region in arctic_mask_region:
+        return [arctic_mask_region[region]]
+    try:
+        return arctic_mask_region_group[region]
+    except KeyError:
+        raise ValueError(f'Unknown region {region}')
+
+
+@functools.lru_cache(maxsize=None)
+def region_mask(region, grid='Nh50km'):
+    """
+    Returns a read-only boolean array that is True for cells in a region or
+    group of regions, e.g. CENTRAL_ARCTIC_OCEAN
+    """
+    result = np.isin(_region_mask_array(grid), region_codes(region))
+    result.setflags(write=False)
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def region_flat_index(region, grid='Nh50km'):
+    """
+    Returns read-only flat indices of cells in a region or group of regions,
+    for use with arrays reshaped to (..., ncell)
+    """
+    result = np.flatnonzero(region_mask(region, grid))
+    result.setflags(write=False)
     return result
 
 
+def region_weights(mask, regions=None, area=None):
+    """
+    Returns a sparse (region x cell) weight matrix for regions in a mask
+
+    mask - DataArray or array of region codes
+    regions - dictionary of region names and codes, or lists of codes for groups of
+              regions.  Default is arctic_mask_region
+    area - optional cell areas with the same shape as mask.  If None, cells have
+           equal weight
+
+    Returns
+    -------
+    weights - scipy.sparse.csr_matrix with shape (nregion, ncell), cells flattened in
+              the order of mask
+    names - list of region names
+    """
+    from scipy import sparse
+
+    if regions is None: regions = arctic_mask_region
+    codes = np.asarray(mask).ravel()
+    cell_weight = np.ones(codes.size) if area is None else np.asarray(area, dtype=float).ravel()
+
+    rows, cols = [], []
+    for i, code in enumerate(regions.values()):
+        icell = np.flatnonzero(np.isin(codes, code))
+        rows.append(np.full(icell.size, i))
+        cols.append(icell)
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    weights = sparse.csr_matrix((cell_weight[cols], (rows, cols)), shape=(len(regions), codes.size))
+    return weights, list(regions.keys())
+
+
+def regions_mean(ds, mask, regions=None, area=None):
+    """
+    Calculates the mean of every variable over every region for all times with
+    one sparse matrix multiply per variable.  Missing values are excluded, as in
+    ds.where(mask == code).mean(dim=['x','y'])
+
+    ds - Dataset or DataArray with dimensions of mask
+    mask - DataArray of region codes, e.g. from read_region_mask
+    regions - dictionary of region names and codes, default is arctic_mask_region
+    area - optional cell areas for area weighted means
+
+    Returns Dataset or DataArray with a region dimension in place of the grid dimensions
+    """
+    weights, names = region_weights(mask, regions=regions, area=area)
+    grid_dims = list(mask.dims)
+
+    def _reduce(da):
+        other = [d for d in da.dims if d not in grid_dims]
+        x = da.transpose(*other, *grid_dims).values
+        x = x.reshape(-1, weights.shape[1])
+        valid = ~np.isnan(x)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = (weights @ np.where(valid, x, 0.).T) / (weights @ valid.T.astype(float))
+        mean = mean.T.reshape([da.sizes[d] for d in other] + [len(names)])
+        mean = mean.astype(np.result_type(da.dtype, np.float32))
+        coords = {name: c for name, c in da.coords.items() if not set(c.dims) & set(grid_dims)}
+        coords['region'] = names
+        return xr.DataArray(mean, dims=other + ['region'], coords=coords, name=da.name, attrs=da.attrs)
+
+    if isinstance(ds, xr.DataArray):
+        return _reduce(ds)
+    return xr.Dataset({name: _reduce(da) for name, da in ds.data_vars.items()
+                       if set(grid_dims) <= set(da.dims)})
+
+
 def region_stats(ds, mask, region_name):
     """
     Extracts stats for a given region from an EASE grid data set
     """
-    agg = ds.where(mask == arctic_mask_region[region_name]).mean(dim=['x','y'])
-    if 'latitude' in agg:
-        agg = agg.drop('latitude')
-    if 'longitude' in agg:
-        agg = agg.drop('longitude')
-    return agg
+    agg = regions_mean(ds, mask, regions={region_name: region_codes(region_name)})
+    return agg.sel(region=region_name, drop=True)
+
+
+def region_stats_table(ds, mask, regions=None, area=None):
+    """
+    Returns regional means as a dataframe with a column for each region, or
+    columns for each region and variable if ds is a Dataset.  Same layout as
+    concatenating region_stats(...).to_dataframe() for each region.
+    """
+    agg = regions_mean(ds, mask, regions=regions, area=area)
+    names = list(agg['region'].values)
+    if isinstance(agg, xr.DataArray):
+        return pd.concat([agg.sel(region=name, drop=True).to_series() for name in names],
+                         keys=names, axis=1)
+    return pd.concat([agg.sel(region=name, drop=True).to_dataframe() for name in names],
+                     keys=names, axis=1)
 
 
 def read_arctic_regional_stats(filepath):
@@ -357,30 +631,31 @@ def load_annual_total(reanalysis):
     return ds
 
 
-def read_latlon_region_mask():
-
+@functools.lru_cache(maxsize=None)
+def _read_latlon_region_mask():
     mask_path = ('/oldhome/apbarret/data/seaice_indices/'
                  'Arctic_region_mask_Meier_AnnGlaciol2007_latlon.tif')
-    mask = xr.open_rasterio(mask_path)[0,:,:]
+    mask = xr.open_rasterio(mask_path)[0,:,:].load()
     mask = mask.rename({'x': 'longitude', 'y': 'latitude'})
-    #mask.values = mask.values[:,::-1]
+    mask.values.setflags(write=False)
     return mask
 
 
+def read_latlon_region_mask():
+    """Reads the lat-lon Arctic region mask.  The file is only read once per process"""
+    #mask.values = mask.values[:,::-1]
+    return _read_latlon_region_mask().copy(deep=False)
+
+
 def get_central_arctic_mask(grid='Nh50km'):
     """Loads the Arctic region mask and selects central Arctic regions"""
     if grid == 'Nh50km':
         mask = read_region_mask()
+        central_arctic = mask.where(region_mask('CENTRAL_ARCTIC_OCEAN'))
     elif grid == 'latlon':
         mask = read_latlon_region_mask()
+        central_arctic = mask.where(mask.isin(region_codes('CENTRAL_ARCTIC_OCEAN')))
     else:
         raise ValueError("Unknown grid")
     
-    central_arctic = mask.where((mask == arctic_mask_region['CENTRAL_ARCTIC']) | \
-                                (mask == arctic_mask_region['BEAUFORT']) | \
-                                (mask == arctic_mask_region['CHUKCHI']) | \
-                                (mask == arctic_mask_region['LAPTEV']) | \
-                                (mask == arctic_mask_region['EAST_SIBERIAN']))
     return central_arctic
-
-
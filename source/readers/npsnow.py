@@ -10,7 +10,84 @@ import numpy as np
 import re
 import os
 import glob
+import functools
+import hashlib
 
+# Parsed station data are cached as Parquet files in CACHE_DIR.  Set the
+# NPSNOW_CACHE_DIR environment variable to use a different directory.
+CACHE_DIR = os.environ.get('NPSNOW_CACHE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'npsnow'))
+
+# Part of the cache key.  Increase it when a reader changes how files are parsed,
+# so frames cached by earlier versions are not used.
+READER_VERSION = 1
+
+def _cache_path(reader, fili, args, kwargs):
+    """
+    Returns path to cache file for a reader, source file and reader arguments.
+    The source file modification time and size, and READER_VERSION, are part of
+    the key, so changing the source file or the readers invalidates the cache entry.
+    """
+    st = os.stat(fili)
+    key = repr((READER_VERSION, reader, os.path.abspath(fili), st.st_mtime_ns, st.st_size,
+                args, sorted(kwargs.items())))
+    return os.path.join(CACHE_DIR, '{}.{}.parquet'.format(reader, hashlib.sha1(key.encode()).hexdigest()))
+
+
+def cached(reader):
+    """
+    Decorator that caches the dataframe returned by a reader for a source file.
+
+    The decorated reader takes an extra keyword, cache (default True).  If cache
+    is False, the file is parsed and the cache is not used.  If pyarrow is not
+    installed, or the dataframe cannot be stored as Parquet, data are not cached.
+    """
+    @functools.wraps(reader)
+    def wrapper(fili, *args, cache=True, **kwargs):
+        if not cache:
+            return reader(fili, *args, **kwargs)
+
+        path = _cache_path(reader.__name__, fili, args, kwargs)
+        if os.path.exists(path):
+            return pd.read_parquet(path)
+
+        df = reader(fili, *args, **kwargs)
+        tmpfile = '{}.{:d}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            df.to_parquet(tmpfile)
+            os.replace(tmpfile, path)
+        except (ImportError, ValueError, TypeError, OSError):
+            pass # Cache is optional
+        finally:
+            if os.path.exists(tmpfile): os.remove(tmpfile)
+        return df
+
+    return wrapper
+
+
+def clear_cache():
+    """Removes all cached NPSNOW station data"""
+    for f in glob.glob(os.path.join(CACHE_DIR, '*.parquet*')):
+        os.remove(f)
+
+
+def _assemble_dates(year, month, day, hour=0, minute=0):
+    """
+    Builds a DatetimeIndex from columns of year, month, day, hour and minute.
+
+    Invalid dates, e.g. 30 February, are returned as NaT
+
+    Returns
+    -------
+    pandas DatetimeIndex
+    """
+    parts = pd.DataFrame({'year': year, 'month': month, 'day': day,
+                          'hour': hour, 'minute': minute})
+    return pd.DatetimeIndex(pd.to_datetime(parts, errors='coerce'))
+
+
+@cached
 def read_precip(fili, set_noprecip_to_nan=True):
     """
     Reader for precipitation files contained in the NPSNOW data set
@@ -38,15 +115,9 @@ def read_precip(fili, set_noprecip_to_nan=True):
                          names=['statid','month','day','year','amount','type'])
         
 
-    isday = [row[1]['day'] <= \
-             calendar.monthrange( int(row[1]['year']),int(row[1]['month']) )[1] \
-             for row in df.iterrows()]
-    df = df[isday] # only return rows with valid date
-
-    df.index = [dt.datetime(int(row[1]['year']),
-                            int(row[1]['month']),
-                            int(row[1]['day']) ) \
-                for row in df.iterrows()] # Reset index to date
+    date = _assemble_dates(df['year'], df['month'], df['day'])
+    df = df[date.notna()] # only return rows with valid date
+    df.index = date[date.notna()] # Reset index to date
 
     # Assumes zero precipitation/dry days are marked as -9.9, set to zero
     #df = df.where(df > 0., 0.0)
@@ -54,7 +125,7 @@ def read_precip(fili, set_noprecip_to_nan=True):
     return df[['statid','amount','type']]
 
 
-def load_precip_table(exclude=None, dirpath='/home/apbarret/data/NPSNOW/precip'):
+def load_precip_table(exclude=None, dirpath='/home/apbarret/data/NPSNOW/precip', cache=True):
     """Loads NPSNOW precipitation data into pandas dataframe 
     indexed by date and in columns for each station id.
     
@@ -63,6 +134,7 @@ def load_precip_table(exclude=None, dirpath='/home/apbarret/data/NPSNOW/precip')
               Currently on "bogdanova" is only group string
               "bogdanova" excludes stations 3, 4 and 14.  See 
               Bogdanova et al 2002 for details.
+    cache - use cached station data, see cached
 
     Returns pandas dataframe
     """
@@ -79,13 +151,14 @@ def load_precip_table(exclude=None, dirpath='/home/apbarret/data/NPSNOW/precip')
     if exclude:
         filelist = [f for f in filelist if not re.search(f, exclude_regex)]
 
-    df = pd.concat([read_precip(f) for f in filelist])
+    df = pd.concat([read_precip(f, cache=cache) for f in filelist])
     table = pd.pivot_table(df, values='amount', index=df.index,
                            columns='statid')
 
     return table
 
 
+@cached
 def read_position(fili, original=False):
     """
     Reader for position files contained in the NPSNOW dataset
@@ -112,21 +185,13 @@ def read_position(fili, original=False):
     df = pd.read_csv(fili, header=None, delim_whitespace=True,
                      names=['year','month','day','hour','lat','lon'],
                      skiprows=skiprows)
-    df['hour'][df['hour'] == 24] = 0 #There is no hour 24
-    if (df['hour'] > 24).any():
-        df['hour'][df['hour'] > 24] = 12
+    df.loc[df['hour'] == 24, 'hour'] = 0 #There is no hour 24
+    df.loc[df['hour'] > 24, 'hour'] = 12
 
     # This is a fix to deal with non-valid dates: e.g. 30 February
-    isday = [row[1]['day'] <= \
-             calendar.monthrange( int(row[1]['year']),int(row[1]['month']) )[1] \
-             for row in df.iterrows()]
-    df = df[isday] # only return rows with valid date
-
-    df.index = [dt.datetime(int( '19{:2d}'.format(row[1]['year']) ),
-                            int(row[1]['month']),
-                            int(row[1]['day']),
-                            int(row[1]['hour'])) \
-                for row in df.iterrows()]
+    date = _assemble_dates(1900 + df['year'], df['month'], df['day'], df['hour'])
+    df = df[date.notna()] # only return rows with valid date
+    df.index = date[date.notna()]
     df['lat'] = df['lat'].floordiv(1000).astype(float) + \
                 df['lat'].mod(1000).divide(600)
     df['lon'] = df['lon'].floordiv(1000).astype(float) + \
@@ -146,6 +211,7 @@ def read_daily_position(id):
     return pd.read_csv(filepath, index_col=0, header=0, parse_dates=True)
 
 
+@cached
 def read_uniformat(fili):
     """
     Reads unformat files from US Russian joint Atlases
@@ -158,8 +224,6 @@ def read_uniformat(fili):
     -------
     Pandas data frame
     """
-    import numpy as np
-    
     df = pd.read_csv(fili, header=None, delim_whitespace=True,
                      names=['WMO-ID','year','month','day','time','pos_flag',
                             'lat','lon','tair','slp','wdir','wspd','total_cloud',
@@ -171,14 +235,14 @@ def read_uniformat(fili):
                                 'rh': 999.9, 'tdew': 999.99, 'vap': 9999.9,
                                 'precip': -1.00, 'tsurf': 999.99, 'sst': 999.99})
 
-    df.index = [dt.datetime( int(row[1]['year']),
-                             int(row[1]['month']),
-                             int(row[1]['day']),
-                             int(row[1]['time']//100),
-                             np.mod( int(row[1]['time']), 100) ) for row in df.iterrows() ]
+    date = _assemble_dates(df['year'], df['month'], df['day'],
+                           df['time'] // 100, np.mod(df['time'], 100))
+    df = df[date.notna()] # only return rows with valid date
+    df.index = date[date.notna()]
 
     return df.drop(['year','month','day','time'], axis=1)
 
+@cached
 def read_snowstake(fili):
     """
     Reads the snow stake file from the NPSNOW data set
@@ -212,6 +276,7 @@ def datetimeparser(x):
     #return None
     return dt.datetime.strptime('19{:s}'.format(x),'%Y %m %d %H')
 
+@cached
 def read_met(fili):
     """
     Reads meteorological data files.  These contain wind speed and
@@ -240,6 +305,7 @@ def read_met(fili):
     return df
     
     
+@cached
 def read_combined(fili):
     """
     Reads a combined file of drifting station observations
@@ -294,6 +360,7 @@ def plot_trajectory(df):
     ax.plot(xyMon['x'].values, xyMon['y'].values, 'ro')
     plt.show()
 
+@cached
 def read_yang(fili):
     """
     Reads Excel file containing Yang corrected monthly precipitation
@@ -311,6 +378,7 @@ def read_yang(fili):
     df = df.dropna(how='all')
     return df
 
+@cached
 def read_yang_updated(fili):
     """
     Reads csv file containing Yang precipitation with updated coordinates
@@ -328,6 +396,7 @@ def read_yang_updated(fili):
     df['Date'] = [dt.datetime.strptime(t,'%Y-%m-%d') for t in df.Date.values]
     return df
 
+@cached
 def read_my_combined(fili):
     '''
     Reads combined meteorological data files created by apbarret@nsidc.org
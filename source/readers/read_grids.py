@@ -4,11 +4,19 @@
 
 import xarray as xr
 
-def read_geotiffs(fileList, concat_dim=None, sort_by_datetime=False):
-    """Reads multiple geotiffs into a xarray DataArray"""
+def read_geotiffs(fileList, concat_dim=None, sort_by_datetime=False, workers=1, window=None):
+    """
+    Reads multiple geotiffs into a xarray DataArray
+
+    workers - number of threads used to read files
+    window - optional dictionary of index slices, e.g. {'y': slice(100, 300), 'x': slice(50, 250)}.
+             Only the window is read from each file
+    """
     def process_one_path(path):
         # Uses a context manager to ensure file is closed after use
         with xr.open_rasterio(path) as ds:
+            if window:
+                ds = ds.isel(**window)
             ds.load()
             return ds
 
@@ -21,9 +29,15 @@ def read_geotiffs(fileList, concat_dim=None, sort_by_datetime=False):
     else:
         paths = fileList
         
-    dataArrays = [process_one_path(p) for p in paths]
+    if workers > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            dataArrays = list(executor.map(process_one_path, paths))
+    else:
+        dataArrays = [process_one_path(p) for p in paths]
     combined = xr.concat(dataArrays, concat_dim)
-    combined = combined.squeeze()
+    # Only band is squeezed, so windows one cell wide keep their x or y dimension
+    if combined.sizes.get('band') == 1:
+        combined = combined.squeeze('band', drop=True)
     return combined
 
-
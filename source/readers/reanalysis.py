@@ -11,6 +11,10 @@ from precipitation.constants import vnamedict
 
 EASE_NH50KM_GRID_FILE = '/oldhome/apbarret/projects/ancillary/maps/ease_nh50km_coordinates.nc'
 
+# Chunk sizes for consolidated daily precipitation cubes.  Chunks are long in time and
+# small in space so that extracting points along a trajectory reads few chunks.
+DAILY_CUBE_CHUNKS = {'time': 366, 'x': 45, 'y': 45}
+
 REANALYSIS_GLOB_PSM = {'CFSR': '/disks/arctic5_raid/abarrett/CFSR*/TOTPREC/????/??/CFSR*.*.*.PRECIP_STATS.??????.month.Nh50km.nc4',
                        'MERRA': '/disks/arctic5_raid/abarrett/MERRA/daily/PRECTOT/????/??/MERRA.prod.PRECIP_STATS.assim.tavg1_2d_flx_Nx.??????.month.Nh50km.nc4',
                        'MERRA2': '/disks/arctic5_raid/abarrett/MERRA2/daily/PRECTOT/????/??/MERRA2.tavg1_2d_flx_Nx.PRECIP_STATS.??????.month.Nh50km.nc4',
@@ -24,9 +28,13 @@ def date_from_filename(f):
 def filename_to_date(fileList):
     return [date_from_filename(f) for f in fileList]
 
-def read_precip_stats(reanalysis, freq='month', load=False):
+def read_precip_stats(reanalysis, freq='month', load=False, max_open_files=None):
     """
     Reads time series of EASE_50km Precip Stats into a data frame.  Physical coordinates are added
+
+    Unless load is True, a dask-backed dataset is returned and fields are only read as they
+    are needed, so a dataset that is modified in place or indexed repeatedly should be loaded.
+    max_open_files sets the process-wide limit on files held open by xarray (see read_netcdfs).
     """
     
     if freq == 'month':
@@ -43,7 +51,7 @@ def read_precip_stats(reanalysis, freq='month', load=False):
     #                        data_vars=['wetday_mean', 'wetday_frequency', 'wetday_total',
     #                                   'wetday_max', 'prectot'],
     #                        autoclose=True )
-    ds = read_netcdfs(fileList, 'time')
+    ds = read_netcdfs(fileList, 'time', lazy=not load, max_open_files=max_open_files)
     
     ds['time'] = filename_to_date(fileList)
     ds.coords['x'] = np.arange(0,ds.dims['x'])
@@ -75,13 +83,29 @@ def daily_filepath(reanalysis, date, grid=None):
      else:
           return os.path.join(dirpath,filename)
 
-def read_netcdfs(paths, dim, drop_variables=None):
+def read_netcdfs(paths, dim, drop_variables=None, lazy=False, max_open_files=None):
      """
      Based on code from:
      http://xarray.pydata.org/en/stable/io.html#combining-multiple-files
+
+     By default each file is loaded into memory and closed before the next is opened.
+
+     If lazy is True, a dask-backed dataset is returned and data are only read when they
+     are used.  Files are opened through xarray's LRU file cache, which closes the least
+     recently used file when max_open_files are open, so large lists of files do not
+     raise a "Too many open files" error.
+
+     paths - list of files
+     dim - name of dimension to concatenate along
+     drop_variables - variables to skip when reading files
+     lazy - return dask-backed dataset
+     max_open_files - maximum number of files held open by the xarray file cache.  Data
+                      are read from the files when the dataset is computed, so this sets
+                      xarray's process-wide file_cache_maxsize and is not restored.  If
+                      None, the current xarray setting is used (default 128)
      """
      def process_one_path(path, drop_variables=None):
-          with xr.open_dataset(path) as ds:
+          with xr.open_dataset(path, drop_variables=drop_variables) as ds:
                if 'latitude' in ds.data_vars:
                     ds = ds.set_coords('latitude')
                if 'longitude' in ds.data_vars:
@@ -89,13 +113,116 @@ def read_netcdfs(paths, dim, drop_variables=None):
                ds.load()
           return ds
 
+     def open_one_path(path, drop_variables=None):
+          ds = xr.open_dataset(path, drop_variables=drop_variables, chunks={})
+          if 'latitude' in ds.data_vars:
+               ds = ds.set_coords('latitude')
+          if 'longitude' in ds.data_vars:
+               ds = ds.set_coords('longitude')
+          return ds
+
      #paths = sorted( glob.glob(files) )
-     combined = xr.concat( [process_one_path(p) for p in paths], dim )
+     if lazy:
+          if max_open_files:
+               xr.set_options(file_cache_maxsize=max_open_files)
+          # Coordinates without dim are taken from the first file, so coordinate
+          # values do not need to be read to compare them
+          combined = xr.concat( [open_one_path(p, drop_variables=drop_variables) for p in paths], dim,
+                                coords='minimal', compat='override' )
+     else:
+          combined = xr.concat( [process_one_path(p, drop_variables=drop_variables) for p in paths], dim )
      return combined
      
+def daily_cube_path(reanalysis, grid=None):
+     """
+     Generates path to the consolidated daily precipitation cube for a reanalysis.
+     The cube is a zarr store in the variable directory, 
+     e.g. .../MERRA2/daily/PRECTOT/MERRA2.PRECTOT.day.Nh50km.zarr
+     """
+     varname = vnamedict[reanalysis]['PRECIP']['name']
+     dirpath = os.path.dirname(os.path.dirname(REANALYSIS_PATH[reanalysis]['path'])).format(varname)
+     filename = '.'.join([reanalysis, varname, 'day'] + ([grid] if grid else []) + ['zarr'])
+     return os.path.join(dirpath, filename)
+
+def cube_encoding(ds, chunks):
+     """
+     Returns zarr encoding that stores variables in chunks, so the store is chunked as
+     declared in chunks even if the first year written is shorter than a chunk
+     """
+     return {name: {'chunks': tuple(chunks.get(dim, ds.sizes[dim]) for dim in da.dims)}
+             for name, da in ds.data_vars.items()}
+
+def append_chunks(n, ntime, size):
+     """
+     Returns time chunk sizes for appending n days to a cube with ntime days stored in
+     chunks of size, so that each dask chunk is written to exactly one zarr chunk
+     """
+     first = min(size - ntime % size, n)
+     rest = n - first
+     return (first,) + (size,)*(rest // size) + ((rest % size,) if rest % size else ())
+
+def make_daily_cube(reanalysis, first_date, last_date, grid=None, chunks=None, verbose=False):
+     """
+     Packs daily reanalysis precipitation files into a single chunked, compressed zarr
+     cube.  Files are read and written one year at a time.  Variables are stored as they
+     are in the daily files, so read_daily_precip returns the same data from either source.
+
+     reanalysis - name of reanalysis
+     first_date - first date to pack YYYY-MM-DD
+     last_date - last date to pack YYYY-MM-DD
+     chunks - dict of chunk sizes, default is DAILY_CUBE_CHUNKS
+
+     Returns: path to cube
+     """
+     if not chunks: chunks = DAILY_CUBE_CHUNKS
+     path = daily_cube_path(reanalysis, grid=grid)
+
+     dates = pd.date_range(first_date, last_date, freq='D')
+     for i, year in enumerate(np.unique(dates.year)):
+          days = dates[dates.year == year]
+          if verbose: print (f'   Packing {reanalysis} daily precipitation for {year} into {path}')
+          fileList = [daily_filepath(reanalysis, d, grid=grid) for d in days]
+          ds = read_netcdfs(fileList, 'time')
+          ds['time'] = days
+          if i == 0:
+               ds = ds.chunk({dim: size for dim, size in chunks.items() if dim in ds.dims})
+               ds.to_zarr(path, mode='w', encoding=cube_encoding(ds, chunks))
+          else:
+               ds = ds.drop_vars([v for v in ds.variables if 'time' not in ds[v].dims])
+               with xr.open_zarr(path) as cube:
+                    ntime = cube.sizes['time']
+               ds = ds.chunk({dim: append_chunks(ds.sizes['time'], ntime, size) if dim == 'time' else size
+                              for dim, size in chunks.items() if dim in ds.dims})
+               ds.to_zarr(path, append_dim='time')
+          ds.close()
+
+     return path
+
+def read_daily_cube(reanalysis, first_date, last_date, grid=None):
+     """
+     Reads daily reanalysis precip for a date range from a consolidated cube.  Data are
+     dask-backed, so only the chunks needed are read.
+
+     Returns None if no cube exists or the cube does not cover the date range
+     """
+     path = daily_cube_path(reanalysis, grid=grid)
+     if not os.path.exists(path):
+          return None
+
+     dates = pd.date_range(first_date, last_date, freq='D')
+     ds = xr.open_zarr(path)
+     ds = ds.sel(time=slice(dates[0], dates[-1]))
+     if ds.time.size != dates.size:
+          ds.close()
+          return None
+     return ds
+     
 def read_daily_precip(reanalysis, first_date, last_date, grid=None, load=False):
      """
      Reads a cube of daily reanalysis precip
+
+     If a consolidated cube made by make_daily_cube exists and covers the date range, data
+     are read lazily from the cube, otherwise data are read from the daily files.
      
      reanalysis - name of reanalysis
      first_date - first date to read YYYY-MM-DD
@@ -105,10 +232,15 @@ def read_daily_precip(reanalysis, first_date, last_date, grid=None, load=False):
      """
 
      dates = pd.date_range(first_date, last_date, freq='D')
-     fileList = [daily_filepath(reanalysis, d, grid=grid) for d in dates]
 
-     #ds = xr.open_mfdataset(fileList, concat_dim='time', data_vars=['PRECTOT'])
-     ds = read_netcdfs( fileList, 'time')
+     ds = read_daily_cube(reanalysis, first_date, last_date, grid=grid)
+     if ds is None:
+          fileList = [daily_filepath(reanalysis, d, grid=grid) for d in dates]
+
+          #ds = xr.open_mfdataset(fileList, concat_dim='time', data_vars=['PRECTOT'])
+          ds = read_netcdfs( fileList, 'time')
+     elif load:
+          ds.load()
      ds['time'] = dates
 
      if grid:
@@ -119,6 +251,3 @@ def read_daily_precip(reanalysis, first_date, last_date, grid=None, load=False):
           ds = ds.set_coords(['latitude','longitude'])
      
      return ds
-                                   
-     
-     
@@ -11,12 +11,12 @@ import datetime as dt
 import os, glob
 
 from warren_climatology.warren_climatology import snow_depth
+from utilities.seaice import get_sea_ice_extent
     
 def main():
 
-    # Get sea ice extent grids
-    da = get_sie()
-    da = da.sel(time=slice('1981-01-01','2010-12-31'))
+    # Get sea ice extent grids, only files for 1981 to 2010 are read
+    da = get_sea_ice_extent(date_from='1981-01-01', date_to='2010-12-31', add_land_mask=False)
     da = da.where(da < 253)
     
     print (da.min(), da.max())
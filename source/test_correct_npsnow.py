@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+from correct_npsnow import bogdanova, FALSE_PRECIP_WSPD
+
+# Hand-worked rows for the Bogdanova et al (2002) correction.  All rows have
+# SLP = 1000 hPa.  With WSPD = 0, Uh = 0 so K = 1.
+#
+# Wind at gauge height, with snow depth SDEPTH in cm
+#    Uh = WSPD * ln((2 - SDEPTH/100)/0.01) / ln((10 - SDEPTH/100)/0.01)
+#    SDEPTH = 0:  Uh = WSPD * ln(200)/ln(1000) = 0.767010 * WSPD
+#    SDEPTH = 30: Uh = WSPD * ln(170)/ln(970)  = 0.746776 * WSPD
+#    SDEPTH >= 199, the gauge is buried: Uh = WSPD * ln(1)/ln(801) = 0
+#
+# ln(100 - 90) = 2.302585, so for RH = 90
+#    solid  delta = 0.097*2.302585 - 0.15  =  0.073351
+#    mixed  delta = 0.158*2.302585 - 0.449 = -0.085192
+#    liquid delta = 0.069*2.302585 + 0.009 =  0.167878
+# For RH >= 95, deltas are -0.2 (snow, mixed) and 0.1 (rain)
+#
+# ea = RH/100 * 6.1078*exp(17.27*TAIR/(TAIR + 237.3)) hPa
+# mu = 0.273*1000**2 / ((273.15 + TAIR)*(1000 + 0.4*ea))
+# K  = 1 + A0*mu**2*Uh**2, A0 = 0.033 for snow, 0.017 for mixed
+#
+# Snow, TAIR = -10, RH = 100, WSPD = 5, SDEPTH = 0:
+#    ea = 2.857016, mu = 1.036247, Uh = 3.835050, K = 1.521174
+# Snow, TAIR = -20, RH = 100, WSPD = 5, SDEPTH = 30:
+#    ea = 1.246150, mu = 1.077875, Uh = 3.733879, K = 1.534529
+# Mixed, TAIR = -20, RH = 90, WSPD = 5, SDEPTH = 30:
+#    ea = 1.121535, mu = 1.077928, Uh = 3.733879, K = 1.275391
+# Snow, TAIR = -30, RH = 100, WSPD = 8, SDEPTH = 30:
+#    ea = 0.501722, mu = 1.122538, Uh = 5.974207, K = 2.484147
+#
+#  PRECIP PTYPE  RH  TAIR  WSPD SDEPTH Parch  DELTA      K         FALSE  PCORR
+ROWS = [
+    (1.2,  1,   100., -10., 0.,  0.,  1.0, -0.2,       1.,       False, 0.8),        # snow, saturated
+    (1.2,  2,   100., -10., 0.,  0.,  1.0, -0.2,       1.,       False, 0.8),        # mixed, saturated
+    (1.1,  3,   100., -10., 0.,  0.,  1.0,  0.1,       1.,       False, 1.1),        # rain, saturated
+    (1.2,  1,    90., -10., 0.,  0.,  1.0,  0.073351,  1.,       False, 1.073351),   # snow, rh < 95
+    (1.2,  2,    90., -10., 0.,  0.,  1.0, -0.085192,  1.,       False, 0.914808),   # mixed, rh < 95
+    (1.1,  3,    90., -10., 0.,  0.,  1.0,  0.167878,  1.,       False, 1.167878),   # rain, rh < 95
+    (1.2,  1,   100., -10., 5.,  0.,  1.0, -0.2,       1.521174, False, 1.216939),   # snow with wind
+    (1.2,  1,   100., -20., 5.,  30., 1.0, -0.2,       1.534529, False, 1.227623),   # snow on snow cover
+    (1.2,  2,    90., -20., 5.,  30., 1.0, -0.085192,  1.275391, False, 1.166738),   # mixed on snow cover
+    (1.2,  1,   100., -30., 8.,  30., 1.0, -0.2,       2.484147, False, 1.987317),   # snow, cold and windy
+    (1.2,  1,   100., -20., 5.,  250., 1.0, -0.2,      1.,       False, 0.8),        # gauge buried
+    (0.1,  1,   100., -10., 0.,  0.,  0.0, -0.2,       1.,       False, 0.),         # Parch < 0 set to 0
+    (0.5,  0,   100., -10., 0.,  0.,  0.5,  0.,        1.,       False, 0.5),        # no type, calm
+    (0.5,  0,   100., -10., 7.,  0.,  0.5,  0.,        1.,       False, 0.5),        # no type, Uh = 5.37
+    (0.5,  0,   100., -10., 10., 0.,  0.5,  0.,        1.,       True,  0.),         # no type, Uh = 7.67, false
+    (0.5,  0,   100., -20., 8.,  0.,  0.5,  0.,        1.,       True,  0.),         # no type, Uh = 6.14, false
+    (0.5,  0,   100., -20., 8.,  30., 0.5,  0.,        1.,       False, 0.5),        # no type, Uh = 5.97
+    (np.nan, 1, 100., -10., 0.,  0.,  np.nan, -0.2,    1.,       False, np.nan),     # missing precipitation
+]
+COLUMNS = ['PRECIP', 'PTYPE', 'RH', 'TAIR', 'WSPD', 'SDEPTH', 'Parch', 'DELTA', 'K', 'FALSE', 'PCORR']
+
+
+def hand_table():
+    return pd.DataFrame(ROWS, columns=COLUMNS)
+
+
+def test_bogdanova():
+    """Checks bogdanova against hand-worked rows"""
+    expected = hand_table()
+    df = expected[['PRECIP', 'PTYPE', 'RH', 'TAIR', 'WSPD', 'SDEPTH']].copy()
+    df['SLP'] = 1000.
+
+    result = bogdanova(df)
+
+    assert list(result['PTYPE']) == ['snow', 'mixed', 'rain', 'snow', 'mixed', 'rain',
+                                     'snow', 'snow', 'mixed', 'snow', 'snow', 'snow',
+                                     '', '', '', '', '', 'snow']
+    for column in ['Parch', 'DELTA', 'K', 'PCORR']:
+        np.testing.assert_allclose(result[column], expected[column], atol=1e-5, err_msg=column)
+    np.testing.assert_array_equal(result['FALSE'], expected['FALSE'])
+
+
+def test_false_precipitation_threshold():
+    """Gauge-height wind speed just below and at FALSE_PRECIP_WSPD"""
+    ratio = np.log(2./0.01) / np.log(10./0.01)
+    df = pd.DataFrame({'PRECIP': [0.5, 0.5], 'PTYPE': [0, 0], 'RH': [100., 100.],
+                       'WSPD': [0.999*FALSE_PRECIP_WSPD/ratio, 1.001*FALSE_PRECIP_WSPD/ratio],
+                       'TAIR': [-10., -10.], 'SLP': [1000., 1000.], 'SDEPTH': [0., 0.]})
+    result = bogdanova(df)
+    np.testing.assert_array_equal(result['FALSE'], [False, True])
+    np.testing.assert_allclose(result['PCORR'], [0.5, 0.])
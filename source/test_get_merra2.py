@@ -0,0 +1,148 @@
+import os
+import sys
+import threading
+import types
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+import numpy as np
+import pytest
+import xarray as xr
+
+pytest.importorskip('pydap')
+from pydap.model import DatasetType, BaseType
+from pydap.handlers.lib import BaseHandler
+
+PRECIP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'precipitation')
+
+DATES = ['20100101', '20100102', '20100103']
+
+
+def granule(date):
+    """Returns a pydap dataset that looks like one day of hourly MERRA2 fluxes"""
+    ds = DatasetType('MERRA2')
+    ds['time'] = BaseType('time', np.arange(30, 24*60, 60, dtype='int32'), dimensions=('time',),
+                          units='minutes since {}-{}-{} 00:00:00'.format(date[:4], date[4:6], date[6:]),
+                          begin_date=int(date))
+    ds['lat'] = BaseType('lat', np.array([80., 85.]), dimensions=('lat',))
+    ds['lon'] = BaseType('lon', np.array([0., 10., 20.]), dimensions=('lon',))
+    ds['PRECTOT'] = BaseType('PRECTOT', np.full((24, 2, 3), 1e-4, dtype='float32'),
+                             dimensions=('time', 'lat', 'lon'), units='kg m-2 s-1',
+                             fmissing_value=1e15, missing_value=1e15)
+    return ds
+
+
+class MockOpendap:
+    """
+    WSGI app serving MERRA2-like granules over OPeNDAP.  failures maps a granule
+    name to a list of HTTP status codes returned, in turn, before the granule is
+    served.  Requests are logged by granule name.
+    """
+
+    def __init__(self):
+        self.handlers = {'MERRA2_300.tavg1_2d_flx_Nx.{}.nc4'.format(date): BaseHandler(granule(date))
+                         for date in DATES}
+        self.failures = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        name = os.path.splitext(environ['PATH_INFO'].lstrip('/'))[0]
+        with self.lock:
+            self.requests.append(name)
+            status = self.failures.get(name, []).pop(0) if self.failures.get(name) else None
+        if status:
+            start_response('{:d} Error'.format(status), [('Content-Type', 'text/plain')])
+            return [b'error']
+        return self.handlers[name](environ, start_response)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    app = MockOpendap()
+    httpd = make_server('127.0.0.1', 0, app, handler_class=QuietHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    app.root = 'http://127.0.0.1:{:d}'.format(httpd.server_port)
+    yield app
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def scripts(monkeypatch):
+    """
+    Imports get_merra2 and merra2_utilities as scripts in precipitation.  Their
+    utilities module shadows the utilities package, so modules imported from
+    precipitation are removed afterwards.
+    """
+    monkeypatch.syspath_prepend(PRECIP_DIR)
+    monkeypatch.delitem(sys.modules, 'utilities', raising=False)
+    import get_merra2
+    import merra2_utilities
+    yield get_merra2, merra2_utilities
+    for name, module in list(sys.modules.items()):
+        if os.path.dirname(os.path.abspath(getattr(module, '__file__', None) or '')) == PRECIP_DIR:
+            del sys.modules[name]
+
+
+@pytest.fixture
+def waits(scripts, monkeypatch):
+    """Records backoff waits of merra2_utilities.retry instead of sleeping"""
+    waits = []
+    monkeypatch.setattr(scripts[1], 'time', types.SimpleNamespace(sleep=waits.append))
+    return waits
+
+
+def write_list(server, tmp_path):
+    listFile = tmp_path / 'urls.txt'
+    listFile.write_text(''.join('{}/{}\n'.format(server.root, name) for name in sorted(server.handlers)))
+    return str(listFile)
+
+
+def output_path(tmp_path, date):
+    return os.path.join(str(tmp_path), 'out', 'PRECTOT', date[:4], date[4:6],
+                        'MERRA2_300.tavg1_2d_flx_Nx.PRECTOT.{}.nc4'.format(date))
+
+
+@pytest.mark.filterwarnings('ignore:PyDAP was unable to determine the DAP protocol')
+def test_retry_and_resume(scripts, server, waits, tmp_path):
+    """Transient errors are retried with backoff, 4xx errors are not, and a resumed
+    run skips granules in the ledger"""
+    get_merra2, m2util = scripts
+    retried, missing, good = sorted(server.handlers)
+    # pydap may also retry 5xx responses itself, so the number of waits depends on
+    # the pydap version
+    server.failures[retried] = [503, 502] * 3
+    server.failures[missing] = [404] * 10
+
+    listFile = write_list(server, tmp_path)
+    outdir = str(tmp_path / 'out')
+    failed = get_merra2.main(listFile, ['PRECTOT'], outdir=outdir, workers=2, complevel=4,
+                             retries=6, login=False)
+
+    assert list(failed) == ['{}/{}'.format(server.root, missing)]
+    assert server.requests.count(missing) == 1
+    assert waits and (waits == [2.**attempt for attempt in range(len(waits))])
+
+    ledger = m2util.read_ledger(os.path.join(outdir, 'get_merra2.ledger'))
+    assert ledger == {'{}/{}'.format(server.root, name) for name in (retried, good)}
+
+    for date in DATES[:1] + DATES[2:]:
+        with xr.open_dataset(output_path(tmp_path, date)) as ds:
+            assert ds['PRECTOT'].encoding['complevel'] == 4
+            np.testing.assert_allclose(ds['PRECTOT'], 1e-4*3600*24, rtol=1e-5)
+    assert not os.path.exists(output_path(tmp_path, DATES[1]))
+
+    # Resume once the missing granule is available: only it is requested
+    server.requests.clear()
+    server.failures.clear()
+    failed = get_merra2.main(listFile, ['PRECTOT'], outdir=outdir, workers=2, complevel=4,
+                             login=False)
+    assert failed == {}
+    assert set(server.requests) == {missing}
+    assert os.path.exists(output_path(tmp_path, DATES[1]))
@@ -0,0 +1,152 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from precipitation import nasa_crawler
+
+CATALOG = '''<?xml version="1.0" encoding="UTF-8"?>
+<catalog xmlns="http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0"
+         xmlns:xlink="http://www.w3.org/1999/xlink">
+{refs}
+{datasets}
+</catalog>
+'''
+REF = '  <catalogRef xlink:href="{}" xlink:title="{}"/>'
+DATASET = '  <dataset name="{0}"><access serviceName="dap" urlPath="/opendap/{0}"/></dataset>'
+
+
+def catalog(refs=(), datasets=()):
+    return CATALOG.format(refs='\n'.join(REF.format(ref, ref) for ref in refs),
+                          datasets='\n'.join(DATASET.format(name) for name in datasets)).encode()
+
+
+class Fixture:
+    """
+    Catalogs served by a local THREDDS-like server, with ETag and Last-Modified
+    headers.  The 2011 and 2010 catalogs both reference the shared catalog.
+    Requests are logged as (path, status).  A request for a path in hold waits
+    until its event is set.
+    """
+
+    def __init__(self):
+        self.catalogs = {
+            '/MERRA2/catalog.xml': catalog(refs=['2010/catalog.xml', '2011/catalog.xml']),
+            '/MERRA2/2010/catalog.xml': catalog(refs=['../shared/catalog.xml'],
+                                                datasets=['MERRA2.20100101.nc4', 'MERRA2.20100102.nc4']),
+            '/MERRA2/2011/catalog.xml': catalog(refs=['../shared/catalog.xml'],
+                                                datasets=['MERRA2.20110101.nc4']),
+            '/MERRA2/shared/catalog.xml': catalog(datasets=['MERRA2.const.nc4']),
+        }
+        self.version = {path: 1 for path in self.catalogs}
+        self.requests = []
+        self.hold = {}
+        self.lock = threading.Lock()
+
+    def etag(self, path):
+        return '"{:d}"'.format(self.version[path])
+
+    def last_modified(self, path):
+        return 'Mon, 0{:d} Jan 2018 00:00:00 GMT'.format(self.version[path])
+
+    def log(self, path, status):
+        with self.lock:
+            self.requests.append((path, status))
+
+
+def make_handler(fixture):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            path = self.path
+            if path in fixture.hold:
+                fixture.hold[path].wait(10)
+            if path not in fixture.catalogs:
+                fixture.log(path, 404)
+                self.send_error(404)
+                return
+            etag, last_modified = fixture.etag(path), fixture.last_modified(path)
+            if (self.headers.get('If-None-Match') == etag) and \
+               (self.headers.get('If-Modified-Since') == last_modified):
+                fixture.log(path, 304)
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = fixture.catalogs[path]
+            fixture.log(path, 200)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/xml')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', last_modified)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.setattr(nasa_crawler, 'CACHE_DIR', str(tmp_path / 'cache'))
+    fixture = Fixture()
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(fixture))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    fixture.root = 'http://127.0.0.1:{:d}/MERRA2/catalog.xml'.format(httpd.server_port)
+    yield fixture
+    for event in fixture.hold.values():
+        event.set()
+    httpd.shutdown()
+    httpd.server_close()
+
+
+ALL = {'/opendap/MERRA2.20100101.nc4', '/opendap/MERRA2.20100102.nc4',
+       '/opendap/MERRA2.20110101.nc4', '/opendap/MERRA2.const.nc4'}
+
+
+def test_crawl_revalidates_cache(server, tmp_path):
+    """Unchanged catalogs are revalidated with ETag and Last-Modified and read from the cache"""
+    with requests.Session() as session:
+        datasets = list(nasa_crawler.crawl(server.root, session, workers=4))
+        assert sorted(datasets) == sorted(ALL)
+        # The shared catalog is referenced twice but fetched once
+        assert sorted(server.requests) == sorted((path, 200) for path in server.catalogs)
+        assert not [f for f in os.listdir(str(tmp_path / 'cache')) if f.endswith('.tmp')]
+
+        server.requests.clear()
+        assert sorted(nasa_crawler.crawl(server.root, session, workers=4)) == sorted(ALL)
+        assert sorted(server.requests) == sorted((path, 304) for path in server.catalogs)
+
+        # A changed catalog is downloaded again
+        server.requests.clear()
+        server.catalogs['/MERRA2/2011/catalog.xml'] = catalog(refs=['../shared/catalog.xml'],
+                                                              datasets=['MERRA2.20110102.nc4'])
+        server.version['/MERRA2/2011/catalog.xml'] += 1
+        datasets = set(nasa_crawler.crawl(server.root, session, workers=4))
+        assert datasets == (ALL - {'/opendap/MERRA2.20110101.nc4'}) | {'/opendap/MERRA2.20110102.nc4'}
+        assert ('/MERRA2/2011/catalog.xml', 200) in server.requests
+
+        # Without revalidation, cached catalogs are used without requests
+        server.requests.clear()
+        assert len(list(nasa_crawler.crawl(server.root, session, revalidate=False))) == len(ALL)
+        assert server.requests == []
+
+
+def test_crawl_streams_datasets(server):
+    """Datasets are yielded while other catalogs are still being fetched"""
+    server.hold['/MERRA2/2011/catalog.xml'] = threading.Event()
+    with requests.Session() as session:
+        datasets = nasa_crawler.crawl(server.root, session, workers=4)
+        first = {next(datasets) for _ in range(3)}
+        assert first == {'/opendap/MERRA2.20100101.nc4', '/opendap/MERRA2.20100102.nc4',
+                         '/opendap/MERRA2.const.nc4'}
+        assert ('/MERRA2/2011/catalog.xml', 200) not in server.requests
+
+        server.hold['/MERRA2/2011/catalog.xml'].set()
+        assert list(datasets) == ['/opendap/MERRA2.20110101.nc4']
@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from utilities import seaice
+from readers import read_grids
+
+FILES = ['/geotiff/{:02d}_{}/N_{}_extent_v3.0.tif'.format(int(month[4:]), month, month)
+         for month in ['198103', '198101', '198012', '198102', '198105']]
+
+
+def yyyymm(path):
+    return os.path.basename(path).split('_')[1]
+
+
+def test_select_files():
+    """Files are sorted by date and selected as with da.sel(time=slice(date_from, date_to))"""
+    files = seaice.select_files(FILES)
+    assert list(files.index) == list(pd.to_datetime(['1980-12-01', '1981-01-01', '1981-02-01',
+                                                     '1981-03-01', '1981-05-01']))
+    assert [yyyymm(f) for f in files] == ['198012', '198101', '198102', '198103', '198105']
+
+    files = seaice.select_files(FILES, date_from='1981-01-01', date_to='1981-03-31')
+    assert list(files.index.month) == [1, 2, 3]
+
+    files = seaice.select_files(FILES, date_from='1981-02', date_to='1981-02')
+    assert list(files.index.month) == [2]
+
+    files = seaice.select_files(FILES, dates=['1981-05-15', '1980-12-01', '1981-04-01'])
+    assert list(files.index) == list(pd.to_datetime(['1980-12-01', '1981-05-01']))
+
+    files = seaice.select_files(FILES, dates='1981-01-31')
+    assert list(files.index) == [pd.Timestamp('1981-01-01')]
+
+    assert seaice.select_files(FILES, date_from='1990-01-01').empty
+
+
+def test_region_window(monkeypatch):
+    """Window is the smallest box containing the region or group of regions"""
+    mask = np.zeros((10, 8), dtype='int8')
+    mask[2:5, 3:6] = 13  # BEAUFORT
+    mask[6, 1] = 12      # CHUKCHI, one cell
+    mask[0, 7] = 15      # CENTRAL_ARCTIC, one cell
+    monkeypatch.setattr(seaice, 'get_region_mask', lambda: xr.DataArray(mask, dims=['y', 'x']))
+
+    assert seaice.region_window('BEAUFORT') == {'y': slice(2, 5), 'x': slice(3, 6)}
+    assert seaice.region_window('CHUKCHI') == {'y': slice(6, 7), 'x': slice(1, 2)}
+    assert seaice.region_window('CENTRAL_ARCTIC_OCEAN') == {'y': slice(0, 7), 'x': slice(1, 8)}
+
+
+def test_read_geotiffs_one_cell_window(monkeypatch):
+    """Windows one cell wide keep their x and y dimensions"""
+    def open_rasterio(path):
+        month = int(yyyymm(path)[4:])
+        return xr.DataArray(np.full((1, 10, 8), month, dtype='uint8'), dims=['band', 'y', 'x'],
+                            coords={'band': [1], 'y': np.arange(10.), 'x': np.arange(8.)})
+    monkeypatch.setattr(xr, 'open_rasterio', open_rasterio, raising=False)
+
+    da = read_grids.read_geotiffs(FILES[:2], concat_dim='time', window={'y': slice(6, 7), 'x': slice(1, 4)})
+    assert da.dims == ('time', 'y', 'x')
+    assert da.shape == (2, 1, 3)
+    np.testing.assert_array_equal(da.isel(y=0, x=0), [3, 1])
+
+    da = read_grids.read_geotiffs(FILES[:1], concat_dim='time', window={'y': slice(6, 7), 'x': slice(1, 2)})
+    assert da.dims == ('time', 'y', 'x')
+    assert 'band' not in da.coords
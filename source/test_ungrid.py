@@ -1,3 +1,5 @@
+import os
+
 import numpy as np
 import pandas as pd
 
@@ -66,6 +68,31 @@ def test_points():
     return pd.DataFrame(field,
                         columns=['Lat','Lon','iRow','iCol'])
 
+def test_ease_grid(tmp_path, monkeypatch):
+    """Checks utilities.ease_grid against test points"""
+    from utilities import ease_grid
+    from utilities.ease_grid import latlon_to_colrow, colrow_to_latlon, cell_latlon, cell_index
+
+    # Write the cell-center table to a temporary directory, not ~/.cache/ease_grid
+    monkeypatch.setattr(ease_grid, 'TABLE_DIR', str(tmp_path))
+    ease_grid.cell_centers.cache_clear()
+
+    test_df = test_points()
+
+    col, row = latlon_to_colrow(test_df['Lat'].values, test_df['Lon'].values, grid='Nh50km')
+    np.testing.assert_allclose(col, test_df['iRow'].values, atol=1e-5)
+    np.testing.assert_allclose(row, test_df['iCol'].values, atol=1e-5)
+
+    lat, lon = colrow_to_latlon(col, row, grid='Nh50km')
+    np.testing.assert_allclose(lat, test_df['Lat'].values, atol=1e-8)
+    np.testing.assert_allclose(np.mod(lon, 360.), test_df['Lon'].values, atol=1e-8)
+
+    icol, irow = cell_index(test_df['Lat'].values, test_df['Lon'].values, grid='Nh50km')
+    clat, clon = cell_latlon(icol, irow, grid='Nh50km')
+    np.testing.assert_allclose(clat, colrow_to_latlon(icol, irow, grid='Nh50km')[0], atol=1e-4)
+    assert os.listdir(tmp_path)
+    ease_grid.cell_centers.cache_clear()
+
 def main():
 
     test_df = test_points()
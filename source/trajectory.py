@@ -45,7 +45,14 @@ class _Segment:
                
 
 class Trajectory:
-    """A series of waypoints"""
+    """A series of waypoints
+
+    Waypoints are stored as arrays of time, latitude and longitude.  Segment lengths,
+    azimuths and speeds are calculated for all segments with a single call to geod.inv
+    """
+
+    __slots__ = ('time', 'latitude', 'longitude', 'ellps', 'geod',
+                 'seg_length', 'fwd_azimuth', 'bck_azimuth', 'speed')
     
     def __init__(self, waypoints, ellps='WGS84'):
         """Defines a trajectory as a set of waypoints
@@ -62,61 +69,122 @@ class Trajectory:
         **kwargs
         ellps - ellipse defining datum
         """
-        
-        self.waypoints = waypoints
+        self._set_arrays([wp['time'] for wp in waypoints],
+                         [wp['latitude'] for wp in waypoints],
+                         [wp['longitude'] for wp in waypoints],
+                         ellps)
+
+
+    @classmethod
+    def from_arrays(cls, time, latitude, longitude, ellps='WGS84'):
+        """Defines a trajectory from arrays of times, latitudes and longitudes
+
+        time - sequence of datetime objects, pandas DatetimeIndex or numpy datetime64 array
+        latitude, longitude - sequences of coordinates in decimal degrees
+        """
+        traj = cls.__new__(cls)
+        traj._set_arrays(time, latitude, longitude, ellps)
+        return traj
+
+
+    def _set_arrays(self, time, latitude, longitude, ellps):
+        """Sets waypoint arrays and calculates segments"""
+        self.time = pd.DatetimeIndex(time).values
+        self.latitude = np.asarray(latitude, dtype=float)
+        self.longitude = np.asarray(longitude, dtype=float)
         self.ellps = ellps
         self.geod = pyproj.Geod(ellps = ellps)
-        
-        # create line segments from the waypoints
-        self.segments = [_Segment(self.waypoints[i], self.waypoints[i+1], self.geod)
-                         for i in range(len(self.waypoints) - 1)]
-        
-        self.length = sum([seg.length for seg in self.segments])
-        self.first_time = self.waypoints[0]['time']
-        self.last_time = self.waypoints[-1]['time']
-        
+
+        # Segments are defined by consecutive waypoints
+        fwd_azimuth, bck_azimuth, length = self.geod.inv(self.longitude[:-1], self.latitude[:-1],
+                                                         self.longitude[1:], self.latitude[1:])
+        self.fwd_azimuth = np.asarray(fwd_azimuth)
+        self.bck_azimuth = np.asarray(bck_azimuth)
+        self.seg_length = np.asarray(length)  # meters
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.speed = self.seg_length / _seconds(np.diff(self.time))  # m/s
+
+
+    @property
+    def waypoints(self):
+        """List of waypoint dictionaries"""
+        return [{'time': t, 'latitude': lat, 'longitude': lon}
+                for t, lat, lon in zip(pd.DatetimeIndex(self.time), self.latitude, self.longitude)]
+
+
+    @property
+    def segments(self):
+        """List of _Segment objects.  These are created on request"""
+        wp = self.waypoints
+        return [_Segment(wp[i], wp[i+1], self.geod) for i in range(len(wp) - 1)]
+
+
+    @property
+    def length(self):
+        return self.seg_length.sum()
+
+
+    @property
+    def first_time(self):
+        return pd.Timestamp(self.time[0])
+
+
+    @property
+    def last_time(self):
+        return pd.Timestamp(self.time[-1])
+
     
     def __repr__(self):
-        return f"Trajectory object: # waypoints: {len(self.waypoints)}\n" +                f"                   # segments: {len(self.segments)}\n" +                f"                   Length: {self.length} m\n" +                f"                   Ellipse: {self.ellps}"
+        return f"Trajectory object: # waypoints: {self.time.size}\n" +                f"                   # segments: {self.seg_length.size}\n" +                f"                   Length: {self.length} m\n" +                f"                   Ellipse: {self.ellps}"
     
     
     def interpolate_by_date(self, date):
         """Interpolates the lat-lon coordinates for one or more datetimes
+
+        Dates before the first waypoint are extrapolated backwards along the first segment.
+        Dates after the last waypoint are extrapolated forward along the last segment.
         
         date - a single or list of datetime objects
         
         Returns - a trajectory object containing the interpolated waypoints
         """
-        
-        these_dates = list(date)  # Make sure the date is a list
-        new_waypoints = [extrapolate_one(self.segments, self.geod, this_date) for this_date in these_dates]
-        return Trajectory(new_waypoints)
+        these_dates = pd.DatetimeIndex(list(date)).values  # Make sure the date is a list
+
+        # Find segment that starts at or before each date
+        idx = np.searchsorted(self.time[:-1], these_dates, side='right') - 1
+        backward = idx < 0
+        idx = np.where(backward, 0, idx)
+
+        time_delta = np.abs(_seconds(these_dates - self.time[idx]))
+        azimuth = np.where(backward, self.bck_azimuth[idx], self.fwd_azimuth[idx])
+        distance = self.speed[idx] * time_delta
+
+        endlon, endlat, az21 = self.geod.fwd(self.longitude[idx], self.latitude[idx], azimuth, distance)
+        return Trajectory.from_arrays(these_dates, endlat, endlon, ellps=self.ellps)
         
         
     def to_dataframe(self):
         """Converts object to pandas DataFrame"""
-        time_arr = []
-        lon_arr = []
-        lat_arr = []
-        for d in self.waypoints:
-            time_arr.append(d['time'])
-            lon_arr.append(d['longitude'])
-            lat_arr.append(d['latitude'])
-        return pd.DataFrame({'Longitude': lon_arr, 'Latitude': lat_arr}, index=time_arr)
+        return pd.DataFrame({'Longitude': self.longitude, 'Latitude': self.latitude},
+                            index=pd.DatetimeIndex(self.time))
+
+
+def _seconds(timedelta):
+    """Converts numpy timedelta64 array to float seconds"""
+    return timedelta / np.timedelta64(1, 's')
 
 
 def read_npsnow(filepath, drop_duplicates=True):
     """Reads a position file for NP station and returns a Trajectory object"""
     pos = read_position(filepath)
     pos = pos.reset_index().drop_duplicates(subset='index', keep='first').set_index('index')
-    waypoints = to_waypoints(pos)
-    return Trajectory(waypoints)
+    return Trajectory.from_arrays(pos.index, pos['lat'].values, pos['lon'].values)
 
 
 def to_waypoints(df):
     """Converts pandas DataFrame to waypoints dictionary"""
-    return [{'time': pd.to_datetime(index), 'latitude': row[0], 'longitude': row[1]} 
-            for index, row in df.iterrows()]
+    return [{'time': index, 'latitude': lat, 'longitude': lon} 
+            for index, lat, lon in zip(pd.to_datetime(df.index), df.iloc[:,0], df.iloc[:,1])]
 
 
 def nearest_index(a, x):
@@ -6,7 +6,7 @@ import xarray as xr
 import numpy as np
 import os
 
-from pinpoint.coord_converter import column_row_from_lat_long
+from utilities.ease_grid import cell_index
 from readers.npsnow import read_yang_updated
 
 def makeGrid():
@@ -22,13 +22,9 @@ def makeGrid():
     
 def latlon2colrow(lat, lon):
     """
-    Wrapper for column_row_from_lat_lon that converts column and row
-    values to workable cell indices
+    Converts latitude and longitude to Nh50km column and row cell indices
     """
-    col, row = column_row_from_lat_long(lat, lon, gpd_name='Nh50km')
-    col = np.floor(col).astype(int)
-    row = np.floor(row).astype(int)
-    return col, row
+    return cell_index(lat, lon, grid='Nh50km')
 
 def main(trajectory_file):
     """
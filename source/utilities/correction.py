@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def cr_tretyakov_snow(ws, tmax, tmin):
     """Calculates the catch ratio of a Tretyakov rain gauge using WMO standard procedure for snow
     
@@ -38,22 +41,62 @@ def cr_tretyakov_rain(ws, tmax, tmin):
 def cr_tretyakov_dry(ws, tmax, tmin):
     return 100.
 
-def catch_ratio(x):
-    cr_func = {
-        0: cr_tretyakov_dry,
-        1: cr_tretyakov_snow,
-        2: cr_tretyakov_mixed,
-        3: cr_tretyakov_rain,
-        }
-    if x.WSPD < 6.:
-        return 1./ (cr_func[x.PTYPE](x.WSPD, x.TMAX, x.TMIN)*0.01 )
-    else:
-        return 1.
-
-
-def wind_at_gauge(x):
-    """Reduces 10 m wind speed to wind at gauge height orifice"""
-    H = 10.  # height of anenometer
-    hg = 3.  # height of gauge orifice
-    z0 = 0.01  # Roughness parameter of snow surface
-    return x.WSPD * np.log10(hg/z0) / np.log10(H/z0)
\ No newline at end of file
+
+# Catch ratios are only applied for wind speeds below this value (m/s)
+MAX_WSPD = 6.
+
+def catch_ratio(ws, tmax, tmin, ptype):
+    """Returns the correction factor (1/catch ratio) for a Tretyakov gauge for arrays or
+    series of wind speed, air temperature and precipitation type code.
+
+    Catch ratios are calculated for every type and selected by precipitation type, so
+    whole station records are corrected at once.  Factors are 1 for wind speeds of
+    MAX_WSPD or more, and for missing or unknown precipitation types.
+
+    Arguments
+    ---------
+    ws - wind speed at height of gauge orifice in m/s
+    tmax - maximum air temperature in degrees celsius
+    tmin - minimum air temperature in degrees celsius
+    ptype - precipitation type code: 0 dry, 1 snow, 2 mixed, 3 rain
+    """
+    ws, tmax, tmin, ptype = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in (ws, tmax, tmin, ptype)])
+    cr = np.select([ptype == 0, ptype == 1, ptype == 2, ptype == 3],
+                   [cr_tretyakov_dry(ws, tmax, tmin),
+                    cr_tretyakov_snow(ws, tmax, tmin),
+                    cr_tretyakov_mixed(ws, tmax, tmin),
+                    cr_tretyakov_rain(ws, tmax, tmin)],
+                   default=100.)
+    with np.errstate(invalid='ignore'):
+        return np.where(ws < MAX_WSPD, 1./(cr*0.01), 1.)
+
+
+H_ANEMOMETER = 10.  # height of anenometer (m)
+H_GAUGE = 2.  # height of gauge orifice (m)
+Z0 = 0.01  # Roughness parameter of snow surface (m)
+
+def wind_at_gauge(ws, sdepth=0.):
+    """Reduces 10 m wind speed to wind at gauge height orifice
+
+    ws - wind speed at anemometer height in m/s
+    sdepth - snow depth in cm, reduces height of gauge above surface
+    """
+    return ws * np.log10((H_GAUGE - sdepth*0.01)/Z0) / np.log10(H_ANEMOMETER/Z0)
+
+
+def correct_precip(df):
+    """Corrects precipitation for Tretyakov gauge undercatch.
+
+    df can contain one station or several stations concatenated, because all rows are
+    corrected at once.
+
+    df - dataframe with columns PRECIP, PTYPE, WSPD, TMAX, TMIN and, optionally, SDEPTH
+
+    Returns df with added columns Ug (wind at gauge height), CF (correction factor)
+    and PCORR (corrected precipitation)
+    """
+    sdepth = df['SDEPTH'].fillna(0.) if 'SDEPTH' in df else 0.
+    df['Ug'] = wind_at_gauge(df['WSPD'], sdepth)
+    df['CF'] = catch_ratio(df['Ug'], df['TMAX'], df['TMIN'], df['PTYPE'])
+    df['PCORR'] = df['PRECIP'] * df['CF']
+    return df
@@ -1,22 +1,136 @@
+#----------------------------------------------------------------------
+# Transforms between latitude and longitude and column and row for
+# Northern Hemisphere EASE grids (Lambert azimuthal equal-area on a
+# sphere of radius 6371.228 km).  Based on mapx.
+#
+# Column r and row s are calculated from
+#    r = r0 + 2R/C * sin(lon) * sin(pi/4 - lat/2)
+#    s = s0 + 2R/C * cos(lon) * sin(pi/4 - lat/2)
+# where C is the cell size and r0, s0 the map origin in grid units.
+#----------------------------------------------------------------------
 import numpy as np
 
-def nh_latlon2colrow(lat, lon):
-    """
-    Calculates grid column and row from latitude and
-    longitude coordinates
+import functools
+import os
+
+RADIUS = 6371.228  # km
+
+# Grid definitions: number of columns and rows, map origin and cell size in km
+GRIDS = {
+    'Nh50km': {'ncol': 360, 'nrow': 360, 'r0': 179.75, 's0': 179.75, 'C': 50.13505},
+    'Nh25km': {'ncol': 721, 'nrow': 721, 'r0': 360., 's0': 360., 'C': 25.067525},
+    'Nh12.5km': {'ncol': 1441, 'nrow': 1441, 'r0': 720., 's0': 720., 'C': 12.5337625},
+}
+
+# Cell-center latitude and longitude tables are stored here as .npy files
+TABLE_DIR = os.environ.get('EASE_GRID_TABLE_DIR',
+                           os.path.join(os.path.expanduser('~'), '.cache', 'ease_grid'))
+
+
+@functools.lru_cache(maxsize=None)
+def _constants(grid):
+    """Returns scale (2R/C) and origin for a grid"""
+    try:
+        g = GRIDS[grid]
+    except KeyError:
+        raise ValueError(f'Unknown grid {grid}: expected one of {list(GRIDS.keys())}')
+    return 2. * RADIUS / g['C'], g['r0'], g['s0']
+
+
+def latlon_to_colrow(lat, lon, grid='Nh50km'):
     """
+    Calculates grid column and row from latitude and longitude
 
-    R = 6371.228
-    C = 12.5
-    r0 = 720.
-    s0 = 720.
+    lat, lon - scalars or arrays of geodetic coordinates in decimal degrees
+    grid - Nh50km, Nh25km or Nh12.5km
 
+    Returns
+    -------
+    col, row - fractional column and row.  Cell centers are at integer values
+    """
+    scale, r0, s0 = _constants(grid)
     lmda = np.radians(lon)
-    phi = np.radians(lat)
+    rho = scale * np.sin( (np.pi/4.) - (np.radians(lat)/2.) )
+    return r0 + rho * np.sin(lmda), s0 + rho * np.cos(lmda)
+
 
-    r = 2 * R / C * np.sin(lmda) * np.sin( (np.pi/4.) - (phi/2.) ) + r0
-    s = 2 * R / C * np.cos(lmda) * np.sin( (np.pi/4.) - (phi/2.) ) + s0
+def colrow_to_latlon(col, row, grid='Nh50km'):
+    """
+    Calculates latitude and longitude from grid column and row
 
-    return (r,s)
+    col, row - scalars or arrays of column and row
+    grid - Nh50km, Nh25km or Nh12.5km
+
+    Returns
+    -------
+    lat, lon - in decimal degrees.  Longitude is in range -180 to 180
+    """
+    scale, r0, s0 = _constants(grid)
+    x = np.asarray(col, dtype=float) - r0
+    y = np.asarray(row, dtype=float) - s0
+    with np.errstate(invalid='ignore'):
+        lat = 90. - 2. * np.degrees(np.arcsin(np.hypot(x, y) / scale))
+    lon = np.degrees(np.arctan2(x, y))
+    return lat, lon
+
+
+def cell_index(lat, lon, grid='Nh50km'):
+    """
+    Returns integer column and row indices of the cells containing lat and lon.
+    Indices are the floor of the fractional column and row, consistent with
+    the indices used to extract reanalysis values along trajectories.
+    """
+    col, row = latlon_to_colrow(lat, lon, grid=grid)
+    return np.floor(col).astype(int), np.floor(row).astype(int)
 
 
+def _table_path(grid):
+    return os.path.join(TABLE_DIR, f'ease_{grid}_cell_centers.npy')
+
+
+def make_cell_center_table(grid='Nh50km'):
+    """
+    Calculates latitude and longitude of cell centers and writes them to a .npy file
+    in TABLE_DIR.  The array has shape (2, ncol, nrow): latitude and longitude indexed
+    by [col, row]
+
+    Returns path to file
+    """
+    g = GRIDS[grid]
+    col, row = np.meshgrid(np.arange(g['ncol']), np.arange(g['nrow']), indexing='ij')
+    table = np.stack(colrow_to_latlon(col, row, grid=grid)).astype('float32')
+
+    path = _table_path(grid)
+    os.makedirs(TABLE_DIR, exist_ok=True)
+    tmpfile = '{}.{:d}.tmp.npy'.format(path[:-4], os.getpid())
+    np.save(tmpfile, table)
+    os.replace(tmpfile, path)
+    return path
+
+
+@functools.lru_cache(maxsize=None)
+def cell_centers(grid='Nh50km'):
+    """
+    Returns latitude and longitude of cell centers for a grid as arrays indexed by
+    [col, row].  The table is memory-mapped from TABLE_DIR, and created the first
+    time it is needed.
+    """
+    path = _table_path(grid)
+    if not os.path.exists(path):
+        make_cell_center_table(grid)
+    table = np.load(path, mmap_mode='r')
+    return table[0], table[1]
+
+
+def cell_latlon(col, row, grid='Nh50km'):
+    """Looks up latitude and longitude of cell centers for integer column and row indices"""
+    lat, lon = cell_centers(grid)
+    return lat[col, row], lon[col, row]
+
+
+def nh_latlon2colrow(lat, lon):
+    """
+    Calculates grid column and row from latitude and
+    longitude coordinates for the Nh12.5km grid
+    """
+    return latlon_to_colrow(lat, lon, grid='Nh12.5km')
@@ -8,7 +8,6 @@ import numpy as np
 import datetime as dt
 
 import xarray as xr
-from rasterio.warp import transform
 
 from readers.read_grids import read_geotiffs
 
@@ -25,6 +24,8 @@ def get_datetime(filelist):
 
 def get_latlon(da):
     """Calculates lat, lon for grid"""
+    from rasterio.warp import transform
+
     ny, nx = len(da['y']), len(da['x'])
     x, y = np.meshgrid(da['x'], da['y'])
 
@@ -38,40 +39,121 @@ def get_latlon(da):
 
     return
 
-def get_sea_ice_extent(date_from=None, date_to=None,
-                       add_land_mask=True, dates=None):
+# Stacked sea ice extent cubes are cached here as compressed netCDF files
+SEAICE_CACHE_DIR = os.environ.get('SEAICE_CACHE_DIR',
+                                  os.path.join(os.path.expanduser('~'), '.cache', 'seaice'))
+
+
+def select_files(filelist, date_from=None, date_to=None, dates=None):
     """
-    Wrapper to get sorted DataArray of sea ice extent
+    Returns a pandas Series of files indexed and sorted by date, for months from
+    date_from to date_to or months in dates.  Dates are selected as with
+    da.sel(time=slice(date_from, date_to))
 
     date_from - date to start series YYYY-MM-DD
     date_to   - date to end series   YYYY-MM-DD
     dates     - single date or array of dates [YYYY-MM-DD, YYYY-MM-DD]
-    add_land_mask - sets land and coast values to nan
     """
+    import pandas as pd
 
-    filelist = get_extent_file_list()
-    dates = get_datetime(filelist)
-    dates, filelist = map( list, zip(*sorted( list( zip(dates, filelist) ),
-                                              key=lambda date: date[0])) )
+    files = pd.Series(filelist, index=pd.DatetimeIndex(get_datetime(filelist))).sort_index()
+    files = files.loc[date_from:date_to]
+    if dates is not None:
+        months = pd.DatetimeIndex(pd.to_datetime(np.atleast_1d(dates))).to_period('M')
+        files = files[files.index.to_period('M').isin(months)]
+    return files
 
-    #Template to select filelist and dates before reading
-    #dates, filelist = map(list, zip( *[(d, f) for d, f in zip(dates, filelist) \
-    #                                   if (d >= dt.datetime(1981,1,1)) and \
-    #                                   (d <= dt.datetime(1981,12,31))] ) )
-    
-    da = read_geotiffs(filelist, concat_dim='time')
+
+def region_window(region):
+    """
+    Returns index slices of the smallest window containing a region, or group of
+    regions, in the PSN region mask
+
+    region - name of region in arctic_mask_region or arctic_mask_region_group
+    """
+    from precipitation.utilities import region_codes
+
+    inregion = get_region_mask().isin(region_codes(region)).values
+    rows = np.flatnonzero(inregion.any(axis=1))
+    cols = np.flatnonzero(inregion.any(axis=0))
+    return {'y': slice(int(rows[0]), int(rows[-1])+1), 'x': slice(int(cols[0]), int(cols[-1])+1)}
+
+
+def _cache_path(filelist, window):
+    """Returns path to cached cube for a list of files and window"""
+    import hashlib
+    key = repr(([os.path.basename(f) for f in filelist], window))
+    return os.path.join(SEAICE_CACHE_DIR,
+                        'sea_ice_extent.{}.nc'.format(hashlib.md5(key.encode()).hexdigest()))
+
+
+def read_sea_ice_extent(filelist, dates, window=None, workers=4, cache=False):
+    """
+    Reads extent geotiffs into a DataArray with time, lat and lon coordinates.  If
+    cache is True, the stacked cube is written to SEAICE_CACHE_DIR (default
+    ~/.cache/seaice), and read from there while it is newer than all the files.
+
+    filelist - list of geotiffs
+    dates - date of each file
+    window - optional dictionary of index slices for x and y
+    workers - number of threads used to read files
+    """
+    path = _cache_path(filelist, window)
+    if cache and os.path.exists(path) and \
+       (os.path.getmtime(path) >= max(os.path.getmtime(f) for f in filelist)):
+        with xr.open_dataarray(path) as da:
+            da.load()
+        return da
+
+    da = read_geotiffs(filelist, concat_dim='time', workers=workers, window=window)
     da['time'] = dates
+    da.name = 'extent'
 
     get_latlon(da)
 
+    if cache:
+        os.makedirs(SEAICE_CACHE_DIR, exist_ok=True)
+        tmpfile = '{}.{:d}.tmp'.format(path, os.getpid())
+        da.to_netcdf(tmpfile, encoding={da.name: {'zlib': True, 'complevel': 9,
+                                                  'chunksizes': (1,) + da.shape[1:]}})
+        os.replace(tmpfile, path)
+
+    return da
+
+
+def get_sea_ice_extent(date_from=None, date_to=None,
+                       add_land_mask=True, dates=None,
+                       window=None, region=None, workers=4, cache=False):
+    """
+    Wrapper to get sorted DataArray of sea ice extent.  Files are selected by date
+    before they are read.
+
+    date_from - date to start series YYYY-MM-DD
+    date_to   - date to end series   YYYY-MM-DD
+    dates     - single date or array of dates [YYYY-MM-DD, YYYY-MM-DD]
+    add_land_mask - sets land and coast values to nan
+    window - optional dictionary of index slices, e.g. {'y': slice(100, 300), 'x': slice(50, 250)}
+    region - name of region in arctic_mask_region or arctic_mask_region_group.  Only the
+             window containing the region is read.  Ignored if window is given
+    workers - number of threads used to read files
+    cache - if True, the stacked extent grids are cached in SEAICE_CACHE_DIR, by default
+            ~/.cache/seaice.  One file is kept for each selection of dates and window,
+            and files are not removed.  Off by default
+    """
+
+    files = select_files(get_extent_file_list(), date_from=date_from, date_to=date_to, dates=dates)
+    if files.empty:
+        raise FileNotFoundError('get_sea_ice_extent: no extent files found for dates')
+
+    if region and not window:
+        window = region_window(region)
+
+    da = read_sea_ice_extent(list(files.values), files.index, window=window,
+                             workers=workers, cache=cache)
+
     if add_land_mask:
         da = da.where(da < 253)
 
-    # make time selection
-    if date_from and (not date_to): da = da.sel(time=slice(date_from,None))
-    if (not date_from) and date_to: da = da.sel(time=slice(None,date_to))
-    if date_from and date_to: da = da.sel(time=slice(date_from,date_to))
-    
     return da
 
 def get_psn_coords(coords='both', resolution='25'):
@@ -107,4 +189,28 @@ def get_psn_area(resolution='25'):
                         dims=['x','y'])
 
     return data
-    
+
+
+# Walt Meier's Arctic region mask on the 25 km polar stereographic grid
+REGION_MASK_PATH = ('/disks/sidads_ftp/DATASETS/NOAA/G02135/seaice_analysis/'
+                    'Arctic_region_mask_Meier_AnnGlaciol2007.msk')
+PSN25_SHAPE = (448, 304)  # nrow, ncol
+PSN25_GEOTRANSFORM = [-3850000.000, 25000., 0., 5850000.000, 0., -25000.] # GDAL style geotransform
+
+
+def get_psn_xy():
+    """Returns x and y of cell centers of the 25 km North Polar Stereo grid"""
+    nrow, ncol = PSN25_SHAPE
+    x0, dx, _, y0, _, dy = PSN25_GEOTRANSFORM
+    return x0 + (np.arange(ncol) + 0.5) * dx, y0 + (np.arange(nrow) + 0.5) * dy
+
+
+def get_region_mask():
+    """
+    Gets PSN Arctic region mask as a DataArray with dims (y, x).  Region codes are
+    in constants.arctic_mask_region
+    """
+    mask = np.fromfile(REGION_MASK_PATH, dtype='byte').reshape(PSN25_SHAPE)
+    x, y = get_psn_xy()
+    return xr.DataArray(mask, coords={'x': x, 'y': y}, dims=['y', 'x'])
+
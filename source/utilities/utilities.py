@@ -1,4 +1,5 @@
 import numpy as np
+import xarray as xr
 
 def daySum(x, input_freq_hours=6):
     """
@@ -8,10 +9,10 @@ def daySum(x, input_freq_hours=6):
     Arguments
     ---------
     x - input data
-    input_freq_hour - frequency of input - assumes 6h
+    input_freq_hours - frequency of input in hours
     """
 
-    nexpect = int(24/6)
+    nexpect = int(24/input_freq_hours)
 
     sx = x.sum(dim='time', keep_attrs=True)
     if x.time.size != nexpect: sx[:] = np.nan
@@ -23,16 +24,23 @@ def sum6htoDay(da):
     assumes that 6h accumulations are for the 6h period preceding the
     datetime stamp; e.g. the precipitation total for 2018-01-01 06:00:00 is 
     is the accumulated precipitation for the 00:00:01 to 06:00:00 period.
-    
+
+    Days are labelled with the start of the bin, e.g. 2018-01-01 06:00:00
+    contains the accumulations stamped 06:00, 12:00, 18:00 and 00:00 the next day.
+    Days without all four 6h timesteps are set to NaN.
+
     Arguments
     ---------
-    da - xarray DataArray or DataSet object
+    da - xarray DataArray
 
     Returns
     -------
     a reduced object containing daily sums
     """
-    return da.resample(time='24H', base=6, keep_attrs=True).apply(daySum)
+    from precipitation.utilities import accumulate_to_daily
+    result = accumulate_to_daily(da, input_freq_hours=6, offset=0, time_stamp='end', rate=False)
+    result['time'] = result['time'] + np.timedelta64(6, 'h')
+    return result
     
 def area_wgt_average(ds, latwgt, lonwgt):
     """
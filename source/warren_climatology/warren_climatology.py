@@ -2,9 +2,96 @@ import numpy as np
 import xarray as xr
 import datetime as dt
 
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
+# Coefficients h0, a, b, c, d and e of the Warren et al. (1999) quadratic fit for each
+# month.  Rows are months January to December.
+SNOW_DEPTH_COEFFS = np.array([
+    [28.01,  0.1270, -1.1833, -0.1164, -0.0051,  0.0243],
+    [30.28,  0.1056, -0.5908, -0.0263, -0.0049,  0.0044],
+    [33.89,  0.5486, -0.1996,  0.0280,  0.0216, -0.0176],
+    [36.80,  0.4046, -0.4005,  0.0256,  0.0024, -0.0641],
+    [36.93,  0.0214, -1.1795, -0.1076, -0.0244, -0.0142],
+    [36.59,  0.7021, -1.4819, -0.1195, -0.0009, -0.0603],
+    [11.02,  0.3008, -1.2591, -0.0811, -0.0043, -0.0959],
+    [ 4.64,  0.3100, -0.6350, -0.0655,  0.0059, -0.0005],
+    [15.81,  0.2119, -1.0292, -0.0868, -0.0177, -0.0723],
+    [22.66,  0.3594, -1.3483, -0.1063,  0.0051, -0.0577],
+    [25.57,  0.1496, -1.4643, -0.1409, -0.0079, -0.0258],
+    [26.67, -0.1876, -1.4229, -0.1413, -0.0316, -0.0029],
+])
+
+SWE_COEFFS = np.array([
+    [ 8.37, -0.0270, -0.3400, -0.0319, -0.0056, -0.0005],
+    [ 9.43,  0.0058, -0.1309,  0.0017, -0.0021, -0.0072],
+    [10.74,  0.1618,  0.0276,  0.0213,  0.0076, -0.0125],
+    [11.67,  0.0841, -0.1328,  0.0081, -0.0003, -0.0301],
+    [11.80, -0.0043, -0.4284, -0.0380, -0.0071, -0.0063],
+    [12.48,  0.2084, -0.5739, -0.0468, -0.0023, -0.0253],
+    [ 4.01,  0.0970, -0.4930, -0.0333, -0.0026, -0.0343],
+    [ 1.08,  0.0712, -0.1450, -0.0155,  0.0014, -0.0000],
+    [ 3.84,  0.0393, -0.2107, -0.0182, -0.0053, -0.0190],
+    [ 6.24,  0.1158, -0.2803, -0.0215,  0.0015, -0.0176],
+    [ 7.54,  0.0567, -0.3201, -0.0284, -0.0032, -0.0129],
+    [ 8.00, -0.0540, -0.3650, -0.0362, -0.0112, -0.0035],
+])
+
+COEFFS = {'snow_depth': SNOW_DEPTH_COEFFS,
+          'swe': SWE_COEFFS}
+
+
+def projection_terms(lon, lat):
+    """
+    Returns the terms 1, x, y, xy, x^2 and y^2 of the Warren polynomial, where
+    x and y are distances from the pole in degrees latitude along the 0 E and
+    90 E meridians.  Terms are stacked along the last axis.
+
+    lon - array of longitudes
+    lat - array of latitudes
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    x = (90. - lat) * np.cos( np.radians(lon) )
+    y = (90. - lat) * np.sin( np.radians(lon) )
+    return np.stack([np.ones_like(x), x, y, x*y, x*x, y*y], axis=-1)
+
+
+def evaluate(lon, lat, month, variable='snow_depth'):
+    """
+    Evaluates the Warren climatology for months and points in one array operation.
+    month, lon and lat are broadcast against each other, so month with shape
+    (time, 1, 1) and lon and lat with shape (y, x) give a (time, y, x) cube, and
+    month, lon and lat with shape (time, points) give a value for each point, e.g.
+    along trajectories.
+
+    Projection terms are calculated once.  If the same points are used for
+    several months, each calendar month is evaluated once and the result for
+    each time is picked from these 12 fields.
+
+    lon - array of longitudes
+    lat - array of latitudes
+    month - month numbers (1 to 12)
+    variable - snow_depth or swe
+
+    Returns
+    -------
+    Numpy array of snow depth or snow water equivalent in cm
+    """
+    coeffs = COEFFS[variable]
+    terms = projection_terms(lon, lat)
+    im = np.asarray(month) - 1
+
+    if np.broadcast(im, terms[..., 0]).size > terms[..., 0].size:
+        fields = np.moveaxis(terms @ coeffs.T, -1, 0)
+        return np.choose(im, fields)
+    return np.einsum('...k,...k->...', coeffs[im], terms)
+
+
+def _like(h, lon, lat):
+    """Returns h as a DataArray if lon or lat is a DataArray"""
+    for da in (lon, lat):
+        if isinstance(da, xr.DataArray):
+            return xr.DataArray(h, coords=da.coords, dims=da.dims)
+    return h
+
 
 def snow_depth(lon, lat, month):
     """
@@ -23,35 +110,8 @@ def snow_depth(lon, lat, month):
     Returns
     -------
     Numpy array of snow depths in cm with same shape as lon
-
-    To Do
-    -----
-    Do I need to have parameters as numpy arrays.
-    Need to make sure lon and lat are numpy arrays
     """
-
-    im = month - 1
-
-    h0 = np.array( [28.01,   30.28,   33.89,   36.80,   36.93,   36.59,
-                    11.02,    4.64,   15.81,   22.66,   25.57,   26.67] )
-    a  = np.array( [ 0.1270,  0.1056,  0.5486,  0.4046,  0.0214,  0.7021,
-                     0.3008,  0.3100,  0.2119,  0.3594,  0.1496, -0.1876] )
-    b  = np.array( [-1.1833, -0.5908, -0.1996, -0.4005, -1.1795, -1.4819,
-                    -1.2591, -0.6350, -1.0292, -1.3483, -1.4643, -1.4229] )
-    c  = np.array( [-0.1164, -0.0263,  0.0280,  0.0256, -0.1076, -0.1195,
-                    -0.0811, -0.0655, -0.0868, -0.1063, -0.1409, -0.1413] )
-    d  = np.array( [-0.0051, -0.0049,  0.0216,  0.0024, -0.0244, -0.0009,
-                    -0.0043,  0.0059, -0.0177,  0.0051, -0.0079, -0.0316] )
-    e  = np.array( [ 0.0243,  0.0044, -0.0176, -0.0641, -0.0142, -0.0603,
-                     -0.0959, -0.0005, -0.0723, -0.0577, -0.0258, -0.0029] )
-
-    x = (90. - lat) * np.cos( np.radians(lon) )
-    y = (90. - lat) * np.sin( np.radians(lon) )
-
-    h = ( h0[im] + ( a[im] * x ) + ( b[im] * y ) + ( c[im] * x * y ) +
-          ( d[im] * x * x ) + ( e[im] * y * y ) )
-
-    return h
+    return _like(evaluate(lon, lat, month, 'snow_depth'), lon, lat)
 
 def swe(lon, lat, month):
     """
@@ -71,31 +131,7 @@ def swe(lon, lat, month):
     -------
     Numpy array of snow water equivalent in cm with same shape as lon
     """
-
-    im = month - 1
-
-    h0 = np.array( [  8.37,    9.43,   10.74,   11.67,   11.80,   12.48,
-                      4.01,    1.08,    3.84,    6.24,    7.54,    8.00 ] )
-    a  = np.array( [ -0.0270,  0.0058,  0.1618,  0.0841, -0.0043,  0.2084,
-                     0.0970,  0.0712,  0.0393,  0.1158,  0.0567, -0.0540 ] )
-    b  = np.array( [ -0.3400, -0.1309,  0.0276, -0.1328, -0.4284, -0.5739,
-                     -0.4930, -0.1450, -0.2107, -0.2803, -0.3201, -0.3650 ] )
-    c  = np.array( [ -0.0319,  0.0017,  0.0213,  0.0081, -0.0380, -0.0468,
-                     -0.0333, -0.0155, -0.0182, -0.0215, -0.0284, -0.0362 ] )
-    d  = np.array( [ -0.0056, -0.0021,  0.0076, -0.0003, -0.0071, -0.0023,
-                     -0.0026,  0.0014, -0.0053,  0.0015, -0.0032, -0.0112 ] )
-    e  = np.array( [ -0.0005, -0.0072, -0.0125, -0.0301, -0.0063, -0.0253,
-                     -0.0343, -0.0000, -0.0190, -0.0176, -0.0129, -0.0035 ] )
-
-    x = (90. - lat) * np.cos( np.radians(lon) )
-    y = (90. - lat) * np.sin( np.radians(lon) )
-
-    h = ( h0[im] + ( a[im] * x ) + ( b[im] * y ) + ( c[im] * x * y ) +
-          ( d[im] * x * x ) + ( e[im] * y * y ) )
-
-#    h = np.where( h < 0., 0., h)
-    
-    return h
+    return _like(evaluate(lon, lat, month, 'swe'), lon, lat)
     
 def sample_grid(variable='snow_depth', month=None):
     """
@@ -106,9 +142,6 @@ def sample_grid(variable='snow_depth', month=None):
     month - list of months
     """
 
-    my_func = {'snow_depth': snow_depth,
-               'swe': swe}
-
     lat, lon = np.linspace(65.,90.,20), np.linspace(0.,359.,360)
     
     if not month:
@@ -119,11 +152,11 @@ def sample_grid(variable='snow_depth', month=None):
     x, y = np.meshgrid(lon, lat)
 
     if month.size == 1:
-        da = xr.DataArray(my_func[variable](x,y,month),
+        da = xr.DataArray(evaluate(x, y, month.item(), variable),
                           coords={'lat': lat, 'lon': lon},
                           dims=['lat', 'lon'])
     else:
-        da = xr.DataArray([my_func[variable](x, y, m) for m in month],
+        da = xr.DataArray(evaluate(x, y, month[:,np.newaxis,np.newaxis], variable),
                            coords={'month': month, 'lat': lat, 'lon': lon},
                            dims=['month', 'lat', 'lon'])
     return da
@@ -137,11 +170,15 @@ def count_dims(da):
 def warren_time_series(lat, lon, dates, variable='snow_depth'):
     """
     Generates an xarray DataArray of snow_depth or swe for a grid and
-    series of dates.
+    series of dates.  Months, latitudes and longitudes are broadcast by
+    dimension name, so a grid gives a (time, y, x) cube and points with a
+    time dimension, e.g. daily trajectory positions, give a value for each
+    position.  All dates are evaluated in a single array operation.
 
     Arguments
     ---------
-    lat - latitudes 1D or 2D.  If 1D np.meshgrid is used to create 2D grid 
+    lat - latitudes 1D or 2D.  If 1D np.meshgrid is used to create 2D grid, unless
+          lat is a DataArray with the same dimension as dates
     lon - longitudes 1D or 2D.  If 1D np.meshgrid is used to create 2D grid 
     dates - array of dates - either datetime object or string
 
@@ -153,37 +190,41 @@ def warren_time_series(lat, lon, dates, variable='snow_depth'):
     -------
     xarray DataArray object of snow_depth or swe in cm
     """
+    import pandas as pd
 
-    my_func = {'snow_depth': snow_depth,
-               'swe': swe}
-
-    #if not all([isinstance(d, dt.datetime) for d in dates]):
-    #    print ('Expects datetime objects')
-
-    # If lat, lon are vectors, generate 2d grids
-    # Need to add code to make sure x and y are DataArrays
-    if (count_dims(lat) == 1):
-        x, y = np.meshgrid(lon, lat)
+    if isinstance(dates, xr.DataArray):
+        time = dates
+        if time.ndim == 0: time = time.expand_dims('time')
     else:
-        x, y = lon, lat
-        
-    if dates.size == 1:
-        cube = my_func[variable](x,y,dates.dt.month)
-        da = xr.DataArray(cube,
-                          coords={'lat': x, 'lon': y},
-                          dims=['lat', 'lon'])
-    else:
-        cube = [my_func[variable](x, y, m) for m in dates.dt.month.values]
-        da = xr.concat(cube, dim='time')
-        da['time'] = dates
+        time = pd.DatetimeIndex(np.atleast_1d(dates))
+        time = xr.DataArray(time, coords=[time], dims=['time'])
+    month = time.dt.month
+
+    # If lat, lon are vectors without a time dimension, generate 2d grids
+    if (np.ndim(lat) == 1) and not (isinstance(lat, xr.DataArray) and lat.dims[0] in month.dims):
+        coords = {'lat': np.asarray(lat), 'lon': np.asarray(lon)}
+        y, x = np.meshgrid(coords['lat'], coords['lon'], indexing='ij')
+        lat = xr.DataArray(y, coords=coords, dims=['lat', 'lon'])
+        lon = xr.DataArray(x, coords=coords, dims=['lat', 'lon'])
+    elif not isinstance(lat, xr.DataArray):
+        lat = xr.DataArray(lat, dims=['y', 'x'])
+        lon = xr.DataArray(lon, dims=['y', 'x'])
+
+    da = xr.apply_ufunc(lambda m, x, y: evaluate(x, y, m, variable), month, lon, lat)
+    da.name = variable
+
+    if month.size == 1:
+        da = da.squeeze(month.dims, drop=True)
 
     return da
     
 def get_snow_depth(lat, lon, time, no_negative_depths=True):
+    """
+    Returns Warren snow depth for each time for a grid or for points.  See
+    warren_time_series
+    """
 
-    cube = [snow_depth(lon, lat, m) for m in time.dt.month.values]
-    wsd = xr.concat(cube, dim='time')
-    wsd['time'] = time
+    wsd = warren_time_series(lat, lon, time, variable='snow_depth')
 
     if no_negative_depths:
         wsd = wsd.where(wsd > 0., 0.)
@@ -196,6 +237,8 @@ def plot_snow_depth(da, title='', add_colorbar=True, pngfile=None):
 
     da - xarray DataArray
     """
+    import matplotlib.pyplot as plt
+    import cartopy.crs as ccrs
 
     ax = plt.subplot(projection=ccrs.NorthPolarStereo())
     ax.set_extent([0,360,75.,90.], ccrs.PlateCarree())
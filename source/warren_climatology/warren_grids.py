@@ -0,0 +1,169 @@
+#----------------------------------------------------------------------
+# Precomputed Warren climatology grids.
+#
+# The 12 monthly snow depth and SWE fields, and their means for each
+# region in arctic_mask_region, are calculated once for a grid and
+# written to a single netCDF file in WARREN_GRID_DIR.  Later calls read
+# the file once per process, so Warren fields for a time series and
+# regional Warren statistics are lookups.
+#
+# Grids are
+#    Nh50km - EASE grid used for reanalysis precipitation, dims (x, y)
+#    psn25  - 25 km NSIDC polar stereographic grid used for sea ice
+#             extent, dims (y, x)
+#
+# Usage: python -m warren_climatology.warren_grids Nh50km psn25
+#----------------------------------------------------------------------
+import os
+import functools
+
+import numpy as np
+import xarray as xr
+
+from warren_climatology.warren_climatology import evaluate
+
+WARREN_GRID_DIR = os.environ.get('WARREN_GRID_DIR',
+                                 os.path.join(os.path.expanduser('~'), '.cache', 'warren_grid'))
+
+VARIABLES = ['snow_depth', 'swe']
+
+
+def grid_latlon(grid):
+    """
+    Returns latitude and longitude of cell centers, and region mask as DataArrays
+    with the dimensions used for data on that grid
+
+    grid - Nh50km or psn25
+    """
+    if grid == 'Nh50km':
+        from utilities.ease_grid import cell_centers
+        from precipitation.utilities import read_region_mask
+        lat, lon = cell_centers(grid)  # indexed by [col, row], x is row
+        lat = xr.DataArray(np.asarray(lat).T, dims=['x', 'y'])
+        lon = xr.DataArray(np.asarray(lon).T, dims=['x', 'y'])
+        mask = read_region_mask(grid)
+    elif grid == 'psn25':
+        from utilities.seaice import get_psn_coords, get_region_mask
+        mask = get_region_mask()
+        lon, lat = get_psn_coords()
+        lat = xr.DataArray(lat.values, coords=mask.coords, dims=mask.dims)
+        lon = xr.DataArray(lon.values, coords=mask.coords, dims=mask.dims)
+    else:
+        raise ValueError(f'Unknown grid {grid}: expected Nh50km or psn25')
+    return lat, lon, mask
+
+
+def _grid_path(grid):
+    return os.path.join(WARREN_GRID_DIR, f'warren_climatology.{grid}.nc')
+
+
+def make_warren_grid(grid='Nh50km', no_negative_depths=True):
+    """
+    Calculates the 12 monthly snow depth and SWE fields for a grid, and their means
+    for each region in arctic_mask_region, and writes them to WARREN_GRID_DIR
+
+    grid - Nh50km or psn25
+    no_negative_depths - set negative snow depths and SWE to zero, as get_snow_depth
+
+    Returns path to file
+    """
+    from precipitation.constants import arctic_mask_region
+    from precipitation.utilities import regions_mean
+
+    lat, lon, mask = grid_latlon(grid)
+    month = np.arange(1, 13)
+
+    ds = xr.Dataset(coords={'month': month})
+    for variable in VARIABLES:
+        field = evaluate(lon.values, lat.values, month[:, np.newaxis, np.newaxis], variable)
+        if no_negative_depths:
+            field = np.where(field < 0., 0., field)
+        ds[variable] = xr.DataArray(field.astype('float32'), coords=lat.coords,
+                                    dims=['month'] + list(lat.dims))
+        ds[f'{variable}_region_mean'] = regions_mean(ds[variable], mask, regions=arctic_mask_region)
+    ds.coords['lat'] = lat.astype('float32')
+    ds.coords['lon'] = lon.astype('float32')
+    ds.attrs['grid'] = grid
+    ds.attrs['source'] = ('Warren, S.G., I.G. Rigor, and N. Untersteiner. 1999. Snow Depth on Arctic Sea Ice. '
+                          'J. Climate, 12, 1814 1829')
+
+    path = _grid_path(grid)
+    os.makedirs(WARREN_GRID_DIR, exist_ok=True)
+    tmpfile = '{}.{:d}.tmp'.format(path, os.getpid())
+    ds.to_netcdf(tmpfile, encoding={v: {'zlib': True, 'complevel': 9} for v in VARIABLES})
+    os.replace(tmpfile, path)
+    return path
+
+
+@functools.lru_cache(maxsize=None)
+def _read_warren_grid(grid):
+    path = _grid_path(grid)
+    if not os.path.exists(path):
+        make_warren_grid(grid)
+    with xr.open_dataset(path) as ds:
+        ds.load()
+    # The dataset is shared by every caller, so its arrays are read-only
+    for name, variable in ds.variables.items():
+        if name not in ds.indexes:
+            variable.values.setflags(write=False)
+    return ds
+
+
+def read_warren_grid(grid='Nh50km'):
+    """
+    Returns Dataset of monthly Warren snow depth and SWE fields for a grid, with
+    regional means.  The file is created the first time it is needed, and only read
+    once per process.  Arrays are shared between calls and are read-only; copy them
+    before modifying them in place.
+    """
+    return _read_warren_grid(grid).copy(deep=False)
+
+
+def warren_fields(time, grid='Nh50km', variable='snow_depth', like=None, tolerance=1.):
+    """
+    Returns Warren fields for each time by looking up the month in the precomputed grid
+
+    time - DataArray of times, e.g. sie.time
+    grid - Nh50km or psn25
+    variable - snow_depth or swe
+    like - optional DataArray, e.g. sea ice extent read with a window.  Fields are
+           selected at the x and y coordinates of like, take its x, y, lat and lon
+           coordinates, and are put in the order of its dimensions
+    tolerance - largest difference between x and y coordinates of like and the grid
+                when selecting fields, in grid units (m for psn25)
+    """
+    da = read_warren_grid(grid)[variable].sel(month=time.dt.month).drop_vars('month')
+    if like is not None:
+        indexers = {dim: like[dim].values for dim in ('x', 'y') if (dim in like.coords) and (dim in da.coords)}
+        da = da.sel(indexers, method='nearest', tolerance=tolerance)
+        da = da.assign_coords({name: coord for name, coord in like.coords.items()
+                               if coord.dims and set(coord.dims) <= set(indexers)})
+        da = da.transpose(*[dim for dim in like.dims if dim in da.dims])
+    return da
+
+
+def warren_region_means(grid='Nh50km', variable='snow_depth', time=None):
+    """
+    Returns precomputed regional mean Warren snow depth or SWE with dims (month, region),
+    or (time, region) if time is given
+
+    grid - Nh50km or psn25
+    variable - snow_depth or swe
+    time - optional DataArray of times
+    """
+    da = read_warren_grid(grid)[f'{variable}_region_mean']
+    if time is not None:
+        da = da.sel(month=time.dt.month).drop_vars('month')
+    return da
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Precomputes monthly Warren climatology grids and regional means')
+    parser.add_argument('grid', type=str, nargs='*', default=['Nh50km', 'psn25'],
+                        help='Grids to generate: Nh50km, psn25 (default both)')
+    args = parser.parse_args()
+
+    for grid in args.grid:
+        print (f'Writing Warren climatology for {grid} to {make_warren_grid(grid)}')
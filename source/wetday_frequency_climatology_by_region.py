@@ -12,7 +12,7 @@ import matplotlib.pyplot as plt
 import cartopy.crs as ccrs
 
 from precipitation.constants import reanalysis_dirpath, month_precip_stats, arctic_mask_region
-from precipitation.utilities import date_from_filename, glob_precip_stats, read_region_mask, region_stats
+from precipitation.utilities import date_from_filename, glob_precip_stats, read_region_mask, region_stats_table
 
 
 def _get_filelist(reanalysis):
@@ -46,8 +46,7 @@ def process_one_reanalysis(reanalysis):
     
     print('  Extracting regional stats...')
     mask = read_region_mask()
-    stats = pd.concat([region_stats(daMon, mask, region).to_series() for region in arctic_mask_region.keys()],
-                       keys=arctic_mask_region.keys(), axis=1)
+    stats = region_stats_table(daMon, mask, regions=arctic_mask_region)
     return stats
 
 def wetday_frequency_climatology_by_region(reanalysis):